@@ -3,18 +3,19 @@ Dashboard 3D Interactivo ULTRA - SCE Gemelo Digital
 Control Total: Nivel, Temperatura, Presión, Caudales, y más
 """
 import streamlit as st
-import pandas as pd
 import numpy as np
-import sqlite3
+import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import time
 import os
 import sys
+import json
 
 # Agregar path para importar módulos del proyecto
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from simuladores.simulador_tanque import TanqueSimulado, SensorUltrasonico, SensorAmbiental
+from simuladores.servicio_simulacion import ServicioSimulacion
+from dashboard.datos_historicos import CargadorIncremental
+from sce.perfilador import ARCHIVO_PERFIL
 
 # ==================== CONFIGURACIÓN ====================
 st.set_page_config(
@@ -64,258 +65,260 @@ st.markdown("""
 
 # ==================== FUNCIONES ====================
 
-@st.cache_data(ttl=2)
-def cargar_datos_historicos():
-    """Cargar datos históricos desde SQLite"""
+@st.cache_resource
+def obtener_cargador_historico():
+    """Cargador incremental compartido por todas las sesiones del proceso"""
     base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
     db_path = os.path.join(base_dir, "datos", "datos_sce.db")
+    return CargadorIncremental(db_path, capacidad=1000)
 
-    if not os.path.exists(db_path):
-        return pd.DataFrame()
-
-    conn = sqlite3.connect(db_path)
-    query = "SELECT * FROM mediciones ORDER BY id DESC LIMIT 1000"
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-
-    if not df.empty:
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df = df.sort_values('timestamp')
+@st.cache_resource
+def obtener_servicio_simulacion():
+    """
+    Simulación física compartida por todas las sesiones del proceso:
+    avanza en su propio hilo y las sesiones solo leen sus instantáneas
+    """
+    servicio = ServicioSimulacion(altura_max=200, diametro=100, dt=0.5, capacidad=100)
+    servicio.configurar(caudal_entrada=10.0, caudal_salida=5.0, valvula_entrada=True, bomba_salida=False)
+    return servicio
+
+# Controles de la simulación compartida: clave del widget -> (parámetro de configurar, tipo)
+CONTROLES_SIMULACION = {
+    'altura_sim': ('altura_max', int),
+    'diam_sim': ('diametro', int),
+    'caudal_in_sim': ('caudal_entrada', float),
+    'caudal_out_sim': ('caudal_salida', float),
+    'valv_sim': ('valvula_entrada', bool),
+    'bomba_sim': ('bomba_salida', bool),
+}
+
+def sincronizar_controles_simulacion(servicio):
+    """Los widgets muestran la configuración vigente (la pudo cambiar otra sesión)"""
+    configuracion = servicio.configuracion()
+    for clave, (parametro, tipo) in CONTROLES_SIMULACION.items():
+        st.session_state[clave] = tipo(configuracion[parametro])
+
+def aplicar_control_simulacion(clave):
+    """on_change: solo una edición deliberada modifica la simulación compartida"""
+    parametro, tipo = CONTROLES_SIMULACION[clave]
+    obtener_servicio_simulacion().configurar(**{parametro: tipo(st.session_state[clave])})
+
+def vigilar_simulacion(activa_en_pagina):
+    """
+    Fragmento sin contenido con temporizador permanente en Simulación Física:
+    si otra sesión inicia o pausa la simulación compartida, relanza la página
+    para que el panel en vivo tome (o suelte) su propio temporizador
+    """
+    if obtener_servicio_simulacion().activa == activa_en_pagina:
+        return
+    st.rerun()
 
-    return df
+def cargar_datos_historicos():
+    """Últimas 1000 mediciones; solo se leen de SQLite las filas nuevas"""
+    cargador = obtener_cargador_historico()
+    cargador.actualizar()
+    return cargador.obtener()
+
+# Rangos de tiempo para el histórico largo (ms); None = toda la base
+RANGOS_HISTORICO = {
+    "Última hora": 3600 * 1000,
+    "Últimas 24 h": 24 * 3600 * 1000,
+    "Últimos 7 días": 7 * 24 * 3600 * 1000,
+    "Últimos 30 días": 30 * 24 * 3600 * 1000,
+    "Todo": None,
+}
+
+def _limites_rango(cargador, rango):
+    """(t_ini, t_fin) en ms del rango elegido, o None si la base está vacía"""
+    limites = cargador.rango_tiempo()
+    if limites is None:
+        return None
+    t_min, t_max = limites
+    duracion = RANGOS_HISTORICO[rango]
+    return (t_min if duracion is None else max(t_min, t_max - duracion)), t_max
+
+def cargar_serie_reducida(columna, rango, puntos=2000):
+    """Serie reducida a ~'puntos' puntos (tablas de resumen o bucketing en SQL + LTTB)"""
+    cargador = obtener_cargador_historico()
+    limites = _limites_rango(cargador, rango)
+    if limites is None:
+        return None
+    return cargador.serie_reducida(columna, *limites, puntos=puntos)
+
+def cargar_estadisticas_rango(rango):
+    """Estadísticas del rango elegido a partir de las tablas de resumen"""
+    cargador = obtener_cargador_historico()
+    limites = _limites_rango(cargador, rango)
+    if limites is None:
+        return None
+    return cargador.estadisticas_rango(*limites)
 
 @st.cache_data(ttl=60)
-def _calcular_geometria_tanque(altura_max, diametro):
+def _geometria_estatica_tanque(altura_max, diametro, umbral_bajo, umbral_alto):
     """
-    Calcula arrays numpy estáticos para la geometría del tanque.
-    Se cachean para evitar recalcular en cada renderizado.
+    Parte del tanque que no cambia entre frames (paredes, umbrales, layout),
+    como diccionarios listos para plotly. Se cachea por dimensiones/umbrales.
+    Un cilindro vertical solo necesita 2 filas en z (base y tapa), así las
+    superficies tienen 2x50 puntos en lugar de 50x50.
     """
     radio = diametro / 2
     theta = np.linspace(0, 2*np.pi, 50)
-    z_cilindro = np.linspace(0, altura_max, 50)
-    theta_grid, z_grid = np.meshgrid(theta, z_cilindro)
-    x_cilindro = radio * np.cos(theta_grid)
-    y_cilindro = radio * np.sin(theta_grid)
-
-    return {
-        'radio': radio,
-        'theta': theta,
-        'z_grid': z_grid,
-        'x_cilindro': x_cilindro,
-        'y_cilindro': y_cilindro
-    }
-
-def crear_tanque_3d(nivel_actual, altura_max=200, diametro=100, umbral_bajo=30, umbral_alto=170,
-                    caudal_entrada=0, caudal_salida=0, valvula_entrada=False, bomba_salida=False):
-    """
-    Crea visualización 3D del tanque con agua, tuberías y flujo
-    """
-    # Obtener geometría cacheada
-    geom = _calcular_geometria_tanque(altura_max, diametro)
-    radio = geom['radio']
-    theta = geom['theta']
-    z_grid = geom['z_grid']
-    x_cilindro = geom['x_cilindro']
-    y_cilindro = geom['y_cilindro']
-
-    # Crear agua (cilindro de agua hasta el nivel actual)
-    z_agua = np.linspace(0, max(nivel_actual, 1), 30)
-    theta_agua, z_agua_grid = np.meshgrid(theta, z_agua)
-    x_agua = radio * 0.95 * np.cos(theta_agua)
-    y_agua = radio * 0.95 * np.sin(theta_agua)
-
-    # Superficie del agua
-    x_superficie = radio * 0.95 * np.cos(theta)
-    y_superficie = radio * 0.95 * np.sin(theta)
-    z_superficie = np.full_like(x_superficie, nivel_actual)
-
-    # Crear figura
-    fig = go.Figure()
+    # Coordenadas redondeadas a 0.01 cm: el JSON de cada frame pesa ~3x menos
+    cos_t, sin_t = np.round(np.cos(theta), 4), np.round(np.sin(theta), 4)
 
-    # Paredes del tanque (transparente)
-    fig.add_trace(go.Surface(
-        x=x_cilindro, y=y_cilindro, z=z_grid,
+    pared = dict(
+        type='surface',
+        x=np.round([radio * cos_t] * 2, 2), y=np.round([radio * sin_t] * 2, 2),
+        z=[np.zeros(50), np.full(50, altura_max)],
         colorscale=[[0, 'rgba(100, 100, 100, 0.2)'], [1, 'rgba(100, 100, 100, 0.2)']],
         showscale=False,
         name='Tanque',
         hoverinfo='skip'
-    ))
+    )
+
+    def anillo_umbral(z, color, nombre):
+        return dict(
+            type='scatter3d',
+            x=np.round(radio * 1.1 * cos_t, 2), y=np.round(radio * 1.1 * sin_t, 2), z=np.full(50, z),
+            mode='lines',
+            line=dict(color=color, width=4, dash='dash'),
+            name=nombre
+        )
 
-    # Agua (cilindro azul)
-    fig.add_trace(go.Surface(
-        x=x_agua, y=y_agua, z=z_agua_grid,
+    layout = dict(
+        scene=dict(
+            xaxis=dict(title='X (cm)', range=[-radio*1.5, radio*1.5]),
+            yaxis=dict(title='Y (cm)', range=[-radio*1.5, radio*1.5]),
+            zaxis=dict(title='Altura (cm)', range=[-altura_max*0.2, altura_max*1.2]),
+            camera=dict(
+                eye=dict(x=1.5, y=1.5, z=1.2),
+                center=dict(x=0, y=0, z=0.3)
+            ),
+            aspectmode='manual',
+            aspectratio=dict(x=1, y=1, z=2)
+        ),
+        height=700,
+        showlegend=True,
+        legend=dict(x=0.7, y=0.95),
+        margin=dict(l=0, r=0, t=40, b=0),
+        # Optimizaciones para rendimiento y anti-flickering
+        uirevision='constant',  # Mantener estado de la UI entre actualizaciones
+        transition=dict(duration=0),  # Sin animaciones de transición
+        hovermode=False,  # Deshabilitar hover para mejor rendimiento
+        dragmode='orbit'  # Modo de arrastre optimizado para 3D
+    )
+
+    return {
+        'radio': radio,
+        'x_agua': np.round(radio * 0.95 * cos_t, 2),
+        'y_agua': np.round(radio * 0.95 * sin_t, 2),
+        'pared': pared,
+        'umbral_alto': anillo_umbral(umbral_alto, 'red', f'Umbral Alto: {umbral_alto} cm'),
+        'umbral_bajo': anillo_umbral(umbral_bajo, 'orange', f'Umbral Bajo: {umbral_bajo} cm'),
+        'layout': layout,
+    }
+
+def _trazas_agua(geom, nivel_actual):
+    """Cilindro y superficie del agua: solo dependen del nivel"""
+    x_agua, y_agua = geom['x_agua'], geom['y_agua']
+    agua = dict(
+        type='surface',
+        x=[x_agua, x_agua], y=[y_agua, y_agua],
+        z=[np.zeros(50), np.full(50, max(nivel_actual, 1))],
         colorscale=[[0, 'rgba(30, 144, 255, 0.7)'], [1, 'rgba(0, 100, 255, 0.7)']],
         showscale=False,
         name='Agua',
         hoverinfo='skip'
-    ))
-
-    # Superficie del agua
-    fig.add_trace(go.Scatter3d(
-        x=x_superficie, y=y_superficie, z=z_superficie,
+    )
+    superficie = dict(
+        type='scatter3d',
+        x=x_agua, y=y_agua, z=np.full(50, nivel_actual),
         mode='lines',
         line=dict(color='blue', width=3),
         name=f'Nivel: {nivel_actual:.1f} cm',
         showlegend=True
-    ))
+    )
+    return agua, superficie
 
-    # ==========TUBERÍA DE ENTRADA (ARRIBA) ==========
-    # Posición: en la parte superior del tanque
-    tuberia_entrada_x = [radio * 1.2, radio * 1.2]
-    tuberia_entrada_y = [0, 0]
-    tuberia_entrada_z = [altura_max * 0.9, altura_max * 1.15]
-
-    # Color según estado
-    color_entrada = 'green' if valvula_entrada else 'gray'
-    width_entrada = 8 if valvula_entrada else 4
-
-    fig.add_trace(go.Scatter3d(
-        x=tuberia_entrada_x,
-        y=tuberia_entrada_y,
-        z=tuberia_entrada_z,
+def _trazas_tuberia(x, z_vertical, z_conexion, radio, color, ancho, nombre, gotas_z, color_gota):
+    """Tubería vertical, gotas de flujo (traza fija, puede ir vacía) y conexión horizontal"""
+    tuberia = dict(
+        type='scatter3d',
+        x=[x, x], y=[0, 0], z=z_vertical,
         mode='lines+markers',
-        line=dict(color=color_entrada, width=width_entrada),
-        marker=dict(size=6, color=color_entrada),
-        name=f'Entrada: {caudal_entrada:.1f} L/min',
+        line=dict(color=color, width=ancho),
+        marker=dict(size=6, color=color),
+        name=nombre,
         showlegend=True
-    ))
-
-    # Indicador simple de flujo de entrada (optimizado - máximo 2 gotas)
-    if valvula_entrada and caudal_entrada > 0:
-        # Solo 1-2 gotas para mejor rendimiento
-        n_gotas = min(int(caudal_entrada / 30), 2)
-        if n_gotas > 0:
-            for i in range(n_gotas):
-                offset = i * (altura_max * 0.15)
-                gota_z = altura_max * 0.9 - offset
-                if gota_z > nivel_actual:
-                    fig.add_trace(go.Scatter3d(
-                        x=[radio * 1.2],
-                        y=[0],
-                        z=[gota_z],
-                        mode='markers',
-                        marker=dict(size=6, color='cyan', symbol='diamond'),
-                        showlegend=False,
-                        hoverinfo='skip'
-                    ))
-
-    # Conexión horizontal de entrada
-    fig.add_trace(go.Scatter3d(
-        x=[radio * 1.2, radio],
-        y=[0, 0],
-        z=[altura_max * 0.9, altura_max * 0.9],
-        mode='lines',
-        line=dict(color=color_entrada, width=width_entrada),
+    )
+    gotas = dict(
+        type='scatter3d',
+        x=[x] * len(gotas_z), y=[0] * len(gotas_z), z=gotas_z,
+        mode='markers',
+        marker=dict(size=6, color=color_gota, symbol='diamond'),
         showlegend=False,
         hoverinfo='skip'
-    ))
-
-    # ==========TUBERÍA DE SALIDA (ABAJO) ==========
-    # Posición: en la parte inferior del tanque
-    tuberia_salida_x = [radio * 1.2, radio * 1.2]
-    tuberia_salida_y = [0, 0]
-    tuberia_salida_z = [altura_max * 0.1, -altura_max * 0.15]
-
-    # Color según estado
-    color_salida = 'red' if bomba_salida else 'gray'
-    width_salida = 8 if bomba_salida else 4
-
-    fig.add_trace(go.Scatter3d(
-        x=tuberia_salida_x,
-        y=tuberia_salida_y,
-        z=tuberia_salida_z,
-        mode='lines+markers',
-        line=dict(color=color_salida, width=width_salida),
-        marker=dict(size=6, color=color_salida),
-        name=f'Salida: {caudal_salida:.1f} L/min',
-        showlegend=True
-    ))
-
-    # Indicador simple de flujo de salida (optimizado - máximo 2 gotas)
-    if bomba_salida and caudal_salida > 0 and nivel_actual > altura_max * 0.1:
-        # Solo 1-2 gotas para mejor rendimiento
-        n_gotas = min(int(caudal_salida / 30), 2)
-        if n_gotas > 0:
-            for i in range(n_gotas):
-                offset = i * (altura_max * 0.15)
-                gota_z = altura_max * 0.1 - offset
-                if gota_z > -altura_max * 0.15:
-                    fig.add_trace(go.Scatter3d(
-                        x=[radio * 1.2],
-                        y=[0],
-                        z=[gota_z],
-                        mode='markers',
-                        marker=dict(size=6, color='lightcoral', symbol='diamond'),
-                        showlegend=False,
-                        hoverinfo='skip'
-                    ))
-
-    # Conexión horizontal de salida
-    fig.add_trace(go.Scatter3d(
-        x=[radio, radio * 1.2],
-        y=[0, 0],
-        z=[altura_max * 0.1, altura_max * 0.1],
+    )
+    conexion = dict(
+        type='scatter3d',
+        x=[radio, x], y=[0, 0], z=[z_conexion, z_conexion],
         mode='lines',
-        line=dict(color=color_salida, width=width_salida),
+        line=dict(color=color, width=ancho),
         showlegend=False,
         hoverinfo='skip'
-    ))
-
-    # ========== UMBRALES ==========
-    x_umbral_alto = radio * 1.1 * np.cos(theta)
-    y_umbral_alto = radio * 1.1 * np.sin(theta)
-    z_umbral_alto = np.full_like(x_umbral_alto, umbral_alto)
+    )
+    return tuberia, gotas, conexion
 
-    fig.add_trace(go.Scatter3d(
-        x=x_umbral_alto, y=y_umbral_alto, z=z_umbral_alto,
-        mode='lines',
-        line=dict(color='red', width=4, dash='dash'),
-        name=f'Umbral Alto: {umbral_alto} cm'
-    ))
+def crear_tanque_3d(nivel_actual, altura_max=200, diametro=100, umbral_bajo=30, umbral_alto=170,
+                    caudal_entrada=0, caudal_salida=0, valvula_entrada=False, bomba_salida=False):
+    """
+    Crea visualización 3D del tanque con agua, tuberías y flujo
+    La geometría estática sale de la caché; por frame solo se generan el
+    agua (parametrizada por el nivel), las tuberías y el título. El número
+    y orden de las trazas es siempre el mismo para que plotly actualice
+    en sitio en lugar de reconstruir la escena.
+    """
+    geom = _geometria_estatica_tanque(altura_max, diametro, umbral_bajo, umbral_alto)
+    radio = geom['radio']
+    agua, superficie = _trazas_agua(geom, nivel_actual)
 
-    x_umbral_bajo = radio * 1.1 * np.cos(theta)
-    y_umbral_bajo = radio * 1.1 * np.sin(theta)
-    z_umbral_bajo = np.full_like(x_umbral_bajo, umbral_bajo)
+    # ==========TUBERÍA DE ENTRADA (ARRIBA) ==========
+    gotas_entrada = []
+    if valvula_entrada and caudal_entrada > 0:
+        # Máximo 2 gotas, solo por encima del agua
+        for i in range(min(int(caudal_entrada / 30), 2)):
+            gota_z = altura_max * 0.9 - i * (altura_max * 0.15)
+            if gota_z > nivel_actual:
+                gotas_entrada.append(gota_z)
+    entrada = _trazas_tuberia(
+        radio * 1.2, [altura_max * 0.9, altura_max * 1.15], altura_max * 0.9, radio,
+        'green' if valvula_entrada else 'gray', 8 if valvula_entrada else 4,
+        f'Entrada: {caudal_entrada:.1f} L/min', gotas_entrada, 'cyan'
+    )
 
-    fig.add_trace(go.Scatter3d(
-        x=x_umbral_bajo, y=y_umbral_bajo, z=z_umbral_bajo,
-        mode='lines',
-        line=dict(color='orange', width=4, dash='dash'),
-        name=f'Umbral Bajo: {umbral_bajo} cm'
-    ))
+    # ==========TUBERÍA DE SALIDA (ABAJO) ==========
+    gotas_salida = []
+    if bomba_salida and caudal_salida > 0 and nivel_actual > altura_max * 0.1:
+        for i in range(min(int(caudal_salida / 30), 2)):
+            gota_z = altura_max * 0.1 - i * (altura_max * 0.15)
+            if gota_z > -altura_max * 0.15:
+                gotas_salida.append(gota_z)
+    salida = _trazas_tuberia(
+        radio * 1.2, [altura_max * 0.1, -altura_max * 0.15], altura_max * 0.1, radio,
+        'red' if bomba_salida else 'gray', 8 if bomba_salida else 4,
+        f'Salida: {caudal_salida:.1f} L/min', gotas_salida, 'lightcoral'
+    )
 
     # Configuración de layout
     flujo_neto = caudal_entrada - caudal_salida if valvula_entrada or bomba_salida else 0
     flujo_text = f" | Flujo: {flujo_neto:+.1f} L/min" if abs(flujo_neto) > 0.1 else ""
+    layout = dict(geom['layout'], title=dict(
+        text=f"🌊 Tanque 3D - Nivel: {nivel_actual:.2f} cm ({(nivel_actual/altura_max)*100:.1f}%){flujo_text}",
+        font=dict(size=18)
+    ))
 
-    fig.update_layout(
-        title=dict(
-            text=f"🌊 Tanque 3D - Nivel: {nivel_actual:.2f} cm ({(nivel_actual/altura_max)*100:.1f}%){flujo_text}",
-            font=dict(size=18)
-        ),
-        scene=dict(
-            xaxis=dict(title='X (cm)', range=[-radio*1.5, radio*1.5]),
-            yaxis=dict(title='Y (cm)', range=[-radio*1.5, radio*1.5]),
-            zaxis=dict(title='Altura (cm)', range=[-altura_max*0.2, altura_max*1.2]),
-            camera=dict(
-                eye=dict(x=1.5, y=1.5, z=1.2),
-                center=dict(x=0, y=0, z=0.3)
-            ),
-            aspectmode='manual',
-            aspectratio=dict(x=1, y=1, z=2)
-        ),
-        height=700,
-        showlegend=True,
-        legend=dict(x=0.7, y=0.95),
-        margin=dict(l=0, r=0, t=40, b=0),
-        # Optimizaciones para rendimiento y anti-flickering
-        uirevision='constant',  # Mantener estado de la UI entre actualizaciones
-        transition=dict(duration=0),  # Sin animaciones de transición
-        hovermode=False,  # Deshabilitar hover para mejor rendimiento
-        dragmode='orbit'  # Modo de arrastre optimizado para 3D
-    )
-
-    return fig
+    datos = [geom['pared'], agua, superficie, *entrada, *salida, geom['umbral_alto'], geom['umbral_bajo']]
+    return go.Figure(data=datos, layout=layout)
 
 def crear_gauge_nivel(nivel, altura_max=200):
     """Medidor tipo gauge para el nivel"""
@@ -356,13 +359,13 @@ def crear_gauge_nivel(nivel, altura_max=200):
     fig.update_layout(height=400, margin=dict(l=20, r=20, t=60, b=20))
     return fig
 
-def crear_grafica_historia(historia, titulo, color, unidad):
-    """Crea gráfica de historia temporal"""
+def crear_grafica_historia(historia, titulo, color, unidad, muestras=None):
+    """Crea gráfica de historia temporal (muestras = número de cada muestra en el eje x)"""
     fig = go.Figure()
 
     if len(historia) > 0:
         fig.add_trace(go.Scatter(
-            x=list(range(len(historia))),
+            x=np.arange(len(historia)) if muestras is None else muestras,
             y=historia,
             mode='lines+markers',
             name=titulo,
@@ -381,21 +384,24 @@ def crear_grafica_historia(historia, titulo, color, unidad):
     return fig
 
 # ==================== INICIALIZACIÓN DE ESTADO ====================
-if 'tanque_sim' not in st.session_state:
-    st.session_state.tanque_sim = TanqueSimulado(altura_max=200, diametro=100)
-    st.session_state.sensor_us = SensorUltrasonico(altura_instalacion=200)
-    st.session_state.sensor_amb = SensorAmbiental()
-    st.session_state.simulacion_activa = False
+if 'modo_control' not in st.session_state:
     st.session_state.modo_control = "automatico"  # automatico o manual
-    st.session_state.nivel_sim_history = []
-    st.session_state.temp_history = []
-    st.session_state.presion_history = []
-    st.session_state.tiempo_sim = []
-    st.session_state.contador_sim = 0
     # Variables para control manual
     st.session_state.nivel_manual = 50.0
     st.session_state.temp_manual = 25.0
     st.session_state.presion_manual = 1013.0
+@st.cache_data
+def _leer_perfil(ruta, modificado):
+    with open(ruta, encoding='utf-8') as archivo:
+        return json.load(archivo)
+
+def cargar_perfil_planificador():
+    """Último perfil exportado por el SCE (--perfil), o None si no existe"""
+    if not os.path.exists(ARCHIVO_PERFIL):
+        return None
+    # La fecha de modificación invalida la caché cuando el SCE exporta otro perfil
+    return _leer_perfil(ARCHIVO_PERFIL, os.path.getmtime(ARCHIVO_PERFIL))
+
 
 # ==================== HEADER ====================
 st.markdown('<p class="main-header">🎮 SCE Gemelo Digital 3D - CONTROL TOTAL INTERACTIVO</p>', unsafe_allow_html=True)
@@ -453,7 +459,6 @@ st.sidebar.markdown("---")
 
 if modo_operacion == "🎮 Control Manual Total":
     st.session_state.modo_control = "manual"
-    st.session_state.simulacion_activa = False
 
     st.sidebar.markdown("### 🎯 CONTROL DIRECTO DE TODO")
 
@@ -574,28 +579,29 @@ if modo_operacion == "🎮 Control Manual Total":
             st.session_state.temp_manual = np.random.uniform(15, 35)
             st.session_state.presion_manual = np.random.uniform(990, 1030)
 
-    # Actualizar tanque con valores manuales
-    st.session_state.tanque_sim.nivel_actual = st.session_state.nivel_manual
-    st.session_state.tanque_sim.H_max = altura_max
-    st.session_state.tanque_sim.diametro = diametro
-    st.session_state.tanque_sim.area = np.pi * (diametro/2)**2
-
-    nivel_actual = st.session_state.nivel_manual
-    temp_actual = st.session_state.temp_manual
-    presion_actual = st.session_state.presion_manual
+    # Los cambios manuales ya provocan un rerun completo: sin temporizador
+    intervalo_refresco = None
 
 elif modo_operacion == "🔄 Simulación Física":
     st.session_state.modo_control = "automatico"
+    # Los controles muestran la configuración actual de la simulación compartida;
+    # solo sus on_change la modifican (un rerun por otro widget no escribe nada)
+    servicio = obtener_servicio_simulacion()
+    sincronizar_controles_simulacion(servicio)
 
     st.sidebar.markdown("### ⚙️ Parámetros del Tanque")
-    altura_max = st.sidebar.slider("Altura Máxima (cm)", 100, 300, 200, 10, key="altura_sim")
-    diametro = st.sidebar.slider("Diámetro (cm)", 50, 200, 100, 10, key="diam_sim")
+    altura_max = st.sidebar.slider("Altura Máxima (cm)", 100, 300, step=10, key="altura_sim",
+                                   on_change=aplicar_control_simulacion, args=("altura_sim",))
+    diametro = st.sidebar.slider("Diámetro (cm)", 50, 200, step=10, key="diam_sim",
+                                 on_change=aplicar_control_simulacion, args=("diam_sim",))
 
     st.sidebar.markdown("---")
     st.sidebar.markdown("### 💧 Caudales")
 
-    caudal_entrada = st.sidebar.slider("Caudal Entrada (L/min)", 0.0, 100.0, 10.0, 1.0)
-    caudal_salida = st.sidebar.slider("Caudal Salida (L/min)", 0.0, 100.0, 5.0, 1.0)
+    caudal_entrada = st.sidebar.slider("Caudal Entrada (L/min)", 0.0, 100.0, step=1.0, key="caudal_in_sim",
+                                       on_change=aplicar_control_simulacion, args=("caudal_in_sim",))
+    caudal_salida = st.sidebar.slider("Caudal Salida (L/min)", 0.0, 100.0, step=1.0, key="caudal_out_sim",
+                                      on_change=aplicar_control_simulacion, args=("caudal_out_sim",))
 
     st.sidebar.markdown("---")
     st.sidebar.markdown("### ⚠️ Umbrales")
@@ -625,335 +631,369 @@ elif modo_operacion == "🔄 Simulación Física":
 
     col1, col2 = st.sidebar.columns(2)
     with col1:
-        valvula_entrada = st.checkbox("Válvula Entrada", value=True, key="valv_sim")
+        valvula_entrada = st.checkbox("Válvula Entrada", key="valv_sim",
+                                      on_change=aplicar_control_simulacion, args=("valv_sim",))
     with col2:
-        bomba_salida = st.checkbox("Bomba Salida", value=False, key="bomba_sim")
-
-    # Actualizar parámetros
-    st.session_state.tanque_sim.H_max = altura_max
-    st.session_state.tanque_sim.diametro = diametro
-    st.session_state.tanque_sim.area = np.pi * (diametro/2)**2
-    st.session_state.tanque_sim.Q_in = caudal_entrada
-    st.session_state.tanque_sim.Q_out = caudal_salida
-    st.session_state.tanque_sim.set_valvula_entrada(valvula_entrada)
-    st.session_state.tanque_sim.set_bomba_salida(bomba_salida)
+        bomba_salida = st.checkbox("Bomba Salida", key="bomba_sim",
+                                   on_change=aplicar_control_simulacion, args=("bomba_sim",))
 
     st.sidebar.markdown("---")
     st.sidebar.markdown("### ▶️ Control de Simulación")
 
     col1, col2 = st.sidebar.columns(2)
     with col1:
-        if st.button("▶️ Iniciar" if not st.session_state.simulacion_activa else "⏸️ Pausar", use_container_width=True):
-            st.session_state.simulacion_activa = not st.session_state.simulacion_activa
+        if st.button("▶️ Iniciar" if not servicio.activa else "⏸️ Pausar", use_container_width=True):
+            if servicio.activa:
+                servicio.pausar()
+            else:
+                servicio.iniciar()
 
     with col2:
         if st.button("🔄 Reiniciar", use_container_width=True):
-            st.session_state.tanque_sim.nivel_actual = 50
-            st.session_state.nivel_sim_history = []
-            st.session_state.temp_history = []
-            st.session_state.presion_history = []
-            st.session_state.tiempo_sim = []
-            st.session_state.contador_sim = 0
-            st.session_state.simulacion_activa = False
+            servicio.reiniciar(nivel_inicial=50)
 
     velocidad = st.sidebar.slider("⏱️ Velocidad de actualización (s)", 0.1, 2.0, 0.5, 0.1,
-                                   help="Tiempo entre actualizaciones. Mayor = menos flickering")
-
-    # Ejecutar simulación si está activa
-    if st.session_state.simulacion_activa:
-        st.session_state.tanque_sim.actualizar(dt=0.5)
-        temp, presion = st.session_state.sensor_amb.leer()
-        distancia = st.session_state.sensor_us.medir_distancia(
-            st.session_state.tanque_sim.nivel_actual, temp, presion
-        )
-        nivel_medido = altura_max - distancia
-
-        st.session_state.nivel_sim_history.append(nivel_medido)
-        st.session_state.temp_history.append(temp)
-        st.session_state.presion_history.append(presion)
-        st.session_state.tiempo_sim.append(st.session_state.contador_sim * 0.5)
-        st.session_state.contador_sim += 1
+                                   help="Cada cuánto se refresca la vista (la simulación avanza por su cuenta)")
 
-        if len(st.session_state.nivel_sim_history) > 100:
-            st.session_state.nivel_sim_history.pop(0)
-            st.session_state.temp_history.pop(0)
-            st.session_state.presion_history.pop(0)
-            st.session_state.tiempo_sim.pop(0)
-
-    nivel_actual = st.session_state.tanque_sim.nivel_actual
-    temp_actual = st.session_state.temp_history[-1] if st.session_state.temp_history else 25.0
-    presion_actual = st.session_state.presion_history[-1] if st.session_state.presion_history else 1013.0
+    # Solo el panel en vivo se refresca con el temporizador. Pausada, el panel
+    # no puede saltearse sus ejecuciones (Streamlit borra lo que un fragmento
+    # no vuelve a dibujar): la vigilancia, que no dibuja nada, detecta el cambio
+    intervalo_refresco = velocidad if servicio.activa else None
+    st.fragment(vigilar_simulacion, run_every=velocidad)(servicio.activa)
 
 else:  # Modo Visualización
     st.sidebar.markdown("### 📈 Opciones de Visualización")
     n_muestras = st.sidebar.slider("Muestras a mostrar", 50, 1000, 500, 50)
+    rango_historico = st.sidebar.selectbox(
+        "🗓️ Rango del histórico",
+        ["Últimas muestras"] + list(RANGOS_HISTORICO),
+        help="Rangos largos se reducen a ~2000 puntos en la base de datos"
+    )
     auto_refresh = st.sidebar.checkbox("🔄 Auto-refresh (2s)", value=False)
+    intervalo_refresco = 2 if auto_refresh else None
 
     altura_max = 200
     diametro = 100
     umbral_bajo = 30
     umbral_alto = 170
 
-    df = cargar_datos_historicos()
-    if not df.empty:
-        df = df.tail(n_muestras)
-        nivel_actual = df.iloc[-1]['nivel']
-        temp_actual = df.iloc[-1]['temperatura']
-        presion_actual = df.iloc[-1]['presion']
-    else:
-        nivel_actual = 50
-        temp_actual = 25
-        presion_actual = 1013
-
 # ==================== MÉTRICAS PRINCIPALES ====================
-st.markdown("### 📊 Métricas en Tiempo Real")
-
-# Determinar estado
-if nivel_actual < umbral_bajo:
-    estado = "ALERTA_BAJA"
-    emoji_estado = "🟡"
-elif nivel_actual > umbral_alto:
-    estado = "ALERTA_ALTA"
-    emoji_estado = "🔴"
-else:
-    estado = "NORMAL"
-    emoji_estado = "✅"
-
-volumen = np.pi * (diametro/2)**2 * nivel_actual / 1000
 
-# Mostrar métricas
-col1, col2, col3, col4, col5 = st.columns(5)
-
-with col1:
-    st.metric(
-        label="💧 Nivel",
-        value=f"{nivel_actual:.2f} cm",
-        delta=f"{(nivel_actual/altura_max)*100:.1f}%"
-    )
-
-with col2:
-    st.metric(
-        label="🚦 Estado",
-        value=f"{emoji_estado} {estado}"
-    )
-
-with col3:
-    st.metric(
-        label="🌡️ Temperatura",
-        value=f"{temp_actual:.1f} °C"
-    )
-
-with col4:
-    st.metric(
-        label="🔽 Presión",
-        value=f"{presion_actual:.1f} hPa"
-    )
+def panel_en_vivo(modo_operacion, altura_max, diametro, umbral_bajo, umbral_alto,
+                  caudal_in=0, caudal_out=0, valv_in=False, bomb_out=False,
+                  n_muestras=500, rango_historico="Últimas muestras"):
+    """
+    Métricas, tanque 3D, gráficas y pie de página
+    Se ejecuta como fragmento: con el temporizador solo se re-ejecuta esta
+    función (no el CSS, la cabecera ni el sidebar). Los argumentos son los
+    valores del sidebar de la última ejecución completa.
+    """
+    if modo_operacion == "🎮 Control Manual Total":
+        nivel_actual = st.session_state.nivel_manual
+        temp_actual = st.session_state.temp_manual
+        presion_actual = st.session_state.presion_manual
+
+    elif modo_operacion == "🔄 Simulación Física":
+        # Solo lectura: la simulación compartida avanza en su propio hilo
+        servicio = obtener_servicio_simulacion()
+        ultima = servicio.ultima()
+        historia = servicio.historia()
+        nivel_actual = ultima.nivel
+        temp_actual = ultima.temperatura
+        presion_actual = ultima.presion
+        caudal_in, caudal_out = ultima.caudal_entrada, ultima.caudal_salida
+        valv_in, bomb_out = ultima.valvula_entrada, ultima.bomba_salida
+
+    else:  # Modo Visualización
+        df_historico = cargar_datos_historicos()
+        if not df_historico.empty:
+            df = df_historico.tail(n_muestras)
+            nivel_actual = df.iloc[-1]['nivel']
+            temp_actual = df.iloc[-1]['temperatura']
+            presion_actual = df.iloc[-1]['presion']
+        else:
+            nivel_actual = 50
+            temp_actual = 25
+            presion_actual = 1013
 
-with col5:
-    st.metric(
-        label="💦 Volumen",
-        value=f"{volumen:.1f} L"
-    )
+    st.markdown("### 📊 Métricas en Tiempo Real")
 
-st.markdown("---")
 
-# ==================== VISUALIZACIONES ====================
+    # Determinar estado
+    if nivel_actual < umbral_bajo:
+        estado = "ALERTA_BAJA"
+        emoji_estado = "🟡"
+    elif nivel_actual > umbral_alto:
+        estado = "ALERTA_ALTA"
+        emoji_estado = "🔴"
+    else:
+        estado = "NORMAL"
+        emoji_estado = "✅"
 
-tab1, tab2, tab3 = st.tabs(["🌊 Tanque 3D", "📊 Gráficas Tiempo Real", "📈 Análisis"])
+    volumen = np.pi * (diametro/2)**2 * nivel_actual / 1000
 
-with tab1:
-    col1, col2 = st.columns([2, 1])
+    # Mostrar métricas
+    col1, col2, col3, col4, col5 = st.columns(5)
 
     with col1:
-        # Obtener valores de caudal y válvulas según el modo
-        if modo_operacion == "🔄 Simulación Física":
-            caudal_in = caudal_entrada if 'caudal_entrada' in locals() else 0
-            caudal_out = caudal_salida if 'caudal_salida' in locals() else 0
-            valv_in = valvula_entrada if 'valvula_entrada' in locals() else False
-            bomb_out = bomba_salida if 'bomba_salida' in locals() else False
-        else:
-            caudal_in = 0
-            caudal_out = 0
-            valv_in = False
-            bomb_out = False
-
-        # Inicializar placeholder para tanque 3D (solo una vez)
-        if 'tanque_3d_placeholder' not in st.session_state:
-            st.session_state.tanque_3d_placeholder = st.empty()
-
-        # Crear figura 3D
-        fig_3d = crear_tanque_3d(
-            nivel_actual, altura_max, diametro, umbral_bajo, umbral_alto,
-            caudal_in, caudal_out, valv_in, bomb_out
-        )
-
-        # Actualizar en el placeholder para reducir flickering
-        st.session_state.tanque_3d_placeholder.plotly_chart(
-            fig_3d,
-            use_container_width=True,
-            key="tanque_3d_main_chart",
-            config={'displayModeBar': False, 'staticPlot': False}
+        st.metric(
+            label="💧 Nivel",
+            value=f"{nivel_actual:.2f} cm",
+            delta=f"{(nivel_actual/altura_max)*100:.1f}%"
         )
 
     with col2:
-        # Inicializar placeholder para gauge (solo una vez)
-        if 'gauge_placeholder' not in st.session_state:
-            st.session_state.gauge_placeholder = st.empty()
-
-        # Crear y actualizar gauge
-        fig_gauge = crear_gauge_nivel(nivel_actual, altura_max)
-        st.session_state.gauge_placeholder.plotly_chart(
-            fig_gauge,
-            use_container_width=True,
-            key="gauge_main_chart",
-            config={'displayModeBar': False}
+        st.metric(
+            label="🚦 Estado",
+            value=f"{emoji_estado} {estado}"
         )
 
-        st.markdown("### 📊 Info del Sistema")
-        volumen_max = np.pi * (diametro/2)**2 * altura_max / 1000
+    with col3:
+        st.metric(
+            label="🌡️ Temperatura",
+            value=f"{temp_actual:.1f} °C"
+        )
 
-        st.info(f"""
-        **Modo:** {modo_operacion}
+    with col4:
+        st.metric(
+            label="🔽 Presión",
+            value=f"{presion_actual:.1f} hPa"
+        )
 
-        **Volumen:**
-        - Actual: {volumen:.2f} L
-        - Máximo: {volumen_max:.2f} L
-        - Usado: {(volumen/volumen_max)*100:.1f}%
+    with col5:
+        st.metric(
+            label="💦 Volumen",
+            value=f"{volumen:.1f} L"
+        )
 
-        **Geometría:**
-        - Altura: {altura_max} cm
-        - Diámetro: {diametro} cm
-        - Radio: {diametro/2} cm
+    st.markdown("---")
 
-        **Umbrales:**
-        - Alto: {umbral_alto} cm
-        - Bajo: {umbral_bajo} cm
-        """)
+    # ==================== VISUALIZACIONES ====================
 
-        if modo_operacion == "🎮 Control Manual Total":
-            st.success("🎮 **MODO MANUAL ACTIVO**\nUsa los sliders del sidebar para control total")
+    tab1, tab2, tab3 = st.tabs(["🌊 Tanque 3D", "📊 Gráficas Tiempo Real", "📈 Análisis"])
 
-with tab2:
-    if modo_operacion == "🔄 Simulación Física" and st.session_state.nivel_sim_history:
-        # Gráficas de simulación
-        col1, col2 = st.columns(2)
+    with tab1:
+        col1, col2 = st.columns([2, 1])
 
         with col1:
-            fig = crear_grafica_historia(st.session_state.nivel_sim_history, "📊 Nivel del Tanque", "#1f77b4", "Nivel (cm)")
-            fig.add_hline(y=umbral_alto, line_dash="dash", line_color="red")
-            fig.add_hline(y=umbral_bajo, line_dash="dash", line_color="orange")
-            st.plotly_chart(fig, use_container_width=True)
+            # Crear figura 3D
+            fig_3d = crear_tanque_3d(
+                nivel_actual, altura_max, diametro, umbral_bajo, umbral_alto,
+                caudal_in, caudal_out, valv_in, bomb_out
+            )
+
+            # La key mantiene el mismo elemento entre ticks (sin parpadeo)
+            st.plotly_chart(
+                fig_3d,
+                use_container_width=True,
+                key="tanque_3d_main_chart",
+                config={'displayModeBar': False, 'staticPlot': False}
+            )
 
         with col2:
-            fig = crear_grafica_historia(st.session_state.temp_history, "🌡️Temperatura", "#ff7f0e", "Temp (°C)")
-            st.plotly_chart(fig, use_container_width=True)
+            # Crear y actualizar gauge
+            fig_gauge = crear_gauge_nivel(nivel_actual, altura_max)
+            st.plotly_chart(
+                fig_gauge,
+                use_container_width=True,
+                key="gauge_main_chart",
+                config={'displayModeBar': False}
+            )
+
+            st.markdown("### 📊 Info del Sistema")
+            volumen_max = np.pi * (diametro/2)**2 * altura_max / 1000
+
+            st.info(f"""
+            **Modo:** {modo_operacion}
+
+            **Volumen:**
+            - Actual: {volumen:.2f} L
+            - Máximo: {volumen_max:.2f} L
+            - Usado: {(volumen/volumen_max)*100:.1f}%
+
+            **Geometría:**
+            - Altura: {altura_max} cm
+            - Diámetro: {diametro} cm
+            - Radio: {diametro/2} cm
+
+            **Umbrales:**
+            - Alto: {umbral_alto} cm
+            - Bajo: {umbral_bajo} cm
+            """)
+
+            if modo_operacion == "🎮 Control Manual Total":
+                st.success("🎮 **MODO MANUAL ACTIVO**\nUsa los sliders del sidebar para control total")
+
+    with tab2:
+        if modo_operacion == "🔄 Simulación Física" and len(historia['paso']):
+            # Gráficas de simulación
+            col1, col2 = st.columns(2)
 
-        fig = crear_grafica_historia(st.session_state.presion_history, "🔽 Presión Barométrica", "#2ca02c", "Presión (hPa)")
-        st.plotly_chart(fig, use_container_width=True)
-
-    elif modo_operacion == "📊 Visualización Datos":
-        df = cargar_datos_historicos()
-        if not df.empty:
-            fig = go.Figure()
-            fig.add_trace(go.Scatter(x=df['timestamp'], y=df['nivel'], mode='lines', name='Nivel'))
-            fig.add_hline(y=umbral_alto, line_dash="dash", line_color="red")
-            fig.add_hline(y=umbral_bajo, line_dash="dash", line_color="orange")
-            fig.update_layout(title="Nivel Histórico", height=400)
-            st.plotly_chart(fig, use_container_width=True)
-        else:
-            st.warning("No hay datos históricos. Ejecuta el SCE primero.")
+            with col1:
+                fig = crear_grafica_historia(historia['nivel_medido'], "📊 Nivel del Tanque", "#1f77b4", "Nivel (cm)", historia['paso'])
+                fig.add_hline(y=umbral_alto, line_dash="dash", line_color="red")
+                fig.add_hline(y=umbral_bajo, line_dash="dash", line_color="orange")
+                st.plotly_chart(fig, use_container_width=True)
 
-    else:
-        st.info("""
-        ### 📊 Panel de Gráficas en Tiempo Real
+            with col2:
+                fig = crear_grafica_historia(historia['temperatura'], "🌡️Temperatura", "#ff7f0e", "Temp (°C)", historia['paso'])
+                st.plotly_chart(fig, use_container_width=True)
 
-        **En Modo Manual:**
-        - Los valores se actualizan según tus ajustes
-        - No hay historial temporal (es control instantáneo)
+            fig = crear_grafica_historia(historia['presion'], "🔽 Presión Barométrica", "#2ca02c", "Presión (hPa)", historia['paso'])
+            st.plotly_chart(fig, use_container_width=True)
 
-        **En Modo Simulación:**
-        - Las gráficas muestran la evolución temporal
-        - Presiona ▶️ Iniciar para ver las gráficas
+        elif modo_operacion == "📊 Visualización Datos":
+            if rango_historico == "Últimas muestras":
+                df = df_historico.tail(n_muestras)
+            else:
+                df = cargar_serie_reducida('nivel', rango_historico)
+            if df is not None and not df.empty:
+                fig = go.Figure()
+                fig.add_trace(go.Scatter(x=df['timestamp'], y=df['nivel'], mode='lines', name='Nivel'))
+                fig.add_hline(y=umbral_alto, line_dash="dash", line_color="red")
+                fig.add_hline(y=umbral_bajo, line_dash="dash", line_color="orange")
+                fig.update_layout(title="Nivel Histórico", height=400)
+                st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.warning("No hay datos históricos. Ejecuta el SCE primero.")
 
-        **En Modo Visualización:**
-        - Se muestran datos históricos de la BD
-        """)
+        else:
+            st.info("""
+            ### 📊 Panel de Gráficas en Tiempo Real
+
+            **En Modo Manual:**
+            - Los valores se actualizan según tus ajustes
+            - No hay historial temporal (es control instantáneo)
+
+            **En Modo Simulación:**
+            - Las gráficas muestran la evolución temporal
+            - Presiona ▶️ Iniciar para ver las gráficas
+
+            **En Modo Visualización:**
+            - Se muestran datos históricos de la BD
+            """)
+
+    with tab3:
+        if modo_operacion == "📊 Visualización Datos":
+            df = df_historico
+            if rango_historico == "Últimas muestras":
+                estadisticas = None if df.empty else {col: df[col].describe() for col in ('nivel', 'temperatura', 'presion')}
+            else:
+                # Rango largo: agregados precalculados, sin leer las mediciones crudas
+                resumen = cargar_estadisticas_rango(rango_historico)
+                estadisticas = None if not resumen or resumen['n'] == 0 else {
+                    col: pd.Series(resumen[col], name=col) for col in ('nivel', 'temperatura', 'presion')
+                }
 
-with tab3:
-    if modo_operacion == "📊 Visualización Datos":
-        df = cargar_datos_historicos()
-        if not df.empty:
-            col1, col2, col3 = st.columns(3)
+            if estadisticas:
+                col1, col2, col3 = st.columns(3)
 
-            with col1:
-                st.markdown("**🌊 Estadísticas Nivel**")
-                st.dataframe(df['nivel'].describe(), use_container_width=True)
+                with col1:
+                    st.markdown("**🌊 Estadísticas Nivel**")
+                    st.dataframe(estadisticas['nivel'], use_container_width=True)
 
-            with col2:
-                st.markdown("**🌡️ Estadísticas Temperatura**")
-                st.dataframe(df['temperatura'].describe(), use_container_width=True)
+                with col2:
+                    st.markdown("**🌡️ Estadísticas Temperatura**")
+                    st.dataframe(estadisticas['temperatura'], use_container_width=True)
+
+                with col3:
+                    st.markdown("**🔽 Estadísticas Presión**")
+                    st.dataframe(estadisticas['presion'], use_container_width=True)
 
-            with col3:
-                st.markdown("**🔽 Estadísticas Presión**")
-                st.dataframe(df['presion'].describe(), use_container_width=True)
+                if rango_historico != "Últimas muestras":
+                    st.caption(" | ".join(f"{estado}: {n}" for estado, n in resumen['estados'].items()))
+            else:
+                st.warning("No hay datos históricos")
+
+            st.markdown("---")
+            st.markdown("#### ⏱️ Perfil del Planificador Cíclico")
+            perfil = cargar_perfil_planificador()
+            if perfil:
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("Presupuesto/frame", f"{perfil['presupuesto_ms']:.2f} ms")
+                col2.metric("Frames", perfil['frames'])
+                col3.metric("Overruns", perfil['overruns'])
+                col4.metric(f"Jitter > {perfil['umbral_jitter_ms']:.2f} ms", perfil['eventos_jitter'])
+                reloj = perfil.get('reloj')
+                if reloj:
+                    st.caption(f"🕒 Período medio {reloj['periodo_medio_ms']:.4f} ms "
+                               f"(nominal {reloj['periodo_nominal_ms']:.4f}) | jitter de período p99 "
+                               f"{reloj['jitter_periodo']['p99_ms']:.3f} ms | overruns {reloj['overruns']} "
+                               f"({reloj['politica']}, saltados {reloj['saltados']})")
+
+                tiempos = pd.DataFrame(perfil['tiempos'])
+                st.dataframe(tiempos[tiempos['ambito'] != 'posicion'].set_index('nombre'),
+                             use_container_width=True)
+
+                ciclos = perfil['ciclos']
+                if ciclos['ciclo']:
+                    fig = go.Figure()
+                    fig.add_trace(go.Scatter(x=ciclos['ciclo'], y=ciclos['holgura_min_ms'],
+                                             mode='lines', name='Holgura mínima'))
+                    fig.add_trace(go.Scatter(x=ciclos['ciclo'], y=ciclos['holgura_media_ms'],
+                                             mode='lines', name='Holgura media'))
+                    fig.add_hline(y=0, line_dash="dash", line_color="red")
+                    fig.update_layout(title="Holgura por ciclo mayor", xaxis_title="Ciclo mayor",
+                                      yaxis_title="ms", height=350)
+                    st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.info("Sin perfil: ejecuta el SCE con --perfil para medir los tiempos del planificador")
         else:
-            st.warning("No hay datos históricos")
-    else:
-        st.markdown("### 🎯 Análisis del Sistema Actual")
+            st.markdown("### 🎯 Análisis del Sistema Actual")
 
-        col1, col2 = st.columns(2)
+            col1, col2 = st.columns(2)
 
-        with col1:
-            st.markdown("#### 📊 Estado del Tanque")
-            st.write(f"- **Nivel:** {nivel_actual:.2f} cm")
-            st.write(f"- **Porcentaje:** {(nivel_actual/altura_max)*100:.1f}%")
-            st.write(f"- **Estado:** {estado}")
-            st.write(f"- **Volumen:** {volumen:.2f} L")
-
-            if nivel_actual < umbral_bajo:
-                st.error("⚠️ Nivel por debajo del umbral mínimo")
-            elif nivel_actual > umbral_alto:
-                st.error("🔴 Nivel por encima del umbral máximo")
-            else:
-                st.success("✅ Sistema operando normalmente")
+            with col1:
+                st.markdown("#### 📊 Estado del Tanque")
+                st.write(f"- **Nivel:** {nivel_actual:.2f} cm")
+                st.write(f"- **Porcentaje:** {(nivel_actual/altura_max)*100:.1f}%")
+                st.write(f"- **Estado:** {estado}")
+                st.write(f"- **Volumen:** {volumen:.2f} L")
+
+                if nivel_actual < umbral_bajo:
+                    st.error("⚠️ Nivel por debajo del umbral mínimo")
+                elif nivel_actual > umbral_alto:
+                    st.error("🔴 Nivel por encima del umbral máximo")
+                else:
+                    st.success("✅ Sistema operando normalmente")
 
-        with col2:
-            st.markdown("#### 🌡️ Condiciones Ambientales")
-            st.write(f"- **Temperatura:** {temp_actual:.2f} °C")
-            st.write(f"- **Presión:** {presion_actual:.2f} hPa")
+            with col2:
+                st.markdown("#### 🌡️ Condiciones Ambientales")
+                st.write(f"- **Temperatura:** {temp_actual:.2f} °C")
+                st.write(f"- **Presión:** {presion_actual:.2f} hPa")
 
-            # Calcular velocidad del sonido
-            v_sonido = 331.3 + 0.606 * temp_actual
-            st.write(f"- **Vel. Sonido:** {v_sonido:.2f} m/s")
+                # Calcular velocidad del sonido
+                v_sonido = 331.3 + 0.606 * temp_actual
+                st.write(f"- **Vel. Sonido:** {v_sonido:.2f} m/s")
 
-            st.info(f"💡 **Modo Activo:** {modo_operacion}")
+                st.info(f"💡 **Modo Activo:** {modo_operacion}")
 
-# ==================== FOOTER ====================
-st.markdown("---")
+    # ==================== FOOTER ====================
+    st.markdown("---")
 
-col1, col2, col3, col4 = st.columns(4)
+    col1, col2, col3, col4 = st.columns(4)
 
-with col1:
-    if modo_operacion == "🔄 Simulación Física":
-        st.metric("⏱️ Tiempo Sim", f"{st.session_state.contador_sim * 0.5:.1f} s")
-    else:
-        st.metric("🎮 Modo", modo_operacion.split()[1])
+    with col1:
+        if modo_operacion == "🔄 Simulación Física":
+            st.metric("⏱️ Tiempo Sim", f"{ultima.t:.1f} s")
+        else:
+            st.metric("🎮 Modo", modo_operacion.split()[1])
 
-with col2:
-    st.metric("📏 Altura Max", f"{altura_max} cm")
+    with col2:
+        st.metric("📏 Altura Max", f"{altura_max} cm")
 
-with col3:
-    st.metric("📐 Diámetro", f"{diametro} cm")
+    with col3:
+        st.metric("📐 Diámetro", f"{diametro} cm")
 
-with col4:
-    area = np.pi * (diametro/2)**2
-    st.metric("📊 Área Base", f"{area:.0f} cm²")
+    with col4:
+        area = np.pi * (diametro/2)**2
+        st.metric("📊 Área Base", f"{area:.0f} cm²")
 
-# Auto-refresh
-if modo_operacion == "🔄 Simulación Física" and st.session_state.simulacion_activa:
-    time.sleep(velocidad)
-    st.rerun()
+# ==================== PANEL EN VIVO ====================
+# run_every=None: el fragmento solo se ejecuta con la página (sin temporizador)
+parametros_panel = dict(altura_max=altura_max, diametro=diametro,
+                        umbral_bajo=umbral_bajo, umbral_alto=umbral_alto)
+if modo_operacion == "📊 Visualización Datos":
+    parametros_panel.update(n_muestras=n_muestras, rango_historico=rango_historico)
 
-if modo_operacion == "📊 Visualización Datos" and auto_refresh:
-    time.sleep(2)
-    st.rerun()
\ No newline at end of file
+st.fragment(panel_en_vivo, run_every=intervalo_refresco)(modo_operacion, **parametros_panel)
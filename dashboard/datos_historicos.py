@@ -0,0 +1,257 @@
+"""
+Carga de datos históricos para el dashboard
+- Lector incremental: conexión de solo lectura reutilizada y lectura de
+  las filas nuevas (id > último id visto) hacia un buffer circular
+- Reducción de puntos para rangos largos: min/max por bucket en SQL + LTTB,
+  leyendo de las tablas de resumen (1 min / 1 h / 1 día) cuando alcanzan
+"""
+import os
+import sys
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from simuladores.buffer_circular import BufferCircular
+from sce.esquema_bd import (migrar_esquema, cargar_estados, consultar_estadisticas,
+                            elegir_resolucion, RESOLUCIONES)
+
+COLUMNAS = ('id', 'timestamp', 'nivel', 'temperatura', 'presion', 'estado')
+COLUMNAS_SERIE = ('nivel', 'temperatura', 'presion')  # Columnas numéricas graficables
+
+class CargadorIncremental:
+    """
+    Mantiene en memoria las últimas 'capacidad' mediciones del tanque
+    'tanque_id' (0 = gemelo individual)
+    Cada actualización cuesta O(filas nuevas): no se relee ni se reconvierte
+    lo que ya está en el buffer. Seguro para varios hilos (sesiones).
+    """
+    def __init__(self, db_path, capacidad=1000, tanque_id=0):
+        self.db_path = db_path
+        self.capacidad = capacidad
+        self.tanque_id = tanque_id
+        self._lock = threading.Lock()
+        self._conn = None
+        self._nombres_estado = {}
+        # id y timestamp (ms) caben exactos en float64 (< 2^53)
+        self._buffer = BufferCircular(capacidad, campos=COLUMNAS)
+        self._reiniciar()
+
+    def _reiniciar(self):
+        """Vacía el buffer (p. ej. si la base fue recreada)"""
+        self.ultimo_id = 0
+        self._buffer.limpiar()
+
+    def _conectar(self):
+        """Conexión de solo lectura, creada una vez (tras migrar si hace falta)"""
+        if self._conn is None:
+            if not os.path.exists(self.db_path):
+                return None
+            with sqlite3.connect(self.db_path) as conn_rw:
+                migrar_esquema(conn_rw)
+            conn_rw.close()
+            self._conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True,
+                                         check_same_thread=False)
+        return self._conn
+
+    def _anexar(self, filas):
+        """Copia las filas nuevas al buffer circular (estado NULL -> -1)"""
+        datos = np.array(filas, dtype=float)
+        datos[:, 5] = np.nan_to_num(datos[:, 5], nan=-1)
+        self._buffer.extender(datos)
+
+    def actualizar(self):
+        """Lee solo las filas con id mayor al último visto. Retorna cuántas llegaron."""
+        with self._lock:
+            conn = self._conectar()
+            if conn is None:
+                return 0
+
+            max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM mediciones").fetchone()[0]
+            if max_id < self.ultimo_id:
+                self._reiniciar()
+            if max_id == self.ultimo_id:
+                return 0
+
+            # Solo interesan las últimas 'capacidad' filas nuevas del tanque
+            # ('+tanque_id' fuerza el recorrido por id: solo se leen filas nuevas)
+            filas = conn.execute("""
+                SELECT id, timestamp, nivel, temperatura, presion, estado FROM mediciones
+                WHERE id > ? AND id <= ? AND +tanque_id = ? ORDER BY id DESC LIMIT ?
+            """, (self.ultimo_id, max_id, self.tanque_id, self.capacidad)).fetchall()
+            filas.reverse()
+            self.ultimo_id = max_id
+            if not filas:
+                return 0
+
+            if any(f[5] is not None and f[5] not in self._nombres_estado for f in filas):
+                self._nombres_estado = {i: nombre for nombre, i in cargar_estados(conn).items()}
+
+            self._anexar(filas)
+            return len(filas)
+
+    def obtener(self):
+        """DataFrame ordenado por tiempo con el contenido del buffer"""
+        with self._lock:
+            buffer = self._buffer
+            df = pd.DataFrame({
+                'id': buffer.vista('id').astype(np.int64),
+                'timestamp': buffer.vista('timestamp').astype(np.int64).astype('datetime64[ms]'),
+                'nivel': buffer.vista('nivel').copy(),
+                'temperatura': buffer.vista('temperatura').copy(),
+                'presion': buffer.vista('presion').copy(),
+                'estado': [self._nombres_estado.get(e) for e in buffer.vista('estado').astype(np.int64)],
+            }, columns=COLUMNAS)
+        return df.sort_values('timestamp', kind='stable', ignore_index=True)
+
+    def rango_tiempo(self):
+        """(primer, último) timestamp en ms del tanque, o None si no tiene datos"""
+        with self._lock:
+            conn = self._conectar()
+            if conn is None:
+                return None
+            t_min, t_max = conn.execute("SELECT MIN(timestamp), MAX(timestamp) FROM mediciones "
+                                        "WHERE tanque_id = ?", (self.tanque_id,)).fetchone()
+        return None if t_min is None else (t_min, t_max)
+
+    def serie_reducida(self, columna, t_ini, t_fin, puntos=2000, metodo='lttb'):
+        """
+        Serie de 'columna' entre t_ini y t_fin (ms) con ~'puntos' puntos
+        - Si el rango cubre suficientes buckets de una tabla de resumen, se
+          leen el mínimo y el máximo de cada bucket de la más gruesa posible
+        - Si el rango tiene pocos datos se devuelven crudos
+        - Si no, min/max por bucket en SQL ('minmax'), y con 'lttb' se
+          sobremuestrea x4 en SQL y LTTB elige los puntos finales
+        Retorna un DataFrame con columnas timestamp y la columna pedida.
+        """
+        if columna not in COLUMNAS_SERIE:
+            raise ValueError(f"❌ Columna inválida: {columna}")
+        t_ini, t_fin = int(t_ini), int(t_fin)  # sqlite3 no acepta enteros de NumPy
+        sobremuestreo = 4 if metodo == 'lttb' else 1
+        resolucion = elegir_resolucion(t_ini, t_fin, puntos * sobremuestreo // 2)
+        with self._lock:
+            conn = self._conectar()
+            if conn is None:
+                return pd.DataFrame(columns=['timestamp', columna])
+            if resolucion is not None:
+                tiempos, valores = consultar_resumen(conn, resolucion, columna, t_ini, t_fin,
+                                                     self.tanque_id)
+                n_filas = None
+            else:
+                n_filas = conn.execute(
+                    "SELECT COUNT(*) FROM mediciones WHERE tanque_id = ? AND timestamp BETWEEN ? AND ?",
+                    (self.tanque_id, t_ini, t_fin)
+                ).fetchone()[0]
+
+            if n_filas is None:
+                pass
+            elif n_filas <= puntos:
+                filas = conn.execute(f"""
+                    SELECT timestamp, {columna} FROM mediciones
+                    WHERE tanque_id = ? AND timestamp BETWEEN ? AND ? ORDER BY timestamp
+                """, (self.tanque_id, t_ini, t_fin)).fetchall()
+                tiempos = np.array([f[0] for f in filas], dtype=np.int64)
+                valores = np.array([f[1] for f in filas], dtype=float)
+            else:
+                tiempos, valores = consultar_min_max(conn, columna, t_ini, t_fin,
+                                                     max(1, puntos * sobremuestreo // 2), self.tanque_id)
+
+        if metodo == 'lttb' and len(tiempos) > puntos:
+            indices = lttb(tiempos, valores, puntos)
+            tiempos, valores = tiempos[indices], valores[indices]
+
+        return pd.DataFrame({'timestamp': tiempos.astype('datetime64[ms]'), columna: valores})
+
+    def estadisticas_rango(self, t_ini, t_fin):
+        """
+        Estadísticas exactas (n, media, std, min, max y conteo de alarmas)
+        de [t_ini, t_fin] en ms, combinando los resúmenes de 1 día/1 h/1 min
+        con las mediciones de los bordes: pocas consultas para cualquier rango
+        """
+        with self._lock:
+            conn = self._conectar()
+            if conn is None:
+                return None
+            return consultar_estadisticas(conn, t_ini, t_fin, self.tanque_id)
+
+    def cerrar(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+# ==================== REDUCCIÓN DE PUNTOS (DOWNSAMPLING) ====================
+
+def lttb(x, y, n_salida):
+    """
+    Largest-Triangle-Three-Buckets: elige n_salida puntos que conservan
+    la forma visual de la serie (x creciente). Conserva primero y último.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_salida >= n or n_salida < 3:
+        return np.arange(n)
+
+    indices = np.empty(n_salida, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    # Bordes de los n_salida-2 buckets interiores
+    bordes = np.linspace(1, n - 1, n_salida - 1).astype(np.int64)
+
+    a = 0
+    for i in range(n_salida - 2):
+        inicio, fin = bordes[i], bordes[i + 1]
+        # Promedio del bucket siguiente (o el último punto)
+        sig_inicio, sig_fin = (bordes[i + 1], bordes[i + 2]) if i + 2 < len(bordes) else (n - 1, n)
+        x_prom = x[sig_inicio:sig_fin].mean()
+        y_prom = y[sig_inicio:sig_fin].mean()
+        # Área del triángulo (a, candidato, promedio siguiente)
+        areas = np.abs((x[a] - x_prom) * (y[inicio:fin] - y[a])
+                       - (x[a] - x[inicio:fin]) * (y_prom - y[a]))
+        a = inicio + int(np.argmax(areas))
+        indices[i + 1] = a
+    return indices
+
+def consultar_min_max(conn, columna, t_ini, t_fin, n_buckets, tanque_id=0):
+    """
+    Bucketing en SQL: por cada bucket de tiempo devuelve el punto mínimo y
+    el máximo (con su timestamp real). Usa el índice (tanque, timestamp) y nunca
+    trae el rango completo a Python. Retorna (timestamps_ms, valores).
+    """
+    if columna not in COLUMNAS_SERIE:
+        raise ValueError(f"❌ Columna inválida: {columna}")
+    ancho = max(1, -(-(t_fin - t_ini + 1) // n_buckets))  # ms por bucket (redondeo hacia arriba)
+    puntos = []
+    for agregado in ('MIN', 'MAX'):
+        # SQLite devuelve en 'timestamp' la fila donde se alcanza el MIN/MAX
+        puntos += conn.execute(f"""
+            SELECT timestamp, {agregado}({columna}) FROM mediciones
+            WHERE tanque_id = ? AND timestamp BETWEEN ? AND ? AND {columna} IS NOT NULL
+            GROUP BY (timestamp - ?) / ?
+        """, (tanque_id, t_ini, t_fin, t_ini, ancho)).fetchall()
+    if not puntos:
+        return np.array([], dtype=np.int64), np.array([])
+    datos = np.unique(np.array(puntos, dtype=float), axis=0)  # ordena por tiempo y quita duplicados
+    return datos[:, 0].astype(np.int64), datos[:, 1]
+
+def consultar_resumen(conn, resolucion, columna, t_ini, t_fin, tanque_id=0):
+    """
+    Mínimo y máximo de cada bucket de la tabla resumen_<resolucion>
+    (el mínimo al inicio del bucket y el máximo a la mitad). Retorna
+    (timestamps_ms, valores) ordenados por tiempo.
+    """
+    if columna not in COLUMNAS_SERIE:
+        raise ValueError(f"❌ Columna inválida: {columna}")
+    ancho = RESOLUCIONES[resolucion]
+    filas = conn.execute(f"""
+        SELECT bucket, {columna}_min, {columna}_max FROM resumen_{resolucion}
+        WHERE tanque_id = ? AND bucket BETWEEN ? AND ? AND {columna}_min IS NOT NULL ORDER BY bucket
+    """, (tanque_id, t_ini // ancho * ancho, t_fin)).fetchall()
+    if not filas:
+        return np.array([], dtype=np.int64), np.array([])
+    datos = np.array(filas, dtype=float)
+    tiempos = np.column_stack([datos[:, 0], datos[:, 0] + ancho // 2]).ravel().astype(np.int64)
+    valores = datos[:, 1:3].ravel()
+    return tiempos, valores
@@ -0,0 +1,90 @@
+"""
+Benchmark - Construcción de features de PredictorNivel
+Compara el bucle original con df.iloc contra la versión vectorizada
+y verifica que ambas matrices sean idénticas byte a byte.
+
+Uso:
+    python ml/benchmark_features.py                # 10^4, 10^5, 10^6 filas
+    python ml/benchmark_features.py --completo     # medir el bucle también en 10^6
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from ml.ml_prediccion import PredictorNivel
+
+def crear_features_bucle(df, ventana=5):
+    """Implementación original (referencia) con bucles sobre df.iloc"""
+    features = []
+    targets = []
+
+    for i in range(ventana, len(df)):
+        feat = []
+        for j in range(ventana):
+            feat.append(df.iloc[i-ventana+j]['nivel'])
+        feat.append(df.iloc[i]['temperatura'])
+        feat.append(df.iloc[i]['presion'])
+        tendencia = df.iloc[i-1]['nivel'] - df.iloc[i-ventana]['nivel']
+        feat.append(tendencia)
+
+        features.append(feat)
+        targets.append(df.iloc[i]['nivel'])
+
+    return np.array(features), np.array(targets)
+
+def generar_df(n, semilla=0):
+    """DataFrame sintético con las mismas columnas que vista_mediciones"""
+    rng = np.random.default_rng(semilla)
+    return pd.DataFrame({
+        'id': np.arange(1, n + 1),
+        'timestamp': pd.date_range('2025-01-01', periods=n, freq='100ms'),
+        'nivel': 100 + np.cumsum(rng.normal(0, 0.5, n)),
+        'temperatura': 25 + rng.normal(0, 0.3, n),
+        'presion': 1013 + rng.normal(0, 1.5, n),
+        'estado': 'NORMAL',
+    })
+
+def medir(funcion, *args):
+    t0 = time.perf_counter()
+    resultado = funcion(*args)
+    return time.perf_counter() - t0, resultado
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark de crear_features')
+    parser.add_argument('--completo', action='store_true',
+                        help='Ejecutar el bucle original también con 10^6 filas (varios minutos)')
+    args = parser.parse_args()
+
+    predictor = PredictorNivel()
+    print("⏱️  Benchmark crear_features (ventana=5)")
+    print("=" * 70)
+    print(f"{'Filas':>10} | {'Bucle (s)':>12} | {'Vectorizado (s)':>16} | {'Aceleración':>11} | Idéntico")
+
+    t_bucle_por_fila = None
+    for n in (10**4, 10**5, 10**6):
+        df = generar_df(n)
+        t_vec, (X_vec, y_vec) = medir(predictor.crear_features, df, 5)
+
+        if n < 10**6 or args.completo:
+            t_bucle, (X_ref, y_ref) = medir(crear_features_bucle, df, 5)
+            t_bucle_por_fila = t_bucle / n
+            identico = (X_ref.dtype == X_vec.dtype and X_ref.shape == X_vec.shape
+                        and X_ref.tobytes() == X_vec.tobytes() and y_ref.tobytes() == y_vec.tobytes())
+            texto_bucle = f"{t_bucle:12.3f}"
+            texto_identico = "✅" if identico else "❌"
+        else:
+            # Extrapolación lineal desde la medición anterior
+            t_bucle = t_bucle_por_fila * n
+            texto_bucle = f"~{t_bucle:.1f}".rjust(12)
+            texto_identico = "-"
+
+        print(f"{n:>10} | {texto_bucle} | {t_vec:16.4f} | {t_bucle / t_vec:10.0f}x | {texto_identico}")
+
+    print("=" * 70)
+    if not args.completo:
+        print("~ = estimado a partir del tiempo por fila con 10^5 filas (usar --completo para medirlo)")
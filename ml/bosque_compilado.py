@@ -0,0 +1,161 @@
+"""
+Bosque Compilado - Inferencia rápida del Random Forest
+Aplana los árboles entrenados en arrays contiguos de NumPy
+(feature, umbral, izquierdo, derecho, valor) guardados como .npy,
+que se cargan con np.load(mmap_mode='r') en milisegundos.
+
+Uso:
+    python ml/bosque_compilado.py                  # compila ml/modelo_rf.pkl y compara
+    python ml/bosque_compilado.py --modelo otro.pkl --salida dir/
+"""
+import os
+import sys
+import json
+import time
+
+import numpy as np
+
+ARRAYS = ('feature', 'umbral', 'izquierdo', 'derecho', 'valor', 'raices')
+
+def exportar_bosque(modelo, directorio, metadatos=None):
+    """
+    Exporta un RandomForestRegressor (o árbol de decisión) entrenado
+    - Los nodos de todos los árboles se concatenan; los hijos usan índices globales
+    - Las hojas apuntan a sí mismas, así el recorrido vectorizado puede
+      avanzar un número fijo de niveles sin ramas
+    """
+    arboles = [est.tree_ for est in getattr(modelo, 'estimators_', [modelo])]
+
+    feature, umbral, izquierdo, derecho, valor, raices = [], [], [], [], [], []
+    desplazamiento = 0
+    for arbol in arboles:
+        n_nodos = arbol.node_count
+        indices = np.arange(n_nodos) + desplazamiento
+        es_hoja = arbol.children_left == -1
+
+        feature.append(np.where(es_hoja, 0, arbol.feature))
+        umbral.append(arbol.threshold)
+        izquierdo.append(np.where(es_hoja, indices, arbol.children_left + desplazamiento))
+        derecho.append(np.where(es_hoja, indices, arbol.children_right + desplazamiento))
+        valor.append(arbol.value[:, :, 0])  # (nodos, n_salidas)
+        raices.append(desplazamiento)
+        desplazamiento += n_nodos
+
+    os.makedirs(directorio, exist_ok=True)
+    datos = {
+        'feature': np.concatenate(feature).astype(np.int32),
+        'umbral': np.concatenate(umbral).astype(np.float64),
+        'izquierdo': np.concatenate(izquierdo).astype(np.int32),
+        'derecho': np.concatenate(derecho).astype(np.int32),
+        'valor': np.ascontiguousarray(np.concatenate(valor), dtype=np.float64),
+        'raices': np.array(raices, dtype=np.int32),
+    }
+    for nombre, array in datos.items():
+        np.save(os.path.join(directorio, f"{nombre}.npy"), array)
+
+    meta = {
+        'n_arboles': len(arboles),
+        'profundidad': int(max(arbol.max_depth for arbol in arboles)),
+        'n_features': int(modelo.n_features_in_),
+        'n_salidas': int(datos['valor'].shape[1]),
+    }
+    meta.update(metadatos or {})
+    with open(os.path.join(directorio, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+class BosqueCompilado:
+    """
+    Predictor basado en arrays (interfaz predict compatible con sklearn)
+    Recorre todos los árboles y filas a la vez, un nivel por iteración.
+    """
+    def __init__(self, feature, umbral, izquierdo, derecho, valor, raices, meta):
+        self.feature = feature
+        self.umbral = umbral
+        self.izquierdo = izquierdo
+        self.derecho = derecho
+        self.valor = valor
+        self.raices = raices
+        self.meta = meta
+        self.profundidad = meta['profundidad']
+        self.n_features_in_ = meta['n_features']
+
+    @classmethod
+    def cargar(cls, directorio, mmap_mode='r'):
+        """Carga los arrays mapeados en memoria (sin copiar ni deserializar)"""
+        if not os.path.exists(os.path.join(directorio, 'meta.json')):
+            raise FileNotFoundError(f"❌ Modelo compilado no encontrado: {directorio}")
+        with open(os.path.join(directorio, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = {nombre: np.load(os.path.join(directorio, f"{nombre}.npy"), mmap_mode=mmap_mode)
+                  for nombre in ARRAYS}
+        return cls(meta=meta, **arrays)
+
+    def predict(self, X):
+        """
+        Igual que RandomForestRegressor.predict (n_jobs=1):
+        X se compara en float32 como en sklearn y los árboles se suman en orden
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        filas = np.arange(len(X))[:, None]
+
+        nodos = np.broadcast_to(self.raices, (len(X), len(self.raices)))
+        for _ in range(self.profundidad):
+            a_izquierda = X[filas, self.feature[nodos]] <= self.umbral[nodos]
+            nodos = np.where(a_izquierda, self.izquierdo[nodos], self.derecho[nodos])
+
+        # (filas, árboles, salidas): cumsum suma secuencialmente, como sklearn
+        hojas = self.valor[nodos]
+        prediccion = np.cumsum(hojas, axis=1)[:, -1] / len(self.raices)
+        if prediccion.shape[1] == 1:
+            return prediccion[:, 0]
+        return prediccion
+
+# ==================== EJECUCIÓN ====================
+if __name__ == "__main__":
+    import argparse
+    import joblib
+
+    base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    parser = argparse.ArgumentParser(description='Compilar el Random Forest a arrays NumPy')
+    parser.add_argument('--modelo', default=os.path.join(base_dir, 'ml', 'modelo_rf.pkl'),
+                        help='Modelo sklearn a compilar (default: ml/modelo_rf.pkl)')
+    parser.add_argument('--salida', default=None,
+                        help='Directorio de salida (default: <modelo>_compilado/)')
+    args = parser.parse_args()
+    salida = args.salida or os.path.splitext(args.modelo)[0] + '_compilado'
+
+    t0 = time.perf_counter()
+    modelo = joblib.load(args.modelo)
+    t_pickle = time.perf_counter() - t0
+    modelo.set_params(n_jobs=1)
+
+    meta = exportar_bosque(modelo, salida)
+    print(f"💾 Bosque compilado: {salida} ({meta['n_arboles']} árboles, profundidad {meta['profundidad']})")
+
+    t0 = time.perf_counter()
+    bosque = BosqueCompilado.cargar(salida)
+    t_mmap = time.perf_counter() - t0
+
+    rng = np.random.default_rng(0)
+    X = np.column_stack([rng.uniform(0, 200, (1000, meta['n_features'] - 3)),
+                         rng.normal(25, 1, 1000), rng.normal(1013, 2, 1000), rng.normal(0, 2, 1000)])
+    identico = np.array_equal(modelo.predict(X), bosque.predict(X))
+
+    def latencia(funcion, repeticiones=200):
+        t0 = time.perf_counter()
+        for i in range(repeticiones):
+            funcion(X[i:i + 1])
+        return (time.perf_counter() - t0) / repeticiones * 1000
+
+    tam_pickle = os.path.getsize(args.modelo) / 1e6
+    tam_compilado = sum(os.path.getsize(os.path.join(salida, f"{n}.npy")) for n in ARRAYS) / 1e6
+    print("=" * 60)
+    print(f"{'':22} | {'sklearn (pickle)':>16} | {'compilado':>12}")
+    print(f"{'Tamaño (MB)':22} | {tam_pickle:16.2f} | {tam_compilado:12.2f}")
+    print(f"{'Carga (ms)':22} | {t_pickle * 1000:16.1f} | {t_mmap * 1000:12.2f}")
+    print(f"{'Predicción 1 fila (ms)':22} | {latencia(modelo.predict):16.3f} | {latencia(bosque.predict):12.3f}")
+    print("=" * 60)
+    print(f"{'✅' if identico else '❌'} Predicciones idénticas en 1000 filas: {identico}")
@@ -7,23 +7,80 @@ import numpy as np
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
+from numpy.lib.stride_tricks import sliding_window_view
 import sqlite3
 import matplotlib.pyplot as plt
 import joblib
+import json
 import os
+import sys
+
+# Agregar directorio raíz al path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from sce.esquema_bd import migrar_esquema
+from ml.bosque_compilado import exportar_bosque, BosqueCompilado
+
+# Features derivadas opcionales calculadas sobre la ventana de niveles
+FEATURES_EXTRA = ('media', 'std', 'pendiente')
+
+def construir_features(lags, temperatura, presion, extras=()):
+    """
+    Arma la matriz de features a partir de la matriz de retardos
+    - lags: (n, ventana) niveles t-ventana ... t-1 (el más antiguo primero)
+    - temperatura, presion: (n,) valores actuales
+    - extras: subconjunto de FEATURES_EXTRA que se agrega al final
+    Orden de columnas: niveles, temperatura, presión, tendencia, extras
+    """
+    lags = np.asarray(lags, dtype=float)
+    columnas = [
+        lags,
+        np.asarray(temperatura, dtype=float).reshape(-1, 1),
+        np.asarray(presion, dtype=float).reshape(-1, 1),
+        (lags[:, -1] - lags[:, 0]).reshape(-1, 1),  # Tendencia
+    ]
+    for extra in extras:
+        if extra == 'media':
+            columnas.append(lags.mean(axis=1, keepdims=True))
+        elif extra == 'std':
+            columnas.append(lags.std(axis=1, keepdims=True))
+        elif extra == 'pendiente':
+            # Pendiente de mínimos cuadrados (cm/muestra) sobre la ventana
+            x = np.arange(lags.shape[1]) - (lags.shape[1] - 1) / 2
+            columnas.append((lags @ x / np.dot(x, x)).reshape(-1, 1))
+        else:
+            raise ValueError(f"❌ Feature desconocida: {extra} (opciones: {', '.join(FEATURES_EXTRA)})")
+    return np.hstack(columnas)
+
+def nombres_features(ventana=5, extras=()):
+    """Nombres de las columnas generadas por construir_features"""
+    return ([f'Nivel t-{i}' for i in range(ventana, 0, -1)]
+            + ['Temp', 'Presión', 'Tendencia']
+            + [{'media': 'Media', 'std': 'Desv. Est.', 'pendiente': 'Pendiente'}[e] for e in extras])
 
 class PredictorNivel:
-    """Predictor de niveles usando Random Forest"""
-    def __init__(self, db_file=None):
+    """
+    Predictor de niveles usando Random Forest
+    Entrena con las mediciones del tanque 'tanque_id' (0 = gemelo individual):
+    en una base de flota las ventanas de retardos no mezclan tanques.
+    """
+    def __init__(self, db_file=None, tanque_id=0):
         if db_file is None:
             # Usar ruta absoluta basada en el directorio raíz del proyecto
             base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
             db_file = os.path.join(base_dir, "datos", "datos_sce.db")
         self.db_file = db_file
+        self.tanque_id = tanque_id
         self.base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
         self.modelo = None
+        self.modelo_directo = None  # Multi-salida: predice todos los horizontes a la vez
+        self.pasos_directo = 0
         self.scaler_X = None
         self.scaler_y = None
+        self.ventana = 5
+        self.extras = ()
+        # Marca de agua: último id de mediciones usado para entrenar
+        self.ultimo_id = 0
+        self.ultimo_timestamp = None
         
     def cargar_datos(self):
         """Cargar datos desde SQLite"""
@@ -31,56 +88,88 @@ class PredictorNivel:
             raise FileNotFoundError(f"❌ Base de datos no encontrada: {self.db_file}")
         
         conn = sqlite3.connect(self.db_file)
-        df = pd.read_sql_query("SELECT * FROM mediciones", conn)
+        migrar_esquema(conn)
+        df = pd.read_sql_query("SELECT * FROM vista_mediciones WHERE tanque_id = ? ORDER BY timestamp, id",
+                               conn, params=(self.tanque_id,))
         conn.close()
         
         if df.empty:
-            raise ValueError("❌ No hay datos en la base de datos")
+            raise ValueError(f"❌ No hay datos del tanque {self.tanque_id} en la base de datos")
         
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df = df.sort_values('timestamp')
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
         
         print(f"✅ Cargados {len(df)} registros")
         return df
+
+    def cargar_datos_nuevos(self, desde_id, tam_chunk=50000):
+        """
+        Generador de DataFrames con las filas de id > desde_id del tanque, en bloques
+        Cada bloque incluye al inicio las últimas 'ventana' filas anteriores
+        para que las primeras filas nuevas tengan sus retardos completos.
+        Retorna tuplas (bloque, n_filas_nuevas).
+        """
+        if not os.path.exists(self.db_file):
+            raise FileNotFoundError(f"❌ Base de datos no encontrada: {self.db_file}")
+
+        conn = sqlite3.connect(self.db_file)
+        migrar_esquema(conn)
+        try:
+            contexto = pd.read_sql_query(
+                "SELECT * FROM vista_mediciones WHERE id <= ? AND +tanque_id = ? ORDER BY id DESC LIMIT ?",
+                conn, params=(desde_id, self.tanque_id, self.ventana)
+            ).iloc[::-1]
+            while True:
+                nuevos = pd.read_sql_query(
+                    "SELECT * FROM vista_mediciones WHERE id > ? AND +tanque_id = ? ORDER BY id LIMIT ?",
+                    conn, params=(desde_id, self.tanque_id, tam_chunk)
+                )
+                if nuevos.empty:
+                    break
+                bloque = pd.concat([contexto, nuevos], ignore_index=True)
+                bloque['timestamp'] = pd.to_datetime(bloque['timestamp'], unit='ms')
+                yield bloque, len(nuevos)
+
+                desde_id = int(nuevos['id'].iloc[-1])
+                contexto = nuevos.tail(self.ventana)
+        finally:
+            conn.close()
     
-    def crear_features(self, df, ventana=5):
+    def crear_features(self, df, ventana=5, extras=()):
         """
         Crear features para ML:
         - Niveles en t-1, t-2, ..., t-n
         - Temperatura actual
         - Presión actual
         - Diferencia de nivel (tendencia)
+        - Opcional: media, desviación estándar y pendiente de la ventana
+        Vectorizado con una vista de ventana deslizante (sin copiar los niveles)
         """
-        features = []
-        targets = []
-        
-        for i in range(ventana, len(df)):
-            feat = []
-            
-            # Niveles históricos
-            for j in range(ventana):
-                feat.append(df.iloc[i-ventana+j]['nivel'])
-            
-            # Características ambientales
-            feat.append(df.iloc[i]['temperatura'])
-            feat.append(df.iloc[i]['presion'])
-            
-            # Tendencia (diferencia primer orden)
-            tendencia = df.iloc[i-1]['nivel'] - df.iloc[i-ventana]['nivel']
-            feat.append(tendencia)
-            
-            features.append(feat)
-            targets.append(df.iloc[i]['nivel'])
-        
-        return np.array(features), np.array(targets)
+        if len(df) <= ventana:
+            return np.array([]), np.array([])
+
+        niveles = df['nivel'].to_numpy(dtype=float)
+        lags = sliding_window_view(niveles[:-1], ventana)
+
+        X = construir_features(
+            lags,
+            df['temperatura'].to_numpy(dtype=float)[ventana:],
+            df['presion'].to_numpy(dtype=float)[ventana:],
+            extras,
+        )
+        y = niveles[ventana:].copy()
+        return X, y
     
-    def entrenar(self, test_size=0.2, n_estimators=100):
+    def entrenar(self, test_size=0.2, n_estimators=100, ventana=5, extras=()):
         """Entrenar Random Forest"""
         print("\n🧠 Entrenando modelo de Machine Learning...")
         print("=" * 50)
         
         df = self.cargar_datos()
-        X, y = self.crear_features(df, ventana=5)
+        self.ventana = ventana
+        self.extras = tuple(extras)
+        X, y = self.crear_features(df, ventana=self.ventana, extras=self.extras)
+        self.ultimo_id = int(df['id'].max())
+        self.ultimo_timestamp = str(df['timestamp'].max())
         
         print(f"📊 Conjunto de datos:")
         print(f"   - Features: {X.shape}")
@@ -133,6 +222,102 @@ class PredictorNivel:
         print("=" * 50)
         return {'mse_test': mse_test, 'r2_test': r2_test, 'mae_test': mae_test}
     
+    def entrenar_directo(self, pasos=10, n_estimators=100, test_size=0.2):
+        """
+        Entrenar un modelo directo multi-salida: una fila de features ->
+        niveles en t, t+1, ..., t+pasos-1 (sin recursión al predecir)
+        Usa la misma ventana y features que el modelo recursivo.
+        """
+        print(f"\n🧠 Entrenando modelo directo multi-horizonte ({pasos} pasos)...")
+        print("=" * 50)
+
+        df = self.cargar_datos()
+        X, _ = self.crear_features(df, ventana=self.ventana, extras=self.extras)
+        niveles = df['nivel'].to_numpy(dtype=float)
+        if len(X) < pasos:
+            raise ValueError("❌ No hay suficientes datos para el horizonte pedido")
+
+        # Y[i, h] = nivel en t+h para la fila de features i
+        Y = sliding_window_view(niveles[self.ventana:], pasos)
+        X = X[:len(Y)]
+
+        X_train, X_test, Y_train, Y_test = train_test_split(
+            X, Y, test_size=test_size, random_state=42, shuffle=False
+        )
+        self.modelo_directo = RandomForestRegressor(
+            n_estimators=n_estimators,
+            max_depth=15,
+            min_samples_split=5,
+            min_samples_leaf=2,
+            random_state=42,
+            n_jobs=-1
+        )
+        self.modelo_directo.fit(X_train, Y_train)
+        self.pasos_directo = pasos
+
+        # Con pasos=1 predict retorna (m,): se lleva a (m, pasos) antes de comparar
+        Y_pred = self.modelo_directo.predict(X_test).reshape(len(X_test), -1)
+        mae_por_paso = np.abs(Y_pred - Y_test).mean(axis=0)
+        print(f"📈 Test MAE t+1: {mae_por_paso[0]:.4f} cm | t+{pasos}: {mae_por_paso[-1]:.4f} cm")
+        print("=" * 50)
+        return {'mae_por_paso': mae_por_paso}
+
+    def entrenar_incremental(self, n_arboles_nuevos=10, max_arboles=None, tam_chunk=50000,
+                             min_muestras=50):
+        """
+        Reentrenamiento incremental (warm start)
+        Lee solo las filas posteriores a la marca de agua, en bloques, y
+        agrega 'n_arboles_nuevos' árboles entrenados con esos datos al bosque
+        existente. Con 'max_arboles' se descartan los árboles más antiguos.
+        Sin modelo previo se hace un entrenamiento completo.
+        """
+        if self.modelo is None:
+            print("ℹ️  No hay modelo previo: entrenamiento completo")
+            return self.entrenar(ventana=self.ventana, extras=self.extras)
+
+        print(f"\n🧠 Entrenamiento incremental desde id > {self.ultimo_id}...")
+        print("=" * 50)
+
+        bloques_X, bloques_y = [], []
+        ultimo_id, ultimo_timestamp, n_filas = self.ultimo_id, self.ultimo_timestamp, 0
+        for bloque, n_nuevas in self.cargar_datos_nuevos(self.ultimo_id, tam_chunk):
+            X, y = self.crear_features(bloque, ventana=self.ventana, extras=self.extras)
+            if len(X) > 0:
+                bloques_X.append(X)
+                bloques_y.append(y)
+            n_filas += n_nuevas
+            ultimo_id = int(bloque['id'].iloc[-1])
+            ultimo_timestamp = str(bloque['timestamp'].iloc[-1])
+
+        n_muestras = sum(len(y) for y in bloques_y)
+        print(f"✅ {n_filas} registros nuevos -> {n_muestras} muestras")
+        if n_muestras < min_muestras:
+            print(f"ℹ️  Menos de {min_muestras} muestras nuevas: se conserva el modelo actual")
+            return {'muestras_nuevas': n_muestras, 'arboles': len(self.modelo.estimators_)}
+
+        X_nuevo = np.vstack(bloques_X)
+        y_nuevo = np.concatenate(bloques_y)
+
+        # Error sobre los datos nuevos antes de actualizar (fuera de muestra)
+        mae_previo = mean_absolute_error(y_nuevo, self.modelo.predict(X_nuevo))
+
+        self.modelo.set_params(warm_start=True,
+                               n_estimators=len(self.modelo.estimators_) + n_arboles_nuevos)
+        self.modelo.fit(X_nuevo, y_nuevo)
+
+        if max_arboles is not None and len(self.modelo.estimators_) > max_arboles:
+            self.modelo.estimators_ = self.modelo.estimators_[-max_arboles:]
+            self.modelo.set_params(n_estimators=max_arboles)
+
+        self.ultimo_id = ultimo_id
+        self.ultimo_timestamp = ultimo_timestamp
+
+        print(f"🌲 Árboles en el bosque: {len(self.modelo.estimators_)} (+{n_arboles_nuevos})")
+        print(f"   MAE sobre datos nuevos antes de actualizar: {mae_previo:.4f} cm")
+        print("=" * 50)
+        return {'muestras_nuevas': n_muestras, 'arboles': len(self.modelo.estimators_),
+                'mae_previo': mae_previo}
+
     def _graficar_resultados(self, y_test, y_pred):
         """Graficar predicciones vs reales"""
         plt.figure(figsize=(14, 5))
@@ -169,7 +354,7 @@ class PredictorNivel:
             return
         
         importancias = self.modelo.feature_importances_
-        features = [f'Nivel t-{i}' for i in range(5, 0, -1)] + ['Temp', 'Presión', 'Tendencia']
+        features = nombres_features(self.ventana, self.extras)
         
         plt.figure(figsize=(10, 6))
         indices = np.argsort(importancias)[::-1]
@@ -185,23 +370,43 @@ class PredictorNivel:
     
     def predecir_futuro(self, ultimos_datos, temp=25, presion=1013, pasos=10):
         """Predecir los próximos N pasos"""
-        if self.modelo is None:
-            raise ValueError("❌ Modelo no entrenado")
-        
-        predicciones = []
-        datos = list(ultimos_datos[-5:])  # Últimos 5 niveles
-        
-        for _ in range(pasos):
-            # Crear feature vector
-            tendencia = datos[-1] - datos[0]
-            X = np.array(datos[-5:] + [temp, presion, tendencia]).reshape(1, -1)
-            
-            # Predecir
-            pred = self.modelo.predict(X)[0]
-            predicciones.append(pred)
-            datos.append(pred)
-        
-        return predicciones
+        return list(self.predecir_lote([ultimos_datos], temp, presion, pasos)[0])
+
+    def predecir_lote(self, ventanas, temps=25, presiones=1013, pasos=10, directo=False):
+        """
+        Pronóstico de muchas series a la vez
+        - ventanas: (n_series, >= ventana) últimos niveles de cada serie
+        - temps, presiones: escalar o (n_series,)
+        Recursivo: una sola llamada a predict por paso para todas las series;
+        la tendencia se mide desde el primer nivel de la ventana inicial (no
+        desde el de la ventana que se desliza sobre las predicciones).
+        Directo (modelo_directo): una sola llamada para todos los horizontes.
+        Retorna un array (n_series, pasos).
+        """
+        modelo = self.modelo_directo if directo else self.modelo
+        if modelo is None:
+            raise ValueError("❌ Modelo directo no entrenado" if directo else "❌ Modelo no entrenado")
+
+        ventanas = np.atleast_2d(np.asarray(ventanas, dtype=float))[:, -self.ventana:]
+        n_series = len(ventanas)
+        temps = np.broadcast_to(np.asarray(temps, dtype=float), (n_series,))
+        presiones = np.broadcast_to(np.asarray(presiones, dtype=float), (n_series,))
+
+        if directo:
+            if pasos > self.pasos_directo:
+                raise ValueError(f"❌ El modelo directo solo cubre {self.pasos_directo} pasos")
+            X = construir_features(ventanas, temps, presiones, self.extras)
+            return modelo.predict(X).reshape(n_series, -1)[:, :pasos]
+
+        # Buffer con la ventana inicial seguida de las predicciones
+        serie = np.empty((n_series, self.ventana + pasos))
+        serie[:, :self.ventana] = ventanas
+        for k in range(pasos):
+            X = construir_features(serie[:, k:k + self.ventana], temps, presiones, self.extras)
+            X[:, self.ventana + 2] = serie[:, self.ventana + k - 1] - serie[:, 0]  # Tendencia
+            serie[:, self.ventana + k] = modelo.predict(X)
+
+        return serie[:, self.ventana:]
     
     def guardar_modelo(self, filename=None):
         """Guardar modelo entrenado"""
@@ -212,6 +417,19 @@ class PredictorNivel:
             filename = os.path.join(self.base_dir, "ml", "modelo_rf.pkl")
 
         joblib.dump(self.modelo, filename)
+        if self.modelo_directo is not None:
+            joblib.dump(self.modelo_directo, self._ruta_directo(filename))
+
+        # Metadatos (features y marca de agua) junto al modelo
+        with open(self._ruta_metadatos(filename), 'w') as f:
+            json.dump({
+                'ventana': self.ventana,
+                'extras': list(self.extras),
+                'tanque_id': self.tanque_id,
+                'ultimo_id': self.ultimo_id,
+                'ultimo_timestamp': self.ultimo_timestamp,
+                'pasos_directo': self.pasos_directo if self.modelo_directo is not None else 0,
+            }, f, indent=2)
         print(f"💾 Modelo guardado: {filename}")
 
     def cargar_modelo(self, filename=None):
@@ -223,21 +441,93 @@ class PredictorNivel:
             raise FileNotFoundError(f"❌ Modelo no encontrado: {filename}")
 
         self.modelo = joblib.load(filename)
+
+        ruta_meta = self._ruta_metadatos(filename)
+        if os.path.exists(ruta_meta):
+            with open(ruta_meta) as f:
+                meta = json.load(f)
+            self.ventana = meta.get('ventana', 5)
+            self.extras = tuple(meta.get('extras', ()))
+            self.tanque_id = meta.get('tanque_id', 0)
+            self.ultimo_id = meta.get('ultimo_id', 0)
+            self.ultimo_timestamp = meta.get('ultimo_timestamp')
+            self.pasos_directo = meta.get('pasos_directo', 0)
+        if self.pasos_directo and os.path.exists(self._ruta_directo(filename)):
+            self.modelo_directo = joblib.load(self._ruta_directo(filename))
         print(f"📂 Modelo cargado: {filename}")
 
+    def exportar_compilado(self, directorio=None):
+        """Exportar el bosque a arrays NumPy (ver ml/bosque_compilado.py)"""
+        if self.modelo is None:
+            raise ValueError("❌ No hay modelo para exportar")
+        if directorio is None:
+            directorio = os.path.join(self.base_dir, "ml", "modelo_rf_compilado")
+
+        exportar_bosque(self.modelo, directorio,
+                        metadatos={'ventana': self.ventana, 'extras': list(self.extras)})
+        print(f"💾 Modelo compilado guardado: {directorio}")
+
+    def cargar_modelo_compilado(self, directorio=None):
+        """Cargar el bosque compilado (mmap) como modelo de predicción"""
+        if directorio is None:
+            directorio = os.path.join(self.base_dir, "ml", "modelo_rf_compilado")
+
+        self.modelo = BosqueCompilado.cargar(directorio)
+        self.ventana = self.modelo.meta.get('ventana', 5)
+        self.extras = tuple(self.modelo.meta.get('extras', ()))
+        print(f"📂 Modelo compilado cargado: {directorio}")
+
+    @staticmethod
+    def _ruta_metadatos(filename):
+        """modelo_rf.pkl -> modelo_rf.json"""
+        return os.path.splitext(filename)[0] + '.json'
+
+    @staticmethod
+    def _ruta_directo(filename):
+        """modelo_rf.pkl -> modelo_rf_directo.pkl"""
+        base, ext = os.path.splitext(filename)
+        return f"{base}_directo{ext}"
+
 # ==================== EJECUCIÓN ====================
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Predicción de niveles con Random Forest')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Actualizar el modelo guardado solo con los datos nuevos')
+    parser.add_argument('--arboles-nuevos', type=int, default=10,
+                        help='Árboles a agregar en modo incremental (default: 10)')
+    parser.add_argument('--max-arboles', type=int, default=None,
+                        help='Máximo de árboles del bosque en modo incremental (descarta los más antiguos)')
+    parser.add_argument('--directo', type=int, default=0, metavar='PASOS',
+                        help='Entrenar también un modelo directo multi-horizonte de PASOS pasos')
+    parser.add_argument('--tanque', type=int, default=0,
+                        help='tanque_id cuyas mediciones se usan (default: 0, gemelo individual; '
+                             'en modo incremental se usa el del modelo guardado)')
+    args = parser.parse_args()
+
     print("🤖 Sistema de Predicción de Niveles con Machine Learning")
     print("=" * 60)
     
-    predictor = PredictorNivel()
+    predictor = PredictorNivel(tanque_id=args.tanque)
     
     try:
         # Entrenar
-        metricas = predictor.entrenar(n_estimators=100)
-        
-        # Guardar modelo
+        if args.incremental:
+            try:
+                predictor.cargar_modelo()
+            except FileNotFoundError:
+                pass
+            metricas = predictor.entrenar_incremental(n_arboles_nuevos=args.arboles_nuevos,
+                                                      max_arboles=args.max_arboles)
+        else:
+            metricas = predictor.entrenar(n_estimators=100)
+        if args.directo:
+            predictor.entrenar_directo(pasos=args.directo)
+        
+        # Guardar modelo (pickle + versión compilada para inferencia rápida)
         predictor.guardar_modelo()
+        predictor.exportar_compilado()
         
         # Ejemplo de predicción futura
         print("\n🔮 Ejemplo de predicción futura:")
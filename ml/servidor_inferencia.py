@@ -0,0 +1,288 @@
+"""
+Servidor de Inferencia - Predicción de Niveles
+Servicio HTTP local que carga el modelo una sola vez y agrupa las
+peticiones concurrentes en lotes (una llamada a predict por lote)
+
+Endpoints:
+    POST /predecir      {"niveles": [...], "temp": 25, "presion": 1013, "pasos": 10}
+    GET  /estadisticas  latencia p50/p99, throughput y tamaño medio de lote
+    GET  /salud         estado del servicio
+
+Uso:
+    python ml/servidor_inferencia.py --puerto 8765
+"""
+import os
+import sys
+import json
+import time
+import queue
+import threading
+import urllib.request
+from collections import deque
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from ml.ml_prediccion import PredictorNivel
+
+class AgrupadorLotes:
+    """
+    Micro-batching: las peticiones se encolan y un hilo trabajador las
+    agrupa (hasta 'max_lote' o 'max_espera' segundos) en una sola llamada
+    a PredictorNivel.predecir_lote
+    - pasos_max: horizonte máximo por petición (el lote entero corre hasta
+      el mayor 'pasos' pedido, así que se acota)
+    """
+    def __init__(self, predictor, max_lote=256, max_espera=0.002, pasos_max=100):
+        if pasos_max < 1:
+            raise ValueError(f"❌ Horizonte máximo inválido: {pasos_max}")
+        self.predictor = predictor
+        self.max_lote = max_lote
+        self.max_espera = max_espera
+        self.pasos_max = pasos_max
+        self.cola = queue.Queue()
+        self._activo = True
+
+        # Estadísticas
+        self._lock = threading.Lock()
+        self.latencias = deque(maxlen=10000)  # s por petición
+        self.n_peticiones = 0
+        self.n_lotes = 0
+        self.n_rechazadas = 0  # datos inválidos (no llegan al lote)
+        self.n_fallidas = 0  # el lote falló al predecir
+        self.t_inicio = time.monotonic()
+
+        self._hilo = threading.Thread(target=self._bucle, name="agrupador-lotes", daemon=True)
+        self._hilo.start()
+
+    def validar(self, niveles, temp, presion, pasos):
+        """
+        Convierte y valida una petición antes de encolarla: un dato inválido
+        se rechaza solo (ValueError) sin hacer fallar al lote donde caería
+        """
+        ventana = self.predictor.ventana
+        if isinstance(pasos, float) and not pasos.is_integer():
+            raise ValueError(f"pasos debe ser entero: {pasos}")
+        try:
+            niveles = np.asarray(niveles, dtype=float)
+            temp = float(temp)
+            presion = float(presion)
+            pasos = int(pasos)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Datos inválidos: {e}") from e
+        if niveles.ndim != 1 or len(niveles) < ventana:
+            raise ValueError(f"Se necesitan al menos {ventana} niveles (lista de números)")
+        if not (np.all(np.isfinite(niveles)) and np.isfinite(temp) and np.isfinite(presion)):
+            raise ValueError("Los niveles, temp y presion deben ser finitos")
+        if not 1 <= pasos <= self.pasos_max:
+            raise ValueError(f"pasos debe estar entre 1 y {self.pasos_max}: {pasos}")
+        return niveles[-ventana:], temp, presion, pasos
+
+    def predecir(self, niveles, temp=25, presion=1013, pasos=10):
+        """Valida, encola una petición y espera su resultado (bloqueante)"""
+        t0 = time.perf_counter()
+        try:
+            peticion = self.validar(niveles, temp, presion, pasos)
+        except ValueError:
+            with self._lock:
+                self.n_rechazadas += 1
+            raise
+        futuro = Future()
+        self.cola.put((*peticion, futuro))
+        try:
+            resultado = futuro.result()
+        except Exception:
+            with self._lock:
+                self.n_fallidas += 1
+            raise
+        with self._lock:
+            self.latencias.append(time.perf_counter() - t0)
+            self.n_peticiones += 1
+        return resultado
+
+    def _bucle(self):
+        while self._activo:
+            try:
+                primera = self.cola.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            # Juntar todo lo que llegue dentro de la ventana de espera
+            lote = [primera]
+            limite = time.perf_counter() + self.max_espera
+            while len(lote) < self.max_lote:
+                restante = limite - time.perf_counter()
+                try:
+                    lote.append(self.cola.get(timeout=restante) if restante > 0 else self.cola.get_nowait())
+                except queue.Empty:
+                    break
+
+            self._procesar(lote)
+
+    def _procesar(self, lote):
+        """Una llamada a predecir_lote con el máximo de pasos pedido (peticiones ya validadas)"""
+        try:
+            ventanas = np.array([p[0] for p in lote])
+            temps = np.array([p[1] for p in lote], dtype=float)
+            presiones = np.array([p[2] for p in lote], dtype=float)
+            pasos_max = max(p[3] for p in lote)
+
+            # El pronóstico recursivo de k pasos es prefijo del de pasos_max
+            predicciones = self.predictor.predecir_lote(ventanas, temps, presiones, pasos_max)
+            for fila, (_, _, _, pasos, futuro) in zip(predicciones, lote):
+                futuro.set_result(fila[:pasos].tolist())
+        except Exception as e:
+            for *_, futuro in lote:
+                if not futuro.done():
+                    futuro.set_exception(e)
+        with self._lock:
+            self.n_lotes += 1
+
+    def estadisticas(self):
+        """Latencias p50/p99 (ms), peticiones/s y tamaño medio de lote"""
+        with self._lock:
+            latencias = np.array(self.latencias)
+            n_peticiones, n_lotes = self.n_peticiones, self.n_lotes
+            n_rechazadas, n_fallidas = self.n_rechazadas, self.n_fallidas
+        t_activo = time.monotonic() - self.t_inicio
+        return {
+            'peticiones': n_peticiones,
+            'lotes': n_lotes,
+            'rechazadas': n_rechazadas,
+            'fallidas': n_fallidas,
+            'lote_medio': n_peticiones / n_lotes if n_lotes else 0.0,
+            'peticiones_por_s': n_peticiones / t_activo if t_activo > 0 else 0.0,
+            'latencia_p50_ms': float(np.percentile(latencias, 50) * 1000) if len(latencias) else 0.0,
+            'latencia_p99_ms': float(np.percentile(latencias, 99) * 1000) if len(latencias) else 0.0,
+        }
+
+    def detener(self):
+        self._activo = False
+        self._hilo.join()
+
+class ManejadorInferencia(BaseHTTPRequestHandler):
+    """Manejador HTTP (el agrupador se asigna en la clase antes de servir)"""
+    agrupador = None
+
+    def _responder(self, codigo, datos):
+        cuerpo = json.dumps(datos).encode()
+        self.send_response(codigo)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_GET(self):
+        if self.path == '/estadisticas':
+            self._responder(200, self.agrupador.estadisticas())
+        elif self.path == '/salud':
+            self._responder(200, {'estado': 'OK', 'ventana': self.agrupador.predictor.ventana})
+        else:
+            self._responder(404, {'error': f'Ruta no encontrada: {self.path}'})
+
+    def do_POST(self):
+        if self.path != '/predecir':
+            self._responder(404, {'error': f'Ruta no encontrada: {self.path}'})
+            return
+        try:
+            largo = int(self.headers.get('Content-Length', 0))
+            peticion = json.loads(self.rfile.read(largo))
+            prediccion = self.agrupador.predecir(
+                peticion['niveles'],
+                peticion.get('temp', 25),
+                peticion.get('presion', 1013),
+                peticion.get('pasos', 10),
+            )
+        except (KeyError, ValueError, TypeError) as e:
+            self._responder(400, {'error': str(e)})
+            return
+        except Exception as e:
+            # Falla del lote al predecir: el cliente recibe igual una respuesta
+            self._responder(500, {'error': f'{type(e).__name__}: {e}'})
+            return
+        self._responder(200, {'prediccion': prediccion})
+
+    def log_message(self, formato, *args):
+        # Sin una línea de log por petición
+        pass
+
+class ServidorInferencia(ThreadingHTTPServer):
+    """Servidor HTTP multihilo con cola de conexiones amplia para ráfagas concurrentes"""
+    request_queue_size = 128
+    daemon_threads = True
+
+class ClienteInferencia:
+    """Cliente mínimo para el dashboard y el SCE"""
+    def __init__(self, url='http://127.0.0.1:8765', timeout=1.0):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _pedir(self, ruta, datos=None):
+        cuerpo = json.dumps(datos).encode() if datos is not None else None
+        peticion = urllib.request.Request(self.url + ruta, data=cuerpo,
+                                          headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(peticion, timeout=self.timeout) as respuesta:
+            return json.loads(respuesta.read())
+
+    def predecir(self, niveles, temp=25, presion=1013, pasos=10):
+        datos = {'niveles': list(map(float, niveles)), 'temp': float(temp),
+                 'presion': float(presion), 'pasos': pasos}
+        return self._pedir('/predecir', datos)['prediccion']
+
+    def estadisticas(self):
+        return self._pedir('/estadisticas')
+
+def crear_servidor(ruta_modelo=None, host='127.0.0.1', puerto=8765, max_lote=256, max_espera=0.002,
+                   compilado=False, pasos_max=100):
+    """
+    Carga el modelo una vez y crea el servidor HTTP (sin arrancarlo)
+    Con compilado=True, ruta_modelo es el directorio del bosque compilado
+    """
+    predictor = PredictorNivel()
+    if compilado:
+        predictor.cargar_modelo_compilado(ruta_modelo)
+    else:
+        predictor.cargar_modelo(ruta_modelo)
+        # Las peticiones ya llegan agrupadas: evitar el costo de despacho de joblib
+        predictor.modelo.set_params(n_jobs=1)
+
+    manejador = type('Manejador', (ManejadorInferencia,), {})
+    manejador.agrupador = AgrupadorLotes(predictor, max_lote=max_lote, max_espera=max_espera,
+                                         pasos_max=pasos_max)
+    return ServidorInferencia((host, puerto), manejador)
+
+# ==================== EJECUCIÓN ====================
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Servidor de inferencia del predictor de nivel')
+    parser.add_argument('--host', default='127.0.0.1', help='Dirección de escucha (default: 127.0.0.1)')
+    parser.add_argument('--puerto', type=int, default=8765, help='Puerto HTTP (default: 8765)')
+    parser.add_argument('--modelo', default=None, help='Ruta del modelo (default: ml/modelo_rf.pkl)')
+    parser.add_argument('--compilado', action='store_true',
+                        help='Usar el bosque compilado (--modelo es su directorio, default: ml/modelo_rf_compilado)')
+    parser.add_argument('--max-lote', type=int, default=256, help='Peticiones máximas por lote (default: 256)')
+    parser.add_argument('--espera-ms', type=float, default=2.0,
+                        help='Espera máxima para completar un lote en ms (default: 2)')
+    parser.add_argument('--pasos-max', type=int, default=100,
+                        help='Horizonte máximo aceptado por petición (default: 100)')
+    args = parser.parse_args()
+
+    try:
+        servidor = crear_servidor(args.modelo, args.host, args.puerto, args.max_lote, args.espera_ms / 1000,
+                                  compilado=args.compilado, pasos_max=args.pasos_max)
+    except FileNotFoundError as e:
+        print(f"\n❌ Error: {e}")
+        print("💡 Primero debe ejecutar: python ml/ml_prediccion.py")
+        sys.exit(1)
+
+    print(f"🚀 Servidor de inferencia en http://{args.host}:{args.puerto}")
+    print("   POST /predecir | GET /estadisticas | GET /salud")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Servidor detenido")
+    finally:
+        servidor.server_close()
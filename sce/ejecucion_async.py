@@ -0,0 +1,230 @@
+"""
+Modo Asíncrono del SCE (asyncio)
+T1 (adquisición) y T2 (control) siguen corriendo en el reloj de frames;
+T3 (almacenamiento) y T4 (comunicación) solo copian su dato a una cola
+acotada y retornan. Dos consumidores asyncio vacían las colas:
+- almacenamiento: escribe en SQLite en un único hilo de E/S
+  (run_in_executor), así un commit lento no frena el event loop
+- comunicación: publica (la latencia de red simulada es un asyncio.sleep)
+
+Cuando una cola está llena se aplica su política:
+    'bloquear'           contrapresión: no se pierde nada, el bucle de
+                         frames espera a que el consumidor libere lugar
+    'descartar_antiguo'  se descarta el elemento más viejo de la cola
+    'descartar_nuevo'    se descarta el elemento que llega
+    'fusionar'           el nuevo reemplaza al último pendiente (para
+                         estados, solo importa el más reciente)
+"""
+import asyncio
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from sce.perfilador import EstadisticaTiempos
+
+POLITICAS_COLA = ('bloquear', 'descartar_antiguo', 'descartar_nuevo', 'fusionar')
+
+def validar_cola(capacidad, politica):
+    if capacidad < 1:
+        raise ValueError(f"❌ Capacidad de cola inválida: {capacidad}")
+    if politica not in POLITICAS_COLA:
+        raise ValueError(f"❌ Política de cola desconocida: {politica} "
+                         f"(opciones: {', '.join(POLITICAS_COLA)})")
+
+class ColaAcotada:
+    """
+    Cola de capacidad fija entre el bucle de frames y un consumidor asyncio
+    poner() es síncrono (lo llaman las acciones del planificador); con
+    'bloquear' la cola puede excederse y el bucle de frames espera en
+    esperar_lugar() antes de liberar el siguiente frame.
+    """
+    def __init__(self, nombre, capacidad, politica='bloquear', ventana=1000):
+        validar_cola(capacidad, politica)
+        self.nombre = nombre
+        self.capacidad = capacidad
+        self.politica = politica
+        self._items = deque()  # (instante de encolado en ns, elemento)
+        self._hay_datos = asyncio.Event()
+        self._hay_lugar = asyncio.Event()
+        self.cerrada = False
+
+        # Estadísticas
+        self.encolados = 0
+        self.descartados = 0
+        self.fusionados = 0
+        self.esperas = 0  # veces que la contrapresión detuvo al bucle de frames
+        self.t_espera_total = 0.0
+        self.ocupacion_max = 0
+        self.latencia = EstadisticaTiempos(ventana)  # encolado -> consumido
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def excedida(self):
+        return len(self._items) > self.capacidad
+
+    def poner(self, elemento):
+        """Encola sin bloquear aplicando la política si la cola está llena"""
+        ahora = time.perf_counter_ns()
+        self.encolados += 1
+        if len(self._items) >= self.capacidad:
+            if self.politica == 'descartar_nuevo':
+                self.descartados += 1
+                return
+            if self.politica == 'descartar_antiguo':
+                self._items.popleft()
+                self.descartados += 1
+            elif self.politica == 'fusionar':
+                self._items[-1] = (ahora, elemento)
+                self.fusionados += 1
+                return
+        self._items.append((ahora, elemento))
+        self.ocupacion_max = max(self.ocupacion_max, len(self._items))
+        self._hay_datos.set()
+
+    async def esperar_lugar(self):
+        """Contrapresión: espera hasta que la cola vuelva a su capacidad"""
+        if not self.excedida:
+            return
+        self.esperas += 1
+        t0 = time.perf_counter()
+        while self.excedida:
+            self._hay_lugar.clear()
+            await self._hay_lugar.wait()
+        self.t_espera_total += time.perf_counter() - t0
+
+    async def tomar_lote(self, maximo=None):
+        """
+        Espera datos y retira hasta 'maximo' elementos (todos por defecto)
+        Retorna [] cuando la cola está cerrada y vacía
+        """
+        while not self._items:
+            if self.cerrada:
+                return []
+            self._hay_datos.clear()
+            await self._hay_datos.wait()
+        n = len(self._items) if maximo is None else min(maximo, len(self._items))
+        ahora = time.perf_counter_ns()
+        lote = []
+        for _ in range(n):
+            encolado, elemento = self._items.popleft()
+            self.latencia.registrar(ahora - encolado)
+            lote.append(elemento)
+        self._hay_lugar.set()
+        return lote
+
+    def cerrar(self):
+        """Sin más elementos: el consumidor termina al vaciarla"""
+        self.cerrada = True
+        self._hay_datos.set()
+
+    def resumen(self):
+        return {
+            'cola': self.nombre,
+            'capacidad': self.capacidad,
+            'politica': self.politica,
+            'encolados': self.encolados,
+            'descartados': self.descartados,
+            'fusionados': self.fusionados,
+            'esperas': self.esperas,
+            'espera_total_s': self.t_espera_total,
+            'ocupacion_max': self.ocupacion_max,
+            'latencia': self.latencia.resumen(),
+        }
+
+class PipelineES:
+    """
+    Ejecución asyncio de un sistema con las tareas T3/T4 desacopladas
+    El sistema provee:
+    - muestra_almacenamiento() / escribir_almacenamiento(muestras)  (bloqueante)
+    - mensaje_comunicacion() / publicar(mensaje), y latencia_red_s
+    """
+    def __init__(self, capacidad_almacenamiento=1000, politica_almacenamiento='bloquear',
+                 capacidad_comunicacion=1, politica_comunicacion='fusionar'):
+        # Se validan ya; las colas se crean en ejecutar (una por corrida)
+        validar_cola(capacidad_almacenamiento, politica_almacenamiento)
+        validar_cola(capacidad_comunicacion, politica_comunicacion)
+        self.config_almacenamiento = (capacidad_almacenamiento, politica_almacenamiento)
+        self.config_comunicacion = (capacidad_comunicacion, politica_comunicacion)
+        self.cola_almacenamiento = None
+        self.cola_comunicacion = None
+        self.escrituras = EstadisticaTiempos()
+        self.publicaciones = EstadisticaTiempos()
+
+    def instalar(self, sistema):
+        """T3 y T4 pasan a solo encolar (WCET de la tabla: el de una copia)"""
+        self.sistema = sistema
+        scheduler = sistema.scheduler
+        scheduler.configurar_tarea('T3', wcet=0.001,
+                                   accion=lambda s: self.cola_almacenamiento.poner(s.muestra_almacenamiento()))
+        scheduler.configurar_tarea('T4', wcet=0.001,
+                                   accion=lambda s: self.cola_comunicacion.poner(s.mensaje_comunicacion()))
+
+    async def _consumir_almacenamiento(self, hilo_es):
+        loop = asyncio.get_running_loop()
+        while True:
+            muestras = await self.cola_almacenamiento.tomar_lote()
+            if not muestras:
+                return
+            t0 = time.perf_counter_ns()
+            await loop.run_in_executor(hilo_es, self.sistema.escribir_almacenamiento, muestras)
+            self.escrituras.registrar(time.perf_counter_ns() - t0)
+
+    async def _consumir_comunicacion(self):
+        while True:
+            mensajes = await self.cola_comunicacion.tomar_lote()
+            if not mensajes:
+                return
+            for mensaje in mensajes:
+                t0 = time.perf_counter_ns()
+                if self.sistema.latencia_red_s > 0:
+                    await asyncio.sleep(self.sistema.latencia_red_s)
+                self.sistema.publicar(mensaje)
+                self.publicaciones.registrar(time.perf_counter_ns() - t0)
+
+    async def ejecutar(self, frames_totales, paso_frame, reloj=None):
+        """
+        Corre 'frames_totales' frames llamando a paso_frame(i) en el reloj
+        (sin reloj: as-fast-as-possible, cediendo el loop en cada frame)
+        y espera a que los consumidores vacíen las colas
+        """
+        self.cola_almacenamiento = ColaAcotada('almacenamiento', *self.config_almacenamiento)
+        self.cola_comunicacion = ColaAcotada('comunicacion', *self.config_comunicacion)
+        # Un solo hilo: SQLite se usa siempre desde el mismo hilo y en orden
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='sce-es') as hilo_es:
+            consumidores = [asyncio.create_task(self._consumir_almacenamiento(hilo_es)),
+                            asyncio.create_task(self._consumir_comunicacion())]
+            try:
+                if reloj is not None:
+                    reloj.iniciar()
+                for i in range(frames_totales):
+                    paso_frame(i)
+                    await self.cola_almacenamiento.esperar_lugar()
+                    await self.cola_comunicacion.esperar_lugar()
+                    if reloj is not None:
+                        await reloj.esperar_async()
+                    else:
+                        await asyncio.sleep(0)
+            finally:
+                self.cola_almacenamiento.cerrar()
+                self.cola_comunicacion.cerrar()
+                await asyncio.gather(*consumidores)
+
+    def imprimir(self):
+        for cola, consumidor, nombre in ((self.cola_almacenamiento, self.escrituras, 'escritura'),
+                                         (self.cola_comunicacion, self.publicaciones, 'publicación')):
+            if cola is None:
+                continue
+            resumen = cola.resumen()
+            latencia = resumen['latencia']
+            servicio = consumidor.resumen()
+            print(f"📬 Cola {resumen['cola']} ({resumen['politica']}, capacidad {resumen['capacidad']}): "
+                  f"{resumen['encolados']} encolados | descartados {resumen['descartados']} | "
+                  f"fusionados {resumen['fusionados']} | contrapresión {resumen['esperas']} "
+                  f"({resumen['espera_total_s'] * 1000:.1f} ms) | ocupación máx {resumen['ocupacion_max']}")
+            print(f"   espera en cola media {latencia['media_ms']:.2f} / máx {latencia['max_ms']:.2f} ms | "
+                  f"{nombre} media {servicio['media_ms']:.2f} / máx {servicio['max_ms']:.2f} ms")
@@ -0,0 +1,327 @@
+"""
+Esquema de la base de datos SQLite del SCE y migraciones
+Versión del esquema guardada en PRAGMA user_version
+"""
+import sqlite3
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# v1 (original): timestamp TEXT ISO-8601, estado TEXT, sin índices
+# v2: timestamp INTEGER (ms), estado INTEGER -> tabla estados, índice por tiempo
+# v3: tablas de resumen (rollups) a 1 min, 1 h y 1 día
+# v4: columna tanque_id (varios tanques por base); índice y resúmenes por tanque
+ESQUEMA_VERSION = 4
+
+# Enumeración de estados de alarma (id fijo para los estados conocidos)
+ESTADOS = {
+    'NORMAL': 0,
+    'ALERTA_BAJA': 1,
+    'ALERTA_ALTA': 2,
+}
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Resoluciones de las tablas de resumen (ms), de la más fina a la más gruesa
+RESOLUCIONES = {
+    '1min': 60 * 1000,
+    '1h': 3600 * 1000,
+    '1d': 24 * 3600 * 1000,
+}
+VARIABLES_RESUMEN = ('nivel', 'temperatura', 'presion')
+# Conteos de estados de alarma por bucket: columna -> id en ESTADOS
+CONTEOS_ESTADO = {
+    'n_normal': ESTADOS['NORMAL'],
+    'n_alerta_baja': ESTADOS['ALERTA_BAJA'],
+    'n_alerta_alta': ESTADOS['ALERTA_ALTA'],
+}
+
+def fecha_a_ms(fecha):
+    """
+    Convierte un datetime sin zona horaria (hora local, como datetime.now())
+    a milisegundos desde 1970-01-01 00:00 en ese mismo reloj local.
+    Así pd.to_datetime(ms, unit='ms') devuelve exactamente la misma hora local.
+    """
+    return (fecha.replace(tzinfo=None) - _EPOCH) // timedelta(milliseconds=1)
+
+def ms_a_fecha(ms):
+    """Inversa de fecha_a_ms"""
+    return _EPOCH + timedelta(milliseconds=int(ms))
+
+def _tabla_existe(conn, nombre):
+    fila = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (nombre,)
+    ).fetchone()
+    return fila is not None
+
+def _crear_esquema_v2(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS estados (
+            id INTEGER PRIMARY KEY,
+            nombre TEXT UNIQUE NOT NULL
+        )
+    """)
+    cursor.executemany("INSERT OR IGNORE INTO estados (id, nombre) VALUES (?, ?)",
+                       [(i, nombre) for nombre, i in ESTADOS.items()])
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS mediciones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp INTEGER NOT NULL,
+            nivel REAL,
+            temperatura REAL,
+            presion REAL,
+            estado INTEGER REFERENCES estados(id)
+        )
+    """)
+
+def _columnas(cursor, tabla):
+    return [fila[1] for fila in cursor.execute(f"PRAGMA table_info({tabla})")]
+
+def _agregar_tanque_v4(cursor):
+    """Columna tanque_id (0 = gemelo individual) e índice (tanque_id, timestamp)"""
+    if 'tanque_id' not in _columnas(cursor, 'mediciones'):
+        cursor.execute("ALTER TABLE mediciones ADD COLUMN tanque_id INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("DROP INDEX IF EXISTS idx_mediciones_timestamp")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_mediciones_tanque_timestamp "
+                   "ON mediciones(tanque_id, timestamp)")
+    # Vista con el estado como texto, para lecturas/consultas manuales
+    cursor.execute("DROP VIEW IF EXISTS vista_mediciones")
+    cursor.execute("""
+        CREATE VIEW vista_mediciones AS
+        SELECT m.id, m.tanque_id, m.timestamp, m.nivel, m.temperatura, m.presion, e.nombre AS estado
+        FROM mediciones m LEFT JOIN estados e ON e.id = m.estado
+    """)
+
+def _columnas_resumen():
+    """Columnas de datos de una tabla de resumen (sin 'tanque_id' ni 'bucket')"""
+    columnas = ['n']
+    for var in VARIABLES_RESUMEN:
+        columnas += [f'{var}_min', f'{var}_max', f'{var}_suma', f'{var}_suma2']
+    return columnas + list(CONTEOS_ESTADO)
+
+def _crear_resumenes(cursor):
+    """
+    Tablas resumen_<res>: un bucket por tanque y fila,
+    clave = (tanque_id, inicio del bucket en ms). Se recrean vacías.
+    """
+    for res in RESOLUCIONES:
+        definicion = ', '.join(f'{c} INTEGER NOT NULL' if c == 'n' or c in CONTEOS_ESTADO else f'{c} REAL'
+                               for c in _columnas_resumen())
+        cursor.execute(f"DROP TABLE IF EXISTS resumen_{res}")
+        cursor.execute(f"""
+            CREATE TABLE resumen_{res} (
+                tanque_id INTEGER NOT NULL, bucket INTEGER NOT NULL, {definicion},
+                PRIMARY KEY (tanque_id, bucket)
+            )
+        """)
+
+def _rellenar_resumenes(cursor):
+    """Calcula los resúmenes desde las mediciones existentes"""
+    for res, ancho in RESOLUCIONES.items():
+        agregados = ['COUNT(*)']
+        for var in VARIABLES_RESUMEN:
+            agregados += [f'MIN({var})', f'MAX({var})', f'TOTAL({var})', f'TOTAL({var} * {var})']
+        agregados += [f'TOTAL(estado = {i})' for i in CONTEOS_ESTADO.values()]
+        cursor.execute(f"""
+            INSERT OR REPLACE INTO resumen_{res} (tanque_id, bucket, {', '.join(_columnas_resumen())})
+            SELECT tanque_id, (timestamp / {ancho}) * {ancho} AS b, {', '.join(agregados)}
+            FROM mediciones GROUP BY tanque_id, b
+        """)
+
+def migrar_esquema(conn):
+    """
+    Crea o actualiza el esquema hasta ESQUEMA_VERSION
+    Las bases v1 se migran copiando las filas (conservando los id) y
+    compactando el archivo con VACUUM; los resúmenes (v3, por tanque desde
+    v4) se recalculan desde las mediciones existentes. Retorna la versión anterior.
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= ESQUEMA_VERSION:
+        return version
+
+    legado = version < 2 and _tabla_existe(conn, 'mediciones')
+    omitidas = 0
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+    try:
+        if legado:
+            cursor.execute("ALTER TABLE mediciones RENAME TO mediciones_v1")
+        _crear_esquema_v2(cursor)
+        if legado:
+            cursor.execute("""
+                INSERT OR IGNORE INTO estados (nombre)
+                SELECT DISTINCT estado FROM mediciones_v1 WHERE estado IS NOT NULL
+            """)
+            # julianday() entiende ISO-8601; 2440587.5 = julianday('1970-01-01')
+            # Las filas sin timestamp o con uno que julianday() no entiende se omiten
+            total_v1 = cursor.execute("SELECT COUNT(*) FROM mediciones_v1").fetchone()[0]
+            cursor.execute("""
+                INSERT INTO mediciones (id, timestamp, nivel, temperatura, presion, estado)
+                SELECT v.id,
+                       CAST(ROUND((julianday(v.timestamp) - 2440587.5) * 86400000) AS INTEGER),
+                       v.nivel, v.temperatura, v.presion, e.id
+                FROM mediciones_v1 v LEFT JOIN estados e ON e.nombre = v.estado
+                WHERE v.timestamp IS NOT NULL AND julianday(v.timestamp) IS NOT NULL
+            """)
+            omitidas = total_v1 - cursor.rowcount
+            cursor.execute("DROP TABLE mediciones_v1")
+        _agregar_tanque_v4(cursor)
+        _crear_resumenes(cursor)
+        _rellenar_resumenes(cursor)
+        cursor.execute(f"PRAGMA user_version = {ESQUEMA_VERSION}")
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+    if legado:
+        conn.execute("VACUUM")
+    if version > 0 or legado:
+        print(f"🗄️  Base de datos migrada del esquema v{max(version, 1)} al v{ESQUEMA_VERSION}")
+    if omitidas:
+        print(f"⚠️  {omitidas} mediciones v1 omitidas (timestamp nulo o no reconocido)")
+    return version
+
+def cargar_estados(conn):
+    """Diccionario nombre -> id con todos los estados registrados"""
+    return {nombre: i for i, nombre in conn.execute("SELECT id, nombre FROM estados")}
+
+# ==================== RESÚMENES (ROLLUPS) ====================
+def actualizar_resumenes(cursor, filas):
+    """
+    Acumula un lote de filas (timestamp_ms, nivel, temperatura, presion,
+    estado_id, tanque_id) en las tablas de resumen con UPSERT. Se llama
+    dentro de la misma transacción que inserta las mediciones.
+    Los valores faltantes (None/NaN) se ignoran por variable como en
+    _rellenar_resumenes (MIN/MAX/TOTAL de SQL): un bucket sin valores de una
+    variable queda con min/max NULL y sumas 0.
+    """
+    if len(filas) == 0:
+        return
+    datos = np.array(filas, dtype=float)
+    tiempos = datos[:, 0].astype(np.int64)
+    tanques = datos[:, 5].astype(np.int64)
+    columnas = _columnas_resumen()
+    actualizacion = []
+    for c in columnas:
+        # MIN/MAX escalares de SQLite retornan NULL si un argumento es NULL
+        if c.endswith('_min'):
+            actualizacion.append(f'{c} = MIN(COALESCE({c}, excluded.{c}), COALESCE(excluded.{c}, {c}))')
+        elif c.endswith('_max'):
+            actualizacion.append(f'{c} = MAX(COALESCE({c}, excluded.{c}), COALESCE(excluded.{c}, {c}))')
+        else:
+            actualizacion.append(f'{c} = {c} + excluded.{c}')
+
+    for res, ancho in RESOLUCIONES.items():
+        claves, inverso = np.unique(np.column_stack([tanques, tiempos // ancho * ancho]),
+                                    axis=0, return_inverse=True)
+        inverso = inverso.ravel()
+        k = len(claves)
+        agregado = [np.bincount(inverso, minlength=k)]
+        for j, _ in enumerate(VARIABLES_RESUMEN, start=1):
+            validos = np.isfinite(datos[:, j])
+            valores = np.where(validos, datos[:, j], 0.0)
+            # fmin/fmax ignoran NaN; un bucket sin valores válidos queda en ±inf -> NULL
+            minimos = np.full(k, np.inf)
+            maximos = np.full(k, -np.inf)
+            np.fmin.at(minimos, inverso, np.where(validos, valores, np.nan))
+            np.fmax.at(maximos, inverso, np.where(validos, valores, np.nan))
+            agregado += [np.where(np.isfinite(minimos), minimos, None),
+                         np.where(np.isfinite(maximos), maximos, None),
+                         np.bincount(inverso, weights=valores, minlength=k),
+                         np.bincount(inverso, weights=valores * valores, minlength=k)]
+        for id_estado in CONTEOS_ESTADO.values():
+            agregado.append(np.bincount(inverso, weights=datos[:, 4] == id_estado, minlength=k).astype(np.int64))
+
+        # tolist() por columna: tipos de Python para sqlite3 sin convertir valor a valor
+        filas_resumen = list(zip(claves[:, 0].tolist(), claves[:, 1].tolist(),
+                                 *(valores.tolist() for valores in agregado)))
+        cursor.executemany(f"""
+            INSERT INTO resumen_{res} (tanque_id, bucket, {', '.join(columnas)})
+            VALUES ({', '.join('?' * (len(columnas) + 2))})
+            ON CONFLICT(tanque_id, bucket) DO UPDATE SET {', '.join(actualizacion)}
+        """, filas_resumen)
+
+def _acumular(total, parcial):
+    """Combina dos diccionarios de estadísticas agregadas"""
+    for c, v in parcial.items():
+        if v is None:
+            continue
+        if c.endswith('_min'):
+            total[c] = v if total.get(c) is None else min(total[c], v)
+        elif c.endswith('_max'):
+            total[c] = v if total.get(c) is None else max(total[c], v)
+        else:
+            total[c] = total.get(c, 0) + v
+
+def _agregar_tramo(conn, t_ini, t_fin, niveles, tanque_id=0):
+    """
+    Agrega el tramo [t_ini, t_fin) del tanque usando buckets completos de la resolución
+    más gruesa disponible y, en los bordes, resoluciones más finas; lo que
+    queda por debajo de 1 min se lee de mediciones.
+    """
+    total = {}
+    if t_ini >= t_fin:
+        return total
+    if not niveles:
+        agregados = ['COUNT(*)']
+        for var in VARIABLES_RESUMEN:
+            agregados += [f'MIN({var})', f'MAX({var})', f'TOTAL({var})', f'TOTAL({var} * {var})']
+        agregados += [f'TOTAL(estado = {i})' for i in CONTEOS_ESTADO.values()]
+        fila = conn.execute(f"SELECT {', '.join(agregados)} FROM mediciones "
+                            f"WHERE tanque_id = ? AND timestamp >= ? AND timestamp < ?",
+                            (tanque_id, t_ini, t_fin)).fetchone()
+        _acumular(total, dict(zip(_columnas_resumen(), fila)))
+        return total
+
+    res, ancho = niveles[-1]
+    a = -(-t_ini // ancho) * ancho  # primer bucket completo
+    b = t_fin // ancho * ancho  # fin del último bucket completo
+    if a < b:
+        agregados = ['SUM(n)']
+        for var in VARIABLES_RESUMEN:
+            agregados += [f'MIN({var}_min)', f'MAX({var}_max)', f'SUM({var}_suma)', f'SUM({var}_suma2)']
+        agregados += [f'SUM({c})' for c in CONTEOS_ESTADO]
+        fila = conn.execute(f"SELECT {', '.join(agregados)} FROM resumen_{res} "
+                            f"WHERE tanque_id = ? AND bucket >= ? AND bucket < ?",
+                            (tanque_id, a, b)).fetchone()
+        _acumular(total, dict(zip(_columnas_resumen(), fila)))
+        _acumular(total, _agregar_tramo(conn, t_ini, a, niveles[:-1], tanque_id))
+        _acumular(total, _agregar_tramo(conn, b, t_fin, niveles[:-1], tanque_id))
+    else:
+        _acumular(total, _agregar_tramo(conn, t_ini, t_fin, niveles[:-1], tanque_id))
+    return total
+
+def consultar_estadisticas(conn, t_ini, t_fin, tanque_id=0):
+    """
+    Estadísticas exactas de [t_ini, t_fin] (ms) del tanque a partir de los resúmenes
+    Retorna {'n', 'estados': {nombre: n}, variable: {count, mean, std, min, max}}
+    """
+    total = _agregar_tramo(conn, int(t_ini), int(t_fin) + 1, list(RESOLUCIONES.items()), int(tanque_id))
+    n = int(total.get('n', 0))
+    resultado = {'n': n, 'estados': {}}
+    nombres = {i: nombre for nombre, i in ESTADOS.items()}
+    for c, id_estado in CONTEOS_ESTADO.items():
+        resultado['estados'][nombres[id_estado]] = int(total.get(c, 0))
+    for var in VARIABLES_RESUMEN:
+        if n == 0:
+            resultado[var] = {'count': 0, 'mean': None, 'std': None, 'min': None, 'max': None}
+            continue
+        suma, suma2 = total[f'{var}_suma'], total[f'{var}_suma2']
+        media = suma / n
+        # Desviación estándar muestral (ddof=1, como pandas.describe)
+        varianza = max(0.0, (suma2 - suma * media) / (n - 1)) if n > 1 else float('nan')
+        resultado[var] = {'count': n, 'mean': media, 'std': varianza ** 0.5,
+                          'min': total[f'{var}_min'], 'max': total[f'{var}_max']}
+    return resultado
+
+def elegir_resolucion(t_ini, t_fin, puntos):
+    """
+    Resolución más gruesa que aún da al menos 'puntos' buckets en el rango
+    (None si hace falta ir a los datos crudos)
+    """
+    elegida = None
+    for res, ancho in RESOLUCIONES.items():
+        if (t_fin - t_ini) / ancho >= puntos:
+            elegida = res
+    return elegida
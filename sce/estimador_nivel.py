@@ -0,0 +1,264 @@
+"""
+Estimador de Nivel - Filtro de Kalman con modelo del tanque
+Estima el nivel h y su velocidad dh/dt usando la dinámica conocida
+del tanque como modelo de proceso:
+
+    dh/dt = (Q_in·válvula - Q_out·bomba) / Área + b
+
+donde b es una deriva desconocida (fugas, error de caudal) que se estima
+como paseo aleatorio. Estado x = [h, b]; cada paso es O(1) con aritmética
+escalar (sin matrices de NumPy).
+
+Las innovaciones (medición - predicción) quedan expuestas para
+detección de fallas: con el modelo correcto la innovación normalizada
+tiene media 0 y desviación 1.
+
+EstimadorNivelFlota aplica el mismo filtro a N tanques con arrays.
+"""
+import os
+import sys
+import math
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from simuladores.buffer_circular import BufferCircular
+
+class EstimadorNivel:
+    """
+    Kalman de 2 estados (nivel, deriva de caudal) con entrada conocida
+    - r: varianza del ruido del sensor (cm²)
+    - q_nivel, q_deriva: ruido de proceso por paso (cm², (cm/s)²)
+    - umbral_innovacion: las mediciones con |innovación| > umbral·σ se
+      descartan (lecturas erráticas); tras 'max_rechazos' seguidos se
+      aceptan igual para volver a sincronizar con la medición
+    """
+    def __init__(self, area, caudal_entrada, caudal_salida, dt=0.1, altura_max=200,
+                 r=0.25, q_nivel=1e-3, q_deriva=1e-6, umbral_innovacion=3.0, max_rechazos=5,
+                 ventana_diagnostico=100):
+        self.area = area  # cm²
+        self.caudal_entrada = caudal_entrada  # L/min
+        self.caudal_salida = caudal_salida  # L/min
+        self.dt = dt  # s
+        self.altura_max = altura_max  # cm
+        self.r = r
+        self.q_nivel = q_nivel
+        self.q_deriva = q_deriva
+        self.umbral_innovacion = umbral_innovacion
+        self.max_rechazos = max_rechazos
+        self.innovaciones = BufferCircular(ventana_diagnostico)  # normalizadas
+        self.reiniciar()
+
+    def reiniciar(self, nivel=None):
+        """Estado inicial (nivel=None: se toma la primera medición)"""
+        self.nivel = nivel
+        self.deriva = 0.0  # cm/s
+        self.tasa = 0.0  # dh/dt estimada (cm/s)
+        self.p11, self.p12, self.p22 = 1.0, 0.0, 1e-4
+        self.innovacion = 0.0  # cm
+        self.innovacion_normalizada = 0.0
+        self.rechazos_seguidos = 0
+        self.n_rechazadas = 0
+        self.n_pasos = 0
+        self.innovaciones.limpiar()
+
+    def tasa_modelo(self, valvula_entrada, bomba_salida):
+        """dh/dt (cm/s) que predice el modelo para el estado de los actuadores"""
+        q_in = (self.caudal_entrada * 1000 / 60) if valvula_entrada else 0  # cm³/s
+        q_out = (self.caudal_salida * 1000 / 60) if bomba_salida else 0  # cm³/s
+        return (q_in - q_out) / self.area
+
+    def paso(self, medicion, valvula_entrada, bomba_salida):
+        """
+        Predicción con el modelo + corrección con la medición (cm)
+        Retorna (nivel estimado, dh/dt estimada)
+        """
+        u = self.tasa_modelo(valvula_entrada, bomba_salida)
+        self.n_pasos += 1
+        if self.nivel is None:
+            self.nivel = float(medicion)
+            self.tasa = u
+            return self.nivel, self.tasa
+
+        # Predicción: h += dt (u + b); P = F P F' + Q
+        dt = self.dt
+        nivel = self.nivel + dt * (u + self.deriva)
+        p11 = self.p11 + 2 * dt * self.p12 + dt * dt * self.p22 + self.q_nivel
+        p12 = self.p12 + dt * self.p22
+        p22 = self.p22 + self.q_deriva
+
+        # Innovación
+        s = p11 + self.r
+        self.innovacion = medicion - nivel
+        self.innovacion_normalizada = self.innovacion / math.sqrt(s)
+        self.innovaciones.agregar(self.innovacion_normalizada)
+
+        rechazar = (abs(self.innovacion_normalizada) > self.umbral_innovacion
+                    and self.rechazos_seguidos < self.max_rechazos)
+        if rechazar:
+            # Lectura errática: solo predicción
+            self.rechazos_seguidos += 1
+            self.n_rechazadas += 1
+        else:
+            self.rechazos_seguidos = 0
+            k1, k2 = p11 / s, p12 / s
+            nivel += k1 * self.innovacion
+            self.deriva += k2 * self.innovacion
+            p22 -= k2 * p12
+            p11, p12 = (1 - k1) * p11, (1 - k1) * p12
+
+        # Límites físicos del tanque
+        self.nivel = min(max(nivel, 0.0), self.altura_max)
+        self.p11, self.p12, self.p22 = p11, p12, p22
+        self.tasa = u + self.deriva
+        return self.nivel, self.tasa
+
+    def diagnostico(self):
+        """
+        Estadísticas de las últimas innovaciones normalizadas
+        Media lejos de 0 o desviación lejos de 1 indican que el modelo no
+        coincide con la planta (fuga, válvula trabada, sensor degradado)
+        """
+        ventana = self.innovaciones.vista()
+        return {
+            'media_innovacion': float(np.mean(ventana)) if len(ventana) else 0.0,
+            'std_innovacion': float(np.std(ventana)) if len(ventana) else 0.0,
+            'deriva_cm_s': self.deriva,
+            'rechazadas': self.n_rechazadas,
+            'pasos': self.n_pasos,
+        }
+
+class EstimadorNivelFlota:
+    """
+    Mismo filtro que EstimadorNivel para N tanques a la vez
+    Cada parámetro del modelo puede ser un valor común o un array con uno
+    por tanque; el estado y la covarianza son arrays y cada paso son unas
+    pocas operaciones de NumPy sobre toda la flota (sin bucles por tanque).
+    """
+    def __init__(self, area, caudal_entrada, caudal_salida, dt=0.1, altura_max=200,
+                 r=0.25, q_nivel=1e-3, q_deriva=1e-6, umbral_innovacion=3.0, max_rechazos=5):
+        forma = np.broadcast(area, caudal_entrada, caudal_salida, altura_max).shape
+        self.n_tanques = forma[0] if forma else 1
+        self.area = np.asarray(area, dtype=float)  # cm²
+        self.caudal_entrada = np.asarray(caudal_entrada, dtype=float)  # L/min
+        self.caudal_salida = np.asarray(caudal_salida, dtype=float)  # L/min
+        self.dt = dt  # s
+        self.altura_max = np.asarray(altura_max, dtype=float)  # cm
+        self.r = r
+        self.q_nivel = q_nivel
+        self.q_deriva = q_deriva
+        self.umbral_innovacion = umbral_innovacion
+        self.max_rechazos = max_rechazos
+        self.reiniciar()
+
+    def reiniciar(self):
+        """Estado inicial: el primer paso toma las mediciones como nivel"""
+        n = self.n_tanques
+        self.nivel = None
+        self.deriva = np.zeros(n)  # cm/s
+        self.tasa = np.zeros(n)  # cm/s
+        self.p11, self.p12, self.p22 = np.ones(n), np.zeros(n), np.full(n, 1e-4)
+        self.innovacion_normalizada = np.zeros(n)
+        self.rechazos_seguidos = np.zeros(n, dtype=np.int64)
+        self.n_rechazadas = 0
+        self.n_pasos = 0
+        # Momentos de las innovaciones normalizadas (para diagnostico)
+        self._suma_innovacion = 0.0
+        self._suma2_innovacion = 0.0
+
+    def tasa_modelo(self, valvulas_entrada, bombas_salida):
+        """dh/dt (cm/s) que predice el modelo para cada tanque"""
+        q_in = np.where(valvulas_entrada, self.caudal_entrada * 1000 / 60, 0)  # cm³/s
+        q_out = np.where(bombas_salida, self.caudal_salida * 1000 / 60, 0)  # cm³/s
+        return (q_in - q_out) / self.area
+
+    def paso(self, mediciones, valvulas_entrada, bombas_salida):
+        """
+        Predicción + corrección para todos los tanques (mediciones en cm)
+        Retorna (niveles estimados, dh/dt estimadas) como arrays
+        """
+        mediciones = np.asarray(mediciones, dtype=float)
+        u = self.tasa_modelo(valvulas_entrada, bombas_salida)
+        self.n_pasos += 1
+        if self.nivel is None:
+            self.nivel = mediciones.copy()
+            self.tasa = u
+            return self.nivel, self.tasa
+
+        dt = self.dt
+        nivel = self.nivel + dt * (u + self.deriva)
+        p11 = self.p11 + 2 * dt * self.p12 + dt * dt * self.p22 + self.q_nivel
+        p12 = self.p12 + dt * self.p22
+        p22 = self.p22 + self.q_deriva
+
+        s = p11 + self.r
+        innovacion = mediciones - nivel
+        self.innovacion_normalizada = innovacion / np.sqrt(s)
+        self._suma_innovacion += float(self.innovacion_normalizada.sum())
+        self._suma2_innovacion += float(np.dot(self.innovacion_normalizada, self.innovacion_normalizada))
+
+        rechazar = ((np.abs(self.innovacion_normalizada) > self.umbral_innovacion)
+                    & (self.rechazos_seguidos < self.max_rechazos))
+        self.rechazos_seguidos = np.where(rechazar, self.rechazos_seguidos + 1, 0)
+        self.n_rechazadas += int(rechazar.sum())
+
+        # Corrección solo en los tanques con medición aceptada (ganancia 0 en el resto)
+        k1 = np.where(rechazar, 0.0, p11 / s)
+        k2 = np.where(rechazar, 0.0, p12 / s)
+        nivel += k1 * innovacion
+        self.deriva = self.deriva + k2 * innovacion
+        p22 = p22 - k2 * p12
+        p11, p12 = (1 - k1) * p11, (1 - k1) * p12
+
+        self.nivel = np.clip(nivel, 0.0, self.altura_max)
+        self.p11, self.p12, self.p22 = p11, p12, p22
+        self.tasa = u + self.deriva
+        return self.nivel, self.tasa
+
+    def diagnostico(self):
+        """Media y desviación de las innovaciones normalizadas de toda la flota"""
+        n = max(1, self.n_tanques * (self.n_pasos - 1))
+        media = self._suma_innovacion / n
+        return {
+            'media_innovacion': media,
+            'std_innovacion': max(0.0, self._suma2_innovacion / n - media * media) ** 0.5,
+            'rechazadas': self.n_rechazadas,
+            'pasos': self.n_pasos * self.n_tanques,
+        }
+
+# ==================== PRUEBA RÁPIDA ====================
+if __name__ == "__main__":
+    from simuladores.simulador_tanque import TanqueSimulado, SensorUltrasonico
+    from sce.filtros import PromedioMovil
+
+    print("🧪 Estimador vs promedio móvil de 5 muestras (llenado y vaciado, dt=0.1 s)...")
+    tanque = TanqueSimulado(altura_max=200, diametro=100, caudal_entrada=300, caudal_salida=200)
+    sensor = SensorUltrasonico(altura_instalacion=200, modo_latencia='ninguna', semilla=0)
+    estimador = EstimadorNivel(tanque.area, tanque.Q_in, tanque.Q_out, dt=0.1)
+    promedio = PromedioMovil(5)
+
+    reales, tasas_reales, estimados, tasas, promedios = [], [], [], [], []
+    for k in range(6000):
+        # Ciclos de llenado (válvula) y vaciado (bomba) cada 100 s
+        llenando = (k // 1000) % 2 == 0
+        tanque.set_valvula_entrada(llenando)
+        tanque.set_bomba_salida(not llenando)
+        nivel_previo = tanque.nivel_actual
+        tanque.actualizar(dt=0.1)
+        medicion = 200 - sensor.medir_distancia(tanque.nivel_actual)
+
+        nivel, tasa = estimador.paso(float(medicion), llenando, not llenando)
+        reales.append(tanque.nivel_actual)
+        tasas_reales.append((tanque.nivel_actual - nivel_previo) / 0.1)
+        estimados.append(nivel)
+        tasas.append(tasa)
+        promedios.append(promedio.actualizar(medicion))
+
+    reales = np.array(reales)
+    for nombre, serie in (("Promedio móvil 5", promedios), ("Estimador Kalman", estimados)):
+        error = np.array(serie) - reales
+        print(f"{nombre:18} | RMSE {np.sqrt(np.mean(error**2)):.3f} cm | "
+              f"sesgo {np.mean(error):+.3f} cm | error máx {np.max(np.abs(error)):.2f} cm")
+    error_tasa = np.array(tasas) - np.array(tasas_reales)
+    print(f"dh/dt estimada     | RMSE {np.sqrt(np.mean(error_tasa**2)):.4f} cm/s")
+    print(f"Diagnóstico: {estimador.diagnostico()}")
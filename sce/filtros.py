@@ -0,0 +1,288 @@
+"""
+Filtros Digitales en Streaming - SCE
+Cada filtro procesa una muestra por llamada en O(1) (actualizar) y tiene
+una versión por lotes (filtrar_lote) que produce el mismo resultado que
+llamar a actualizar muestra a muestra, para reprocesar datos guardados.
+
+Especificación textual (crear_filtro):
+    'ninguno'                 sin filtrar
+    'promedio:N'              promedio móvil de N muestras
+    'exponencial:ALFA'        suavizado exponencial
+    'mediana:N'               mediana de N muestras (rechazo de picos)
+    'kalman:Q:R'              Kalman escalar (Q = ruido de proceso, R = de medición)
+    'mediana:5+kalman'        cadena: se aplican de izquierda a derecha
+"""
+import os
+import sys
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import lfilter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from simuladores.buffer_circular import BufferCircular
+
+class FiltroBase:
+    """Interfaz común de los filtros"""
+    def actualizar(self, x):
+        raise NotImplementedError("Método debe ser implementado por subclase")
+
+    def filtrar_lote(self, xs):
+        """Por defecto aplica actualizar muestra a muestra"""
+        return np.array([self.actualizar(x) for x in np.asarray(xs, dtype=float)])
+
+    def reiniciar(self):
+        pass
+
+class FiltroNulo(FiltroBase):
+    """Deja pasar la señal sin cambios"""
+    def actualizar(self, x):
+        return float(x)
+
+    def filtrar_lote(self, xs):
+        return np.asarray(xs, dtype=float).copy()
+
+class PromedioMovil(FiltroBase):
+    """
+    Promedio de las últimas 'ventana' muestras con suma acumulada:
+    suma += nueva - saliente (mientras la ventana no está llena se
+    promedian las muestras disponibles)
+    """
+    def __init__(self, ventana=5):
+        if ventana < 1:
+            raise ValueError(f"❌ Ventana inválida: {ventana}")
+        self.ventana = ventana
+        self.historia = BufferCircular(ventana)
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.historia.limpiar()
+        self.suma = 0.0
+
+    def actualizar(self, x):
+        if self.historia.lleno:
+            self.suma -= self.historia.vista()[0]
+        self.historia.agregar(x)
+        self.suma += x
+        return self.suma / len(self.historia)
+
+    def filtrar_lote(self, xs):
+        xs = np.asarray(xs, dtype=float)
+        if len(xs) == 0:
+            return xs.copy()
+        # Las muestras previas (estado) se anteponen para continuar la ventana
+        previas = np.array(self.historia.vista())
+        serie = np.concatenate([previas, xs])
+        acumulada = np.concatenate([[0.0], np.cumsum(serie)])
+        fin = np.arange(len(previas) + 1, len(serie) + 1)
+        inicio = np.maximum(0, fin - self.ventana)
+        resultado = (acumulada[fin] - acumulada[inicio]) / (fin - inicio)
+
+        self.historia.extender(xs)
+        self.suma = float(np.sum(self.historia.vista()))
+        return resultado
+
+class SuavizadoExponencial(FiltroBase):
+    """
+    y[n] = y[n-1] + alfa * (x[n] - y[n-1]); la primera muestra inicializa y
+    Por lotes: filtro IIR de primer orden con scipy.signal.lfilter
+    """
+    def __init__(self, alfa=0.3):
+        if not 0 < alfa <= 1:
+            raise ValueError(f"❌ Alfa inválido: {alfa} (debe estar en (0, 1])")
+        self.alfa = alfa
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.y = None
+
+    def actualizar(self, x):
+        self.y = float(x) if self.y is None else self.y + self.alfa * (x - self.y)
+        return self.y
+
+    def filtrar_lote(self, xs):
+        xs = np.asarray(xs, dtype=float)
+        if len(xs) == 0:
+            return xs.copy()
+        y_previo = xs[0] if self.y is None else self.y
+        resultado, _ = lfilter([self.alfa], [1.0, self.alfa - 1.0], xs,
+                               zi=[(1.0 - self.alfa) * y_previo])
+        self.y = float(resultado[-1])
+        return resultado
+
+class MedianaN(FiltroBase):
+    """
+    Mediana de las últimas N muestras: descarta lecturas erráticas
+    aisladas (picos) sin desplazar la señal. Costo O(N) por muestra
+    con N fijo y pequeño, independiente del largo de la serie.
+    """
+    def __init__(self, n=5):
+        if n < 1:
+            raise ValueError(f"❌ Tamaño de ventana inválido: {n}")
+        self.n = n
+        self.historia = BufferCircular(n)
+
+    def reiniciar(self):
+        self.historia.limpiar()
+
+    def actualizar(self, x):
+        self.historia.agregar(x)
+        return float(np.median(self.historia.vista()))
+
+    def filtrar_lote(self, xs):
+        xs = np.asarray(xs, dtype=float)
+        if len(xs) == 0:
+            return xs.copy()
+        previas = np.array(self.historia.vista())
+        serie = np.concatenate([previas, xs])
+        resultado = np.empty(len(xs))
+
+        # Ventanas incompletas al comienzo (como mucho n-1 muestras): mediana
+        # de las muestras disponibles, igual que actualizar al arrancar
+        incompletas = min(len(xs), max(0, self.n - 1 - len(previas)))
+        for i in range(incompletas):
+            resultado[i] = np.median(serie[:len(previas) + i + 1])
+        # Resto: todas las ventanas completas a la vez (si hay alguna)
+        if incompletas < len(xs):
+            ventanas = sliding_window_view(serie, self.n)
+            resultado[incompletas:] = np.median(ventanas[len(ventanas) - (len(xs) - incompletas):], axis=1)
+
+        self.historia.extender(xs)
+        return resultado
+
+class FiltroKalman(FiltroBase):
+    """
+    Kalman escalar con modelo de paseo aleatorio
+        predicción:   P = P + Q
+        corrección:   K = P / (P + R);  x = x + K (z - x);  P = (1 - K) P
+    La ganancia no depende de los datos: por lotes se calcula hasta que
+    converge y el resto se resuelve como un IIR de primer orden (lfilter).
+    """
+    def __init__(self, q=0.01, r=0.25, p0=1.0):
+        if not r > 0:
+            raise ValueError(f"❌ Varianza de medición inválida: {r} (debe ser > 0)")
+        if not q >= 0:
+            raise ValueError(f"❌ Varianza de proceso inválida: {q} (debe ser >= 0)")
+        if not p0 >= 0:
+            raise ValueError(f"❌ Varianza inicial inválida: {p0} (debe ser >= 0)")
+        self.q = q  # varianza del ruido de proceso
+        self.r = r  # varianza del ruido de medición
+        self.p0 = p0
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.x = None
+        self.p = self.p0
+        self.k = 0.0
+
+    def actualizar(self, z):
+        if self.x is None:
+            self.x = float(z)
+            return self.x
+        self.p += self.q
+        self.k = self.p / (self.p + self.r)
+        self.x += self.k * (z - self.x)
+        self.p *= 1 - self.k
+        return self.x
+
+    def filtrar_lote(self, zs):
+        zs = np.asarray(zs, dtype=float)
+        resultado = np.empty(len(zs))
+        i = 0
+        if self.x is None and len(zs):
+            self.x = resultado[0] = float(zs[0])
+            i = 1
+        # Transitorio: hasta que la ganancia converge
+        while i < len(zs):
+            k_anterior = self.k
+            resultado[i] = self.actualizar(zs[i])
+            i += 1
+            if abs(self.k - k_anterior) < 1e-12:
+                break
+        # Régimen permanente: x[n] = (1-K) x[n-1] + K z[n]
+        if i < len(zs):
+            resultado[i:], _ = lfilter([self.k], [1.0, self.k - 1.0], zs[i:],
+                                       zi=[(1.0 - self.k) * self.x])
+            self.x = float(resultado[-1])
+        return resultado
+
+class CadenaFiltros(FiltroBase):
+    """Aplica varios filtros en serie (p. ej. mediana y luego Kalman)"""
+    def __init__(self, filtros):
+        self.filtros = list(filtros)
+
+    def reiniciar(self):
+        for filtro in self.filtros:
+            filtro.reiniciar()
+
+    def actualizar(self, x):
+        for filtro in self.filtros:
+            x = filtro.actualizar(x)
+        return x
+
+    def filtrar_lote(self, xs):
+        for filtro in self.filtros:
+            xs = filtro.filtrar_lote(xs)
+        return xs
+
+# Nombre -> (clase, tipos de los parámetros)
+FILTROS = {
+    'ninguno': (FiltroNulo, ()),
+    'promedio': (PromedioMovil, (int,)),
+    'exponencial': (SuavizadoExponencial, (float,)),
+    'mediana': (MedianaN, (int,)),
+    'kalman': (FiltroKalman, (float, float)),
+}
+
+def crear_filtro(especificacion):
+    """Crea un filtro (o una cadena con '+') a partir de su especificación textual"""
+    if isinstance(especificacion, FiltroBase):
+        return especificacion
+    etapas = []
+    for parte in especificacion.split('+'):
+        nombre, *parametros = parte.strip().split(':')
+        if nombre not in FILTROS:
+            raise ValueError(f"❌ Filtro desconocido: {nombre} (opciones: {', '.join(FILTROS)})")
+        clase, tipos = FILTROS[nombre]
+        if len(parametros) > len(tipos):
+            raise ValueError(f"❌ Demasiados parámetros para '{nombre}': {parte}")
+        try:
+            etapas.append(clase(*(tipo(p) for tipo, p in zip(tipos, parametros))))
+        except ValueError as e:
+            raise ValueError(f"❌ Parámetros inválidos en '{parte}': {e}") from e
+    return etapas[0] if len(etapas) == 1 else CadenaFiltros(etapas)
+
+# ==================== PRUEBA RÁPIDA ====================
+if __name__ == "__main__":
+    from simuladores.simulador_tanque import SensorUltrasonico
+
+    print("🧪 Comparación de filtros (nivel en rampa + ruido + 5% erráticas)...")
+    n = 20000
+    nivel_real = 100 + 30 * np.sin(np.linspace(0, 6 * np.pi, n))
+    sensor = SensorUltrasonico(altura_instalacion=200, modo_latencia='ninguna', semilla=0)
+    medido = 200 - sensor.medir_distancias(nivel_real)
+
+    print(f"{'Filtro':28} | {'RMSE (cm)':>9} | {'Error máx':>9} | Lote = streaming")
+    for especificacion in ('ninguno', 'promedio:5', 'exponencial:0.3', 'mediana:5',
+                           'kalman:0.01:0.25', 'mediana:5+kalman:0.01:0.25'):
+        streaming = crear_filtro(especificacion)
+        salida = np.array([streaming.actualizar(z) for z in medido])
+        lote = crear_filtro(especificacion)
+        salida_lote = np.concatenate([lote.filtrar_lote(medido[:777]), lote.filtrar_lote(medido[777:])])
+        error = salida - nivel_real
+        iguales = np.allclose(salida, salida_lote, rtol=0, atol=1e-9)
+        print(f"{especificacion:28} | {np.sqrt(np.mean(error**2)):9.3f} | {np.max(np.abs(error)):9.2f} | "
+              f"{'✅' if iguales else '❌'}")
+
+    print("\n🧪 Lotes más cortos que la ventana (arranque en frío)...")
+    for especificacion in ('mediana:5', 'mediana:5+kalman:0.01:0.25', 'promedio:5'):
+        for cortes in ((1,), (3,), (2, 1, 1), (1, 1, 1, 1, 1, 1), (4, 3)):
+            streaming = crear_filtro(especificacion)
+            lote = crear_filtro(especificacion)
+            muestras = medido[:sum(cortes)]
+            salida = np.array([streaming.actualizar(z) for z in muestras])
+            limites = np.cumsum((0,) + cortes)
+            salida_lote = np.concatenate([lote.filtrar_lote(muestras[a:b])
+                                          for a, b in zip(limites[:-1], limites[1:])])
+            iguales = np.allclose(salida, salida_lote, rtol=0, atol=1e-9)
+            print(f"   {especificacion:28} lotes {cortes}: {'✅' if iguales else '❌'}")
@@ -0,0 +1,336 @@
+"""
+Flota Distribuida - Gemelos en varios procesos
+Reparte los tanques en fragmentos contiguos, uno por proceso. Cada
+proceso corre su propio PlanificadorCiclico sobre su fragmento
+(SistemaMultiGemelo), así el GIL deja de ser un límite.
+
+Intercambio por memoria compartida (sin mensajes serializados):
+- Un array de NumPy (2, campos, N) en multiprocessing.shared_memory;
+  cada proceso escribe solo sus columnas [inicio, fin)
+- En cada ejecución de T3 (cada 10 frames) el proceso publica su
+  instantánea en el buffer s % 2 y espera en una barrera común
+- El coordinador pasa la misma barrera, lee el buffer s % 2 completo y
+  agrega alarmas y almacenamiento mientras los procesos siguen con el
+  próximo período escribiendo en el otro buffer (doble buffer)
+"""
+import io
+import os
+import sys
+import time
+import contextlib
+import logging
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from threading import BrokenBarrierError
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from sce.multi_gemelo import SistemaMultiGemelo, PARAMETROS_TANQUE
+from sce.sce_gemelo_digital import PlanificadorCiclico, AlmacenamientoLocal, parsear_modo_ejecucion, logger
+from sce.esquema_bd import ESTADOS
+from sce.reloj import POLITICAS_OVERRUN
+
+# Campos de la instantánea (filas del array compartido)
+CAMPOS_INSTANTANEA = ('nivel_estimado', 'tasa_estimada', 'nivel_medido', 'estado', 'temperatura', 'presion')
+CAMPO = {campo: i for i, campo in enumerate(CAMPOS_INSTANTANEA)}
+# s de espera máxima en una barrera (si un proceso muere, los demás no quedan colgados)
+TIMEOUT_SINCRONIZACION = 60.0
+
+class FragmentoFlota(SistemaMultiGemelo):
+    """
+    Fragmento de la flota dentro de un proceso
+    T3 no escribe en SQLite: copia el estado a la memoria compartida y
+    espera a los demás procesos y al coordinador en la barrera.
+    """
+    def __init__(self, n_tanques, instantaneas, inicio, barrera, **kwargs):
+        self.instantaneas = instantaneas  # vista (2, campos, N total) de la memoria compartida
+        self.inicio = inicio  # primera columna del fragmento
+        self.barrera = barrera
+        super().__init__(n_tanques, **kwargs)
+
+    def _configurar_almacenamiento(self, db_file):
+        """Sin base de datos: guarda el coordinador"""
+        self.db = None
+        self.db_file = None
+
+    def tarea_almacenamiento(self):
+        """T3: publicar la instantánea del fragmento y sincronizar"""
+        sincronizacion = self.scheduler.frame_actual // self.scheduler.tareas['T3'].periodo
+        destino = self.instantaneas[sincronizacion % 2, :, self.inicio:self.inicio + self.n_tanques]
+        destino[CAMPO['nivel_estimado']] = self.nivel_estimado
+        destino[CAMPO['tasa_estimada']] = self.tasa_estimada
+        destino[CAMPO['nivel_medido']] = self.nivel_medido
+        destino[CAMPO['estado']] = self.controlador.estado
+        destino[CAMPO['temperatura']] = self.temp_actual
+        destino[CAMPO['presion']] = self.presion_actual
+        self.barrera.wait(TIMEOUT_SINCRONIZACION)
+
+def _ejecutar_fragmento(indice, inicio, parametros, tanque_ids, modo, frames_totales,
+                        nombre_memoria, forma, barrera, cola, perfilar, semilla, ritmo):
+    """Cuerpo de cada proceso: construye su fragmento y corre su ejecutivo cíclico"""
+    memoria = shared_memory.SharedMemory(name=nombre_memoria)
+    try:
+        # SensorAmbiental usa el generador global: cada proceso con su propia secuencia
+        np.random.seed(None if semilla is None else semilla + indice)
+        resultado = _bucle_fragmento(indice, inicio, parametros, tanque_ids, modo, frames_totales,
+                                     np.ndarray(forma, dtype=np.float64, buffer=memoria.buf),
+                                     barrera, perfilar, semilla, ritmo)
+        cola.put(resultado)
+    except BrokenBarrierError:
+        cola.put({'indice': indice, 'error': 'barrera rota'})
+    except Exception as e:
+        # Romper la barrera: los demás procesos y el coordinador no esperan el timeout
+        barrera.abort()
+        cola.put({'indice': indice, 'error': repr(e)})
+        raise
+    finally:
+        memoria.close()
+
+def _bucle_fragmento(indice, inicio, parametros, tanque_ids, modo, frames_totales, instantaneas,
+                     barrera, perfilar, semilla, ritmo):
+    # Los mensajes de inicialización los da el coordinador (no uno por proceso)
+    with contextlib.redirect_stdout(io.StringIO()):
+        sistema = FragmentoFlota(len(tanque_ids), instantaneas, inicio, barrera, modo=modo,
+                                 tanque_ids=tanque_ids, perfilar=perfilar,
+                                 semilla=None if semilla is None else semilla + indice, **ritmo, **parametros)
+    T_menor = sistema.scheduler.T_menor
+    barrera.wait(TIMEOUT_SINCRONIZACION)  # todos listos: arranque común
+
+    t_real_inicio = time.monotonic()
+    reloj = sistema.reloj
+    medir_jitter = perfilar and reloj is not None
+    if reloj is not None:
+        reloj.iniciar()
+    for _ in range(frames_totales):
+        inicio_programado = reloj.programado_ns if medir_jitter else None
+        sistema.scheduler.ejecutar_frame(sistema, inicio_programado)
+        sistema.tiempo_sim += T_menor
+        if reloj is not None:
+            reloj.esperar()
+
+    perfilador = sistema.scheduler.perfilador
+    return {
+        'indice': indice,
+        'tanques': sistema.n_tanques,
+        't_real': time.monotonic() - t_real_inicio,
+        'diagnostico': sistema.estimador.diagnostico(),
+        'perfil': perfilador.reporte() if perfilador is not None else None,
+        'reloj': reloj.resumen() if reloj is not None else None,
+    }
+
+class CoordinadorFlota:
+    """
+    Reparte N tanques en 'n_procesos' procesos y agrega sus resultados
+    - almacenar: el coordinador es el único escritor de SQLite (guardar_lote
+      con toda la flota en cada sincronización)
+    - Los parámetros por tanque son los de SistemaMultiGemelo
+    """
+    def __init__(self, n_tanques, n_procesos=None, modo='scaled:10', db_file=None, almacenar=True,
+                 perfilar=False, semilla=None, politica_overrun='recuperar', spin_s=0.001, **parametros):
+        desconocidos = set(parametros) - set(PARAMETROS_TANQUE)
+        if desconocidos:
+            raise ValueError(f"❌ Parámetros desconocidos: {', '.join(sorted(desconocidos))} "
+                             f"(opciones: {', '.join(PARAMETROS_TANQUE)})")
+        self.n_procesos = min(n_procesos or os.cpu_count() or 1, n_tanques)
+        if self.n_procesos < 1:
+            raise ValueError(f"❌ Cantidad de procesos inválida: {n_procesos}")
+        self.n_tanques = n_tanques
+        self.modo = modo
+        self.factor_tiempo = parsear_modo_ejecucion(modo)
+        self.perfilar = perfilar
+        self.semilla = semilla
+        # Reloj de cada proceso (se valida aquí para fallar antes de lanzar los procesos)
+        if politica_overrun not in POLITICAS_OVERRUN:
+            raise ValueError(f"❌ Política de overrun desconocida: {politica_overrun} "
+                             f"(opciones: {', '.join(POLITICAS_OVERRUN)})")
+        if spin_s < 0:
+            raise ValueError(f"❌ Margen de espera activa inválido: {spin_s}")
+        self.ritmo = {'politica_overrun': politica_overrun, 'spin_s': spin_s}
+        self.config = {nombre: np.broadcast_to(np.asarray(parametros.get(nombre, defecto), dtype=float),
+                                               (n_tanques,)).copy()
+                       for nombre, defecto in PARAMETROS_TANQUE.items()}
+        self.tanque_ids = np.arange(1, n_tanques + 1)
+        # Fragmentos contiguos de tamaño parecido: (inicio, fin)
+        cortes = np.linspace(0, n_tanques, self.n_procesos + 1).astype(int)
+        self.fragmentos = list(zip(cortes[:-1], cortes[1:]))
+
+        self.almacenar = almacenar
+        if db_file is None:
+            base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+            db_file = os.path.join(base_dir, "datos", "datos_flota.db")
+        self.db_file = db_file
+
+        # Agregados de alarmas
+        self.estados = np.full(n_tanques, ESTADOS['NORMAL'], dtype=np.int64)
+        self.activaciones = 0  # tanques que entraron en alarma
+        self.resultados = []
+
+    def _procesar(self, instantanea, timestamp):
+        """Agrega alarmas y guarda la instantánea completa de la flota"""
+        estados = instantanea[CAMPO['estado']].astype(np.int64)
+        normal = ESTADOS['NORMAL']
+        nuevas = np.flatnonzero((estados != normal) & (self.estados == normal))
+        despejadas = np.count_nonzero((estados == normal) & (self.estados != normal))
+        if len(nuevas) or despejadas:
+            ejemplo = ', '.join(str(t) for t in self.tanque_ids[nuevas[:5]])
+            logger.debug(f"⚠️  Alarmas: +{len(nuevas)} (tanques {ejemplo}{'...' if len(nuevas) > 5 else ''}) "
+                         f"| despejadas {despejadas} | activas {np.count_nonzero(estados != normal)}")
+        self.activaciones += len(nuevas)
+        self.estados = estados
+
+        if self.db is not None:
+            self.db.guardar_lote(instantanea[CAMPO['nivel_estimado']], instantanea[CAMPO['temperatura']],
+                                 instantanea[CAMPO['presion']], estados, self.tanque_ids, timestamp=timestamp)
+
+    def ejecutar(self, duracion_segundos=60):
+        """Lanza los procesos, agrega cada sincronización y retorna un resumen"""
+        scheduler = PlanificadorCiclico()
+        frames_totales = int(duracion_segundos / scheduler.T_menor)
+        t3 = scheduler.tareas['T3']
+        n_sincronizaciones = max(0, -(-(frames_totales - t3.desfase) // t3.periodo))
+
+        print(f"\n🚀 {self.n_tanques} tanques en {self.n_procesos} procesos por {duracion_segundos} s "
+              f"(modo: {self.modo})...")
+        print("=" * 70)
+
+        forma = (2, len(CAMPOS_INSTANTANEA), self.n_tanques)
+        memoria = shared_memory.SharedMemory(create=True, size=int(np.prod(forma)) * 8)
+        instantaneas = np.ndarray(forma, dtype=np.float64, buffer=memoria.buf)
+        self.db = (AlmacenamientoLocal(self.db_file, tam_lote=self.n_tanques)
+                   if self.almacenar else None)
+        barrera = mp.Barrier(self.n_procesos + 1)
+        cola = mp.Queue()
+        procesos = []
+        for indice, (inicio, fin) in enumerate(self.fragmentos):
+            parametros = {nombre: valores[inicio:fin] for nombre, valores in self.config.items()}
+            proceso = mp.Process(
+                target=_ejecutar_fragmento, name=f"fragmento-{indice}", daemon=True,
+                args=(indice, inicio, parametros, self.tanque_ids[inicio:fin], self.modo, frames_totales,
+                      memoria.name, forma, barrera, cola, self.perfilar, self.semilla, self.ritmo),
+            )
+            proceso.start()
+            procesos.append(proceso)
+
+        t_inicio = datetime.now()
+        t_procesar = 0.0
+        try:
+            barrera.wait(TIMEOUT_SINCRONIZACION)  # arranque común
+            t_real_inicio = time.monotonic()
+            for s in range(n_sincronizaciones):
+                barrera.wait(TIMEOUT_SINCRONIZACION)
+                t0 = time.perf_counter()
+                self._procesar(instantaneas[s % 2],
+                               t_inicio + timedelta(seconds=(s * t3.periodo + t3.desfase) * scheduler.T_menor))
+                t_procesar += time.perf_counter() - t0
+            self.resultados = sorted((cola.get(timeout=TIMEOUT_SINCRONIZACION) for _ in procesos),
+                                     key=lambda r: r['indice'])
+            t_real = time.monotonic() - t_real_inicio
+            for proceso in procesos:
+                proceso.join()
+        except BrokenBarrierError:
+            raise RuntimeError("❌ Un proceso de la flota no llegó a la sincronización") from None
+        finally:
+            barrera.abort()
+            for proceso in procesos:
+                if proceso.is_alive():
+                    proceso.terminate()
+            if self.db is not None:
+                self.db.cerrar()
+            del instantaneas
+            memoria.close()
+            memoria.unlink()
+
+        errores = [r for r in self.resultados if 'error' in r]
+        if errores:
+            raise RuntimeError(f"❌ Fragmentos con error: {', '.join(str(r['indice']) for r in errores)}")
+
+        resumen = {
+            'tanques': self.n_tanques,
+            'procesos': self.n_procesos,
+            'frames': frames_totales,
+            't_real': t_real,
+            'tanque_frames_por_s': frames_totales * self.n_tanques / max(t_real, 1e-9),
+            'coordinador_ms': 1000 * t_procesar / max(1, n_sincronizaciones),
+            'activaciones': self.activaciones,
+        }
+        print("=" * 70)
+        print("✅ Simulación completada")
+        print(f"⏱️  {frames_totales * scheduler.T_menor:.1f} s simulados en {t_real:.2f} s reales | "
+              f"{resumen['tanque_frames_por_s']:,.0f} tanque·frames/s | "
+              f"coordinador {resumen['coordinador_ms']:.2f} ms por sincronización")
+        print(f"⚠️  Alarmas activadas: {self.activaciones} | activas al final: "
+              f"{np.count_nonzero(self.estados != ESTADOS['NORMAL'])}")
+        for r in self.resultados:
+            linea = (f"   Proceso {r['indice']}: {r['tanques']} tanques | "
+                     f"{frames_totales / max(r['t_real'], 1e-9):.0f} frames/s")
+            if r['perfil'] is not None:
+                frame = next(f for f in r['perfil']['tiempos'] if f['ambito'] == 'frame')
+                linea += (f" | frame medio {frame['media_ms']:.3f} ms, máx {frame['max_ms']:.3f} ms"
+                          f" | overruns {r['perfil']['overruns']}")
+            if r['reloj'] is not None:
+                linea += (f" | jitter de período p99 {r['reloj']['jitter_periodo']['p99_ms']:.3f} ms"
+                          f" | saltados {r['reloj']['saltados']}")
+            print(linea)
+        if self.db is not None:
+            stats = self.db.estadisticas()
+            print(f"💾 {stats['filas']} filas en {stats['flushes']} lotes | "
+                  f"flush medio {stats['flush_medio_ms']:.2f} ms | {self.db_file}")
+        return resumen
+
+# ==================== EJECUCIÓN ====================
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Gemelo Digital SCE - Flota en varios procesos')
+    parser.add_argument('-n', '--tanques', type=int, default=1000,
+                        help='Cantidad de tanques (default: 1000)')
+    parser.add_argument('-p', '--procesos', type=int, default=None,
+                        help='Procesos de simulación (default: núcleos disponibles)')
+    parser.add_argument('-t', '--tiempo', type=int, default=60,
+                        help='Duración de la simulación en segundos (default: 60)')
+    parser.add_argument('-m', '--modo', default='scaled:10',
+                        help="Modo de ejecución: realtime, scaled:<factor> o "
+                             "as-fast-as-possible (default: scaled:10)")
+    parser.add_argument('--db', default=None,
+                        help='Base de datos SQLite (default: datos/datos_flota.db)')
+    parser.add_argument('--sin-almacenamiento', action='store_true',
+                        help='No guardar en SQLite (medir solo la simulación)')
+    parser.add_argument('--perfil', action='store_true',
+                        help='Medir tiempos del planificador en cada proceso')
+    parser.add_argument('--overrun', choices=POLITICAS_OVERRUN, default='recuperar',
+                        help='Ante un frame atrasado: recuperar o saltar (default: recuperar)')
+    parser.add_argument('--spin', type=float, default=1.0,
+                        help='Margen de espera activa antes de cada plazo, en ms (default: 1.0)')
+    parser.add_argument('--escalado', action='store_true',
+                        help='Medir el rendimiento con 1, 2, 4, ... procesos (as-fast-as-possible, '
+                             'sin almacenamiento)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Mostrar también los mensajes de depuración (alarmas)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format='%(message)s')
+
+    if args.escalado:
+        maximo = args.procesos or os.cpu_count() or 1
+        procesos = sorted({min(2**k, maximo) for k in range(maximo.bit_length() + 1)})
+        filas = []
+        for n_procesos in procesos:
+            resumen = CoordinadorFlota(args.tanques, n_procesos=n_procesos, modo='as-fast-as-possible',
+                                       almacenar=False).ejecutar(args.tiempo)
+            filas.append(resumen)
+        base = filas[0]['tanque_frames_por_s']
+        print(f"\n📈 Escalado ({args.tanques} tanques, {os.cpu_count()} núcleos)")
+        for r in filas:
+            print(f"   {r['procesos']:3d} procesos | {r['tanque_frames_por_s']:>14,.0f} tanque·frames/s | "
+                  f"x{r['tanque_frames_por_s'] / base:.2f}")
+    else:
+        try:
+            coordinador = CoordinadorFlota(args.tanques, n_procesos=args.procesos, modo=args.modo,
+                                           db_file=args.db, almacenar=not args.sin_almacenamiento,
+                                           perfilar=args.perfil, politica_overrun=args.overrun,
+                                           spin_s=args.spin / 1000)
+        except ValueError as e:
+            parser.error(str(e))
+        coordinador.ejecutar(args.tiempo)
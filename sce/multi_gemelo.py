@@ -0,0 +1,304 @@
+"""
+Gemelo Digital Multi-Tanque
+N tanques bajo un único PlanificadorCiclico: cada tarea procesa toda la
+flota con operaciones de NumPy (sin bucles por tanque)
+- T1: física (FlotaTanques), ultrasonido por lotes, corrección por
+  velocidad del sonido y estimador de nivel vectorizado
+- T2: control con histéresis vectorizado
+- T3: una fila por tanque con tanque_id, en lotes de SQLite; la escritura
+  se reparte entre los frames del período (cada frame guarda una fracción
+  de la flota) para no concentrar todo el costo en un frame
+- T4: resumen de la flota
+
+Configuración por tanque: altura, diámetro, umbrales y caudales pueden
+ser un valor común o una lista con uno por tanque (o un JSON con --config).
+"""
+import os
+import sys
+import json
+import time
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from simuladores.simulador_tanque import FlotaTanques, SensorUltrasonico, SensorAmbiental
+from sce.sce_gemelo_digital import (PlanificadorCiclico, AlmacenamientoLocal, FusionadorDatos,
+                                    LimitadorLog, parsear_modo_ejecucion, avisar_presupuesto,
+                                    V_SONIDO_NOMINAL, logger)
+from sce.estimador_nivel import EstimadorNivelFlota
+from sce.esquema_bd import ESTADOS
+from sce.perfilador import PerfiladorPlanificador, ARCHIVO_PERFIL
+from sce.reloj import RelojCiclico, POLITICAS_OVERRUN
+
+# Parámetros configurables por tanque (nombre -> valor por defecto)
+PARAMETROS_TANQUE = {
+    'altura_max': 200,  # cm
+    'diametro': 100,  # cm
+    'umbral_bajo': 30,  # cm
+    'umbral_alto': 170,  # cm
+    'caudal_entrada': 5,  # L/min
+    'caudal_salida': 3,  # L/min
+    'nivel_inicial': 50,  # cm
+}
+
+class ControladorFlota:
+    """
+    Misma lógica que ControladorNivel (umbrales con histéresis y
+    anticipación) aplicada a todos los tanques con arrays
+    Estados: ids de ESTADOS (NORMAL, ALERTA_BAJA, ALERTA_ALTA)
+    """
+    def __init__(self, umbral_bajo, umbral_alto, histeresis=5, anticipacion=0.0):
+        self.umbral_bajo = np.asarray(umbral_bajo, dtype=float)
+        self.umbral_alto = np.asarray(umbral_alto, dtype=float)
+        self.histeresis = histeresis  # cm
+        self.anticipacion = anticipacion  # s
+        forma = np.broadcast(self.umbral_bajo, self.umbral_alto).shape
+        self.estado = np.full(forma, ESTADOS['NORMAL'], dtype=np.int64)
+
+    def ejecutar(self, niveles, tasas=0.0):
+        """Actualiza el estado de cada tanque; retorna el array de estados"""
+        nivel = niveles + tasas * self.anticipacion
+        baja, alta = ESTADOS['ALERTA_BAJA'], ESTADOS['ALERTA_ALTA']
+        sigue_baja = (self.estado == baja) & (nivel < self.umbral_bajo + self.histeresis)
+        sigue_alta = (self.estado == alta) & (nivel > self.umbral_alto - self.histeresis)
+        self.estado = np.select(
+            [nivel <= self.umbral_bajo, nivel >= self.umbral_alto, sigue_baja, sigue_alta],
+            [baja, alta, baja, alta],
+            default=ESTADOS['NORMAL'],
+        )
+        return self.estado
+
+class SistemaMultiGemelo:
+    """
+    Gemelo digital de una flota de N tanques
+    Expone las mismas tareas que SistemaGemeloDigital, así se reutiliza
+    PlanificadorCiclico (y su perfilador) sin cambios.
+    """
+    def __init__(self, n_tanques, modo='scaled:10', db_file=None, tanque_ids=None,
+                 perfilar=False, semilla=None, politica_overrun='recuperar', spin_s=0.001, **parametros):
+        desconocidos = set(parametros) - set(PARAMETROS_TANQUE)
+        if desconocidos:
+            raise ValueError(f"❌ Parámetros desconocidos: {', '.join(sorted(desconocidos))} "
+                             f"(opciones: {', '.join(PARAMETROS_TANQUE)})")
+        config = {nombre: np.broadcast_to(np.asarray(parametros.get(nombre, defecto), dtype=float),
+                                          (n_tanques,)).copy()
+                  for nombre, defecto in PARAMETROS_TANQUE.items()}
+        print(f"🔧 Inicializando flota de {n_tanques} tanques...")
+
+        self.modo = modo
+        self.factor_tiempo = parsear_modo_ejecucion(modo)
+        self.n_tanques = n_tanques
+        # 0 queda para el gemelo individual: la flota usa 1..N por defecto
+        self.tanque_ids = (np.arange(1, n_tanques + 1) if tanque_ids is None
+                           else np.asarray(tanque_ids, dtype=np.int64))
+        if len(self.tanque_ids) != n_tanques:
+            raise ValueError(f"❌ Se esperaban {n_tanques} tanque_ids, llegaron {len(self.tanque_ids)}")
+
+        # Física y sensores (un sensor ambiental común a la planta)
+        self.flota = FlotaTanques(n_tanques, altura_max=config['altura_max'], diametro=config['diametro'],
+                                  caudal_entrada=config['caudal_entrada'],
+                                  caudal_salida=config['caudal_salida'],
+                                  nivel_inicial=config['nivel_inicial'])
+        modo_latencia = 'real' if self.factor_tiempo == 1.0 else 'virtual'
+        self.sensor_us = SensorUltrasonico(altura_instalacion=self.flota.H_max, modo_latencia=modo_latencia,
+                                           semilla=semilla, velocidad_nominal=V_SONIDO_NOMINAL)
+        self.sensor_amb = SensorAmbiental()
+        # Solo se usan los filtros de temperatura/presión y la corrección de velocidad
+        self.fusionador = FusionadorDatos(filtro_nivel='ninguno')
+        self.estimador = EstimadorNivelFlota(self.flota.area, self.flota.Q_in, self.flota.Q_out,
+                                             dt=0.1, altura_max=self.flota.H_max)
+        self.controlador = ControladorFlota(config['umbral_bajo'], config['umbral_alto'], anticipacion=0.5)
+
+        self.scheduler = PlanificadorCiclico(factor_tiempo=self.factor_tiempo)
+        self._configurar_almacenamiento(db_file)
+        self.reloj = (None if self.factor_tiempo == float('inf') else
+                      RelojCiclico(self.scheduler.presupuesto_s, politica=politica_overrun, spin_s=spin_s))
+        if perfilar:
+            self.scheduler.perfilador = PerfiladorPlanificador(self.scheduler.presupuesto_s,
+                                                               self.scheduler.frames_ciclo)
+            self.scheduler.perfilador.reloj = self.reloj
+        avisar_presupuesto(self.scheduler, modo)
+
+        # Variables de estado (arrays de N)
+        self.temp_actual = 25.0
+        self.presion_actual = 1013.0
+        self.nivel_medido = self.flota.nivel_actual.copy()
+        self.nivel_estimado = self.flota.nivel_actual.copy()
+        self.tasa_estimada = np.zeros(n_tanques)
+        self._en_alarma = 0
+
+        self.tiempo_sim = 0.0
+        self.t_inicio = datetime.now()
+        print("✅ Flota inicializada")
+
+    def _configurar_almacenamiento(self, db_file):
+        """
+        T3 pasa a correr en cada frame sobre 1/k de la flota (k = su período):
+        cada tanque se sigue guardando una vez por período, sin picos de escritura
+        """
+        if db_file is None:
+            base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+            db_file = os.path.join(base_dir, "datos", "datos_flota.db")
+        self.db_file = db_file
+        self.fracciones_t3 = self.scheduler.tareas['T3'].periodo
+        self.scheduler.configurar_tarea('T3', periodo=1, desfase=0)
+        self.db = AlmacenamientoLocal(db_file, tam_lote=max(500, -(-self.n_tanques // self.fracciones_t3)))
+
+    @classmethod
+    def desde_configuraciones(cls, configuraciones, **kwargs):
+        """
+        Crea la flota a partir de una lista de diccionarios (uno por tanque)
+        con cualquiera de PARAMETROS_TANQUE y, opcionalmente, 'tanque_id'
+        """
+        parametros = {nombre: [c.get(nombre, defecto) for c in configuraciones]
+                      for nombre, defecto in PARAMETROS_TANQUE.items()}
+        if any('tanque_id' in c for c in configuraciones):
+            kwargs['tanque_ids'] = [c.get('tanque_id', i + 1) for i, c in enumerate(configuraciones)]
+        return cls(len(configuraciones), **parametros, **kwargs)
+
+    def timestamp_sim(self):
+        """Fecha/hora correspondiente al reloj virtual"""
+        return self.t_inicio + timedelta(seconds=self.tiempo_sim)
+
+    def tarea_adquisicion_fusion(self):
+        """T1: física, sensores, corrección y estimación de toda la flota"""
+        self.flota.actualizar(dt=0.1)
+        temp, presion = self.sensor_amb.leer()
+        self.temp_actual = self.fusionador.filtro_temperatura.actualizar(temp)
+        self.presion_actual = self.fusionador.filtro_presion.actualizar(presion)
+
+        d_crudas = self.sensor_us.medir_distancias(self.flota.nivel_actual, temp, presion)
+        v_sonido = self.fusionador.calcular_v_sonido_corregida(self.temp_actual, self.presion_actual)
+        self.nivel_medido = self.flota.H_max - d_crudas * v_sonido / V_SONIDO_NOMINAL
+
+        self.nivel_estimado, self.tasa_estimada = self.estimador.paso(
+            self.nivel_medido, self.flota.valvula_entrada, self.flota.bomba_salida
+        )
+
+    def tarea_control(self):
+        """T2: histéresis y actuadores de toda la flota"""
+        estados = self.controlador.ejecutar(self.nivel_estimado, self.tasa_estimada)
+        # Igual que el gemelo individual: solo ALERTA_ALTA vacía, el resto llena
+        vaciar = estados == ESTADOS['ALERTA_ALTA']
+        self.flota.valvula_entrada = ~vaciar
+        self.flota.bomba_salida = vaciar
+
+        en_alarma = int(np.count_nonzero(estados != ESTADOS['NORMAL']))
+        if en_alarma != self._en_alarma:
+            logger.debug(f"⚠️  Tanques en alarma: {en_alarma}/{self.n_tanques}")
+            self._en_alarma = en_alarma
+
+    def tarea_almacenamiento(self):
+        """T3: una fila por tanque de la fracción que toca en este frame"""
+        fraccion = slice(self.scheduler.frame_actual % self.fracciones_t3, None, self.fracciones_t3)
+        self.db.guardar_lote(self.nivel_estimado[fraccion], self.temp_actual, self.presion_actual,
+                             self.controlador.estado[fraccion], self.tanque_ids[fraccion],
+                             timestamp=self.timestamp_sim())
+
+    def tarea_comunicacion(self):
+        """T4: publicar el resumen de la flota (simulado)"""
+        logger.debug(f"📡 [MQTT] Flota: nivel medio={self.nivel_estimado.mean():.2f} cm | "
+                     f"en alarma={self._en_alarma}")
+
+    def ejecutar(self, duracion_segundos=60, archivo_perfil=None):
+        """Ejecutar la flota según el modo configurado"""
+        print(f"\n🚀 Simulando {self.n_tanques} tanques por {duracion_segundos} segundos "
+              f"(modo: {self.modo})...")
+        print("=" * 70)
+
+        T_menor = self.scheduler.T_menor
+        frames_totales = int(duracion_segundos / T_menor)
+        limitador = LimitadorLog(intervalo=1.0)
+        reloj = self.reloj
+        perfilar = self.scheduler.perfilador is not None and reloj is not None
+        t_real_inicio = time.monotonic()
+        if reloj is not None:
+            reloj.iniciar()
+
+        for i in range(frames_totales):
+            inicio_programado = reloj.programado_ns if perfilar else None
+            tareas = self.scheduler.ejecutar_frame(self, inicio_programado)
+            self.tiempo_sim += T_menor
+
+            if limitador.permitir():
+                estados = self.controlador.estado
+                logger.info(f"⏱️  t={i*T_menor:6.1f}s | "
+                            f"Nivel medio: {self.nivel_estimado.mean():6.2f} "
+                            f"[{self.nivel_estimado.min():6.2f}, {self.nivel_estimado.max():6.2f}] | "
+                            f"Alerta baja: {np.count_nonzero(estados == ESTADOS['ALERTA_BAJA']):5d} | "
+                            f"Alerta alta: {np.count_nonzero(estados == ESTADOS['ALERTA_ALTA']):5d} | "
+                            f"Tareas: {','.join(tareas)}")
+
+            if reloj is not None:
+                reloj.esperar()
+
+        t_real = time.monotonic() - t_real_inicio
+        print("=" * 70)
+        self.db.cerrar()
+        stats = self.db.estadisticas()
+        print("✅ Simulación completada")
+        print(f"💾 {stats['filas']} filas en {stats['flushes']} lotes | "
+              f"{stats['filas_por_s']:.0f} filas/s | "
+              f"flush medio {stats['flush_medio_ms']:.2f} ms (máx {stats['flush_max_ms']:.2f} ms)")
+        print(f"⏱️  {self.tiempo_sim:.1f} s simulados en {t_real:.2f} s reales | "
+              f"{frames_totales / max(t_real, 1e-9):.0f} frames/s | "
+              f"{frames_totales * self.n_tanques / max(t_real, 1e-9):,.0f} tanque·frames/s")
+        diag = self.estimador.diagnostico()
+        print(f"🎯 Estimador: innovación normalizada media {diag['media_innovacion']:+.2f} "
+              f"(σ {diag['std_innovacion']:.2f}) | lecturas descartadas {diag['rechazadas']}/{diag['pasos']}")
+        print(f"📊 Datos guardados en: {self.db_file}")
+        if reloj is not None:
+            reloj.imprimir()
+        if self.scheduler.perfilador is not None:
+            self.scheduler.perfilador.imprimir()
+            if archivo_perfil:
+                self.scheduler.perfilador.exportar(archivo_perfil)
+                print(f"📁 Perfil exportado a: {archivo_perfil}")
+
+# ==================== EJECUCIÓN ====================
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Gemelo Digital SCE - Flota de tanques')
+    parser.add_argument('-n', '--tanques', type=int, default=100,
+                        help='Cantidad de tanques (default: 100; se ignora con --config)')
+    parser.add_argument('--config', default=None,
+                        help='JSON con una lista de tanques: [{"altura_max": 200, "diametro": 100, ...}, ...]')
+    parser.add_argument('-t', '--tiempo', type=int, default=60,
+                        help='Duración de la simulación en segundos (default: 60)')
+    parser.add_argument('-m', '--modo', default='scaled:10',
+                        help="Modo de ejecución: realtime, scaled:<factor> o "
+                             "as-fast-as-possible (default: scaled:10)")
+    parser.add_argument('--db', default=None,
+                        help='Base de datos SQLite (default: datos/datos_flota.db)')
+    parser.add_argument('--perfil', nargs='?', const=os.path.join(os.path.dirname(ARCHIVO_PERFIL), 'perfil_flota.json'), default=None,
+                        metavar='ARCHIVO',
+                        help='Medir tiempos del planificador y exportarlos a ARCHIVO .json o .csv')
+    parser.add_argument('--overrun', choices=POLITICAS_OVERRUN, default='recuperar',
+                        help='Ante un frame atrasado: recuperar o saltar (default: recuperar)')
+    parser.add_argument('--spin', type=float, default=1.0,
+                        help='Margen de espera activa antes de cada plazo, en ms (default: 1.0)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Mostrar también los mensajes de depuración')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format='%(message)s')
+    # Antes de construir la flota: la construcción ya abre y migra la base
+    if args.perfil and os.path.splitext(args.perfil)[1].lower() not in ('.json', '.csv'):
+        parser.error(f"❌ Formato de exportación no soportado: {args.perfil} (use .json o .csv)")
+
+    try:
+        if args.config:
+            with open(args.config, encoding='utf-8') as archivo:
+                sistema = SistemaMultiGemelo.desde_configuraciones(
+                    json.load(archivo), modo=args.modo, db_file=args.db, perfilar=args.perfil is not None,
+                    politica_overrun=args.overrun, spin_s=args.spin / 1000)
+        else:
+            sistema = SistemaMultiGemelo(args.tanques, modo=args.modo, db_file=args.db,
+                                         perfilar=args.perfil is not None,
+                                         politica_overrun=args.overrun, spin_s=args.spin / 1000)
+    except (ValueError, FileNotFoundError) as e:
+        parser.error(str(e))
+    sistema.ejecutar(duracion_segundos=args.tiempo, archivo_perfil=args.perfil)
@@ -0,0 +1,202 @@
+"""
+Perfilador del Planificador Cíclico
+Mide el tiempo de ejecución de cada tarea y de cada frame menor con
+time.perf_counter_ns y lo compara con el presupuesto del frame:
+- WCET observado por tarea, por frame y por posición del frame en el
+  ciclo mayor (min / media / p99 / max)
+- overruns: frames que duran más que el presupuesto
+- jitter de liberación: inicio real del frame - inicio programado
+- holgura por ciclo mayor: presupuesto - duración de cada frame
+- jitter de período y atraso de liberación del RelojCiclico (si se asigna)
+
+Sin perfilador el planificador no toma tiempos (overhead nulo).
+"""
+import csv
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from simuladores.buffer_circular import BufferCircular
+
+# Archivo por defecto del perfil (lo lee el dashboard)
+ARCHIVO_PERFIL = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'datos',
+                                              'perfil_planificador.json'))
+
+class EstadisticaTiempos:
+    """
+    Estadísticas de duraciones en ns
+    min/media/max sobre todas las muestras; el p99 sobre las últimas
+    'ventana' (buffer circular, sin crecer con la duración de la corrida)
+    """
+    def __init__(self, ventana=1000):
+        self.muestras = BufferCircular(ventana, dtype=np.int64)
+        self.n = 0
+        self.suma = 0
+        self.minimo = None
+        self.maximo = None
+
+    def registrar(self, ns):
+        self.muestras.agregar(ns)
+        self.n += 1
+        self.suma += ns
+        if self.minimo is None or ns < self.minimo:
+            self.minimo = ns
+        if self.maximo is None or ns > self.maximo:
+            self.maximo = ns
+
+    def resumen(self):
+        """Resumen en milisegundos"""
+        if self.n == 0:
+            return {'n': 0, 'min_ms': 0.0, 'media_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+        return {
+            'n': self.n,
+            'min_ms': self.minimo / 1e6,
+            'media_ms': self.suma / self.n / 1e6,
+            'p99_ms': float(np.percentile(self.muestras.vista(), 99)) / 1e6,
+            'max_ms': self.maximo / 1e6,
+        }
+
+class PerfiladorPlanificador:
+    """
+    Acumula los tiempos que reporta PlanificadorCiclico
+    - presupuesto_s: tiempo real disponible por frame menor
+    - frames_ciclo: frames por ciclo mayor (para la holgura y el WCET por posición)
+    - umbral_jitter_s: jitter a partir del cual se cuenta un evento
+      (por defecto el 10% del presupuesto)
+    """
+    def __init__(self, presupuesto_s, frames_ciclo, umbral_jitter_s=None, ventana=1000,
+                 ciclos_guardados=500):
+        self.presupuesto_ns = int(presupuesto_s * 1e9)
+        self.frames_ciclo = frames_ciclo
+        self.umbral_jitter_ns = int((presupuesto_s * 0.1 if umbral_jitter_s is None else umbral_jitter_s) * 1e9)
+        self.ventana = ventana
+        self.tareas = {}
+        self.frame = EstadisticaTiempos(ventana)
+        self.posiciones = [EstadisticaTiempos(ventana) for _ in range(frames_ciclo)]
+        self.jitter = EstadisticaTiempos(ventana)
+        self.overruns = 0
+        self.eventos_jitter = 0
+        # Una fila por ciclo mayor completado
+        self.ciclos = BufferCircular(ciclos_guardados,
+                                     campos=('ciclo', 'holgura_min_ms', 'holgura_media_ms', 'overruns'))
+        self._holgura_min = None
+        self._holgura_suma = 0
+        self._overruns_ciclo = 0
+        # RelojCiclico que libera los frames (lo asigna el sistema; None sin esperas)
+        self.reloj = None
+
+    def registrar_tarea(self, id_tarea, ns):
+        if id_tarea not in self.tareas:
+            self.tareas[id_tarea] = EstadisticaTiempos(self.ventana)
+        self.tareas[id_tarea].registrar(ns)
+
+    def registrar_frame(self, numero, ns, jitter_ns=None):
+        """Cierra el frame 'numero' (contado desde 0) que duró 'ns'"""
+        self.frame.registrar(ns)
+        posicion = numero % self.frames_ciclo
+        self.posiciones[posicion].registrar(ns)
+        if jitter_ns is not None:
+            self.jitter.registrar(jitter_ns)
+            if abs(jitter_ns) > self.umbral_jitter_ns:
+                self.eventos_jitter += 1
+
+        holgura = self.presupuesto_ns - ns
+        if holgura < 0:
+            self.overruns += 1
+            self._overruns_ciclo += 1
+        if self._holgura_min is None or holgura < self._holgura_min:
+            self._holgura_min = holgura
+        self._holgura_suma += holgura
+
+        if posicion == self.frames_ciclo - 1:
+            self.ciclos.agregar([numero // self.frames_ciclo, self._holgura_min / 1e6,
+                                 self._holgura_suma / self.frames_ciclo / 1e6, self._overruns_ciclo])
+            self._holgura_min = None
+            self._holgura_suma = 0
+            self._overruns_ciclo = 0
+
+    # ==================== REPORTES ====================
+    def filas(self):
+        """Una fila por tarea, por frame y por posición en el ciclo mayor"""
+        filas = [{'ambito': 'tarea', 'nombre': id_tarea, **estadistica.resumen()}
+                 for id_tarea, estadistica in self.tareas.items()]
+        filas.append({'ambito': 'frame', 'nombre': 'todos', **self.frame.resumen()})
+        filas += [{'ambito': 'posicion', 'nombre': str(i), **estadistica.resumen()}
+                  for i, estadistica in enumerate(self.posiciones) if estadistica.n]
+        filas.append({'ambito': 'jitter', 'nombre': 'liberacion', **self.jitter.resumen()})
+        if self.reloj is not None:
+            filas += self.reloj.filas()
+        return filas
+
+    def reporte(self):
+        return {
+            'presupuesto_ms': self.presupuesto_ns / 1e6,
+            'frames_ciclo': self.frames_ciclo,
+            'frames': self.frame.n,
+            'overruns': self.overruns,
+            'umbral_jitter_ms': self.umbral_jitter_ns / 1e6,
+            'eventos_jitter': self.eventos_jitter,
+            'tiempos': self.filas(),
+            'reloj': self.reloj.resumen() if self.reloj is not None else None,
+            'ciclos': {
+                'ciclo': self.ciclos.vista('ciclo').astype(int).tolist(),
+                'holgura_min_ms': self.ciclos.vista('holgura_min_ms').tolist(),
+                'holgura_media_ms': self.ciclos.vista('holgura_media_ms').tolist(),
+                'overruns': self.ciclos.vista('overruns').astype(int).tolist(),
+            },
+        }
+
+    def exportar(self, ruta):
+        """Guarda el reporte en JSON o CSV según la extensión del archivo"""
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        extension = os.path.splitext(ruta)[1].lower()
+        if extension == '.json':
+            with open(ruta, 'w', encoding='utf-8') as archivo:
+                json.dump(self.reporte(), archivo, indent=2)
+        elif extension == '.csv':
+            filas = self.filas()
+            with open(ruta, 'w', newline='', encoding='utf-8') as archivo:
+                escritor = csv.DictWriter(archivo, fieldnames=list(filas[0]))
+                escritor.writeheader()
+                escritor.writerows(filas)
+        else:
+            raise ValueError(f"❌ Formato de exportación no soportado: {ruta} (use .json o .csv)")
+        return ruta
+
+    def imprimir(self):
+        """Tabla de resumen para la consola"""
+        print(f"⏱️  Perfil del planificador | presupuesto {self.presupuesto_ns / 1e6:.2f} ms/frame | "
+              f"{self.frame.n} frames | overruns {self.overruns} | "
+              f"jitter > {self.umbral_jitter_ns / 1e6:.2f} ms: {self.eventos_jitter}")
+        print(f"   {'':10} | {'n':>6} | {'min':>8} | {'media':>8} | {'p99':>8} | {'max':>8}  (ms)")
+        for fila in self.filas():
+            if fila['ambito'] in ('posicion', 'reloj'):
+                continue
+            print(f"   {fila['nombre']:10} | {fila['n']:6d} | {fila['min_ms']:8.3f} | {fila['media_ms']:8.3f} | "
+                  f"{fila['p99_ms']:8.3f} | {fila['max_ms']:8.3f}")
+        if len(self.ciclos):
+            holgura = self.ciclos.vista('holgura_min_ms')
+            print(f"   Holgura mínima por ciclo mayor: peor {holgura.min():.3f} ms | "
+                  f"media {holgura.mean():.3f} ms ({len(self.ciclos)} ciclos)")
+
+# ==================== PRUEBA RÁPIDA ====================
+if __name__ == "__main__":
+    print("🧪 Perfilador con tareas sintéticas (presupuesto 5 ms, ciclo de 4 frames)...")
+    perfilador = PerfiladorPlanificador(presupuesto_s=0.005, frames_ciclo=4)
+    for numero in range(40):
+        t_frame = time.perf_counter_ns()
+        for id_tarea, duracion in (('A', 0.001), ('B', 0.002 if numero % 4 == 0 else 0.0)):
+            t0 = time.perf_counter_ns()
+            time.sleep(duracion)
+            perfilador.registrar_tarea(id_tarea, time.perf_counter_ns() - t0)
+        if numero == 13:
+            time.sleep(0.006)  # overrun forzado
+        perfilador.registrar_frame(numero, time.perf_counter_ns() - t_frame)
+    perfilador.imprimir()
+    print("✅ Prueba completada")
@@ -0,0 +1,151 @@
+"""
+Reloj del Ejecutivo Cíclico
+Libera los frames menores en plazos absolutos de time.perf_counter_ns:
+el frame k se libera en t0 + k * periodo (entero en ns), de modo que el
+tiempo de las tareas y el error de cada espera no se acumulan (sin deriva).
+
+Espera híbrida: time.sleep (asyncio.sleep en el modo asíncrono) hasta
+'spin_s' antes del plazo y luego espera activa sobre perf_counter_ns
+(precisión sub-milisegundo sin ocupar la CPU durante todo el frame).
+
+Política ante overruns (el plazo del próximo frame ya pasó):
+- 'recuperar': libera los frames atrasados uno tras otro sin esperar hasta
+  volver a la grilla; se mantiene el ritmo promedio (tiempo simulado = real)
+- 'saltar': descarta las liberaciones perdidas y espera el próximo plazo de
+  la grilla; el tiempo simulado queda atrás del real pero sin ráfagas
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from sce.perfilador import EstadisticaTiempos
+
+POLITICAS_OVERRUN = ('recuperar', 'saltar')
+# El event loop (epoll) redondea sus esperas hacia arriba al milisegundo
+RESOLUCION_LOOP_NS = 1_000_000
+
+class RelojCiclico:
+    """
+    Plazos absolutos para frames de 'periodo_s' segundos reales
+    - politica: 'recuperar' o 'saltar' (ver módulo)
+    - spin_s: margen de espera activa antes de cada plazo (0 = solo sleep)
+    """
+    def __init__(self, periodo_s, politica='recuperar', spin_s=0.002, ventana=1000):
+        if periodo_s <= 0:
+            raise ValueError(f"❌ Período inválido: {periodo_s}")
+        if politica not in POLITICAS_OVERRUN:
+            raise ValueError(f"❌ Política de overrun desconocida: {politica} "
+                             f"(opciones: {', '.join(POLITICAS_OVERRUN)})")
+        if spin_s < 0:
+            raise ValueError(f"❌ Margen de espera activa inválido: {spin_s}")
+        self.periodo_ns = periodo_s * 1e9  # float: k * periodo_ns se redondea sin acumular error
+        self.politica = politica
+        self.spin_ns = int(spin_s * 1e9)
+        # |período real - período nominal| y atraso de cada liberación respecto de su plazo
+        self.jitter_periodo = EstadisticaTiempos(ventana)
+        self.atraso = EstadisticaTiempos(ventana)
+        self.overruns = 0
+        self.saltados = 0
+        self.iniciar()
+
+    def iniciar(self):
+        """Fija el origen de la grilla: el frame 0 se libera ahora"""
+        self.t0_ns = time.perf_counter_ns()
+        self.k = 0
+        self.programado_ns = self.t0_ns
+        self._liberaciones = 0
+        self._primera_ns = self._ultima_ns = self.t0_ns
+
+    def esperar(self):
+        """
+        Espera el plazo del próximo frame y lo libera
+        Retorna la cantidad de liberaciones descartadas (solo con 'saltar')
+        """
+        plazo, saltados, restante = self._proximo_plazo()
+        if restante > 0:
+            time.sleep(restante / 1e9)
+        while time.perf_counter_ns() < plazo:
+            pass
+        return self._liberar(plazo, saltados)
+
+    async def esperar_async(self):
+        """Como esperar, pero cede el event loop durante el sleep (modo asyncio)"""
+        plazo, saltados, restante = self._proximo_plazo()
+        restante -= RESOLUCION_LOOP_NS
+        if restante > 0:
+            await asyncio.sleep(restante / 1e9)
+        while time.perf_counter_ns() < plazo:
+            pass
+        return self._liberar(plazo, saltados)
+
+    def _proximo_plazo(self):
+        """Plazo del próximo frame según la política, y ns a dormir antes del spin"""
+        self.k += 1
+        plazo = self.t0_ns + round(self.k * self.periodo_ns)
+        ahora = time.perf_counter_ns()
+        saltados = 0
+        if ahora > plazo:
+            self.overruns += 1
+            if self.politica == 'saltar':
+                # Próximo plazo futuro de la grilla
+                saltados = int((ahora - plazo) // self.periodo_ns) + 1
+                self.saltados += saltados
+                self.k += saltados
+                plazo = self.t0_ns + round(self.k * self.periodo_ns)
+        return plazo, saltados, plazo - ahora - self.spin_ns
+
+    def _liberar(self, plazo, saltados):
+        liberacion = time.perf_counter_ns()
+        self.atraso.registrar(liberacion - plazo)
+        self.jitter_periodo.registrar(abs(liberacion - self._ultima_ns - self.periodo_ns * (saltados + 1)))
+        self.programado_ns = plazo
+        self._ultima_ns = liberacion
+        self._liberaciones += 1
+        return saltados
+
+    # ==================== REPORTES ====================
+    def resumen(self):
+        periodos = self.k
+        return {
+            'periodo_nominal_ms': self.periodo_ns / 1e6,
+            'periodo_medio_ms': ((self._ultima_ns - self._primera_ns) / periodos / 1e6
+                                 if periodos else 0.0),
+            'politica': self.politica,
+            'spin_ms': self.spin_ns / 1e6,
+            'liberaciones': self._liberaciones,
+            'overruns': self.overruns,
+            'saltados': self.saltados,
+            'jitter_periodo': self.jitter_periodo.resumen(),
+            'atraso': self.atraso.resumen(),
+        }
+
+    def filas(self):
+        """Filas con el formato de PerfiladorPlanificador.filas"""
+        return [{'ambito': 'reloj', 'nombre': 'jitter_periodo', **self.jitter_periodo.resumen()},
+                {'ambito': 'reloj', 'nombre': 'atraso', **self.atraso.resumen()}]
+
+    def imprimir(self):
+        resumen = self.resumen()
+        jitter = resumen['jitter_periodo']
+        atraso = resumen['atraso']
+        print(f"🕒 Reloj: período medio {resumen['periodo_medio_ms']:.4f} ms "
+              f"(nominal {resumen['periodo_nominal_ms']:.4f}) | jitter de período "
+              f"media {jitter['media_ms']:.3f} / p99 {jitter['p99_ms']:.3f} / máx {jitter['max_ms']:.3f} ms | "
+              f"atraso máx {atraso['max_ms']:.3f} ms | overruns {resumen['overruns']} "
+              f"({resumen['politica']}, saltados {resumen['saltados']})")
+
+# ==================== PRUEBA RÁPIDA ====================
+if __name__ == "__main__":
+    for politica, spin in (('recuperar', 0.0), ('recuperar', 0.002), ('saltar', 0.002)):
+        print(f"🧪 200 frames de 10 ms | política {politica} | spin {spin * 1000:.0f} ms "
+              f"(overrun forzado de 35 ms en el frame 100)...")
+        reloj = RelojCiclico(0.010, politica=politica, spin_s=spin)
+        for numero in range(200):
+            time.sleep(0.002)  # trabajo del frame
+            if numero == 100:
+                time.sleep(0.035)
+            reloj.esperar()
+        reloj.imprimir()
+    print("✅ Prueba completada")
@@ -4,16 +4,66 @@ Implementación con POO y Planificador Ejecutivo Cíclico
 """
 import sys
 import os
+import math
+import functools
 
 # Agregar directorio raíz al path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import numpy as np
 from simuladores.simulador_tanque import TanqueSimulado, SensorUltrasonico, SensorAmbiental
+from sce.filtros import crear_filtro
+from sce.estimador_nivel import EstimadorNivel
+from sce.perfilador import PerfiladorPlanificador, ARCHIVO_PERFIL
+from sce.reloj import RelojCiclico, POLITICAS_OVERRUN
+from sce.ejecucion_async import PipelineES, POLITICAS_COLA
+from sce.esquema_bd import migrar_esquema, cargar_estados, fecha_a_ms, actualizar_resumenes
 import sqlite3
-from datetime import datetime
+import asyncio
+import logging
+from collections import namedtuple
+from datetime import datetime, timedelta
 import time
 
+logger = logging.getLogger("sce")
+
+# ==================== MODOS DE EJECUCIÓN ====================
+MODOS_EJECUCION = ('realtime', 'scaled:<factor>', 'as-fast-as-possible')
+
+def parsear_modo_ejecucion(modo):
+    """
+    Convierte el modo de ejecución en un factor de aceleración
+    - 'realtime': 1 s simulado = 1 s real (factor 1)
+    - 'scaled:<factor>': el tiempo simulado avanza <factor> veces más rápido
+    - 'as-fast-as-possible': sin esperas (factor infinito)
+    """
+    if modo == 'realtime':
+        return 1.0
+    if modo == 'as-fast-as-possible':
+        return float('inf')
+    if modo.startswith('scaled:'):
+        try:
+            factor = float(modo.split(':', 1)[1])
+        except ValueError:
+            factor = 0
+        if factor > 0:
+            return factor
+    raise ValueError(f"❌ Modo de ejecución inválido: {modo} "
+                     f"(opciones: {', '.join(MODOS_EJECUCION)})")
+
+class LimitadorLog:
+    """Deja pasar como máximo un mensaje cada 'intervalo' segundos reales"""
+    def __init__(self, intervalo=1.0):
+        self.intervalo = intervalo
+        self.ultimo = None
+
+    def permitir(self):
+        ahora = time.monotonic()
+        if self.ultimo is None or ahora - self.ultimo >= self.intervalo:
+            self.ultimo = ahora
+            return True
+        return False
+
 # ==================== CLASES POO (De Tarea 2) ====================
 class SensorBase:
     """Clase base para todos los sensores"""
@@ -62,16 +112,27 @@ class SensorAmbientalSCE(SensorBase):
         """Lee presión barométrica"""
         return self.Presion_Barometrica
 
+# Velocidad del sonido con la que el módulo JSN-SR04T convierte ToF en distancia (20 °C)
+V_SONIDO_NOMINAL = 331.3 + 0.606 * 20  # m/s
+
 class FusionadorDatos:
     """
     Fusión de datos multisensor con filtrado digital
+    - Un filtro por sensor (ver sce/filtros.py): nivel, temperatura, presión
+    - La distancia cruda (calculada con V_SONIDO_NOMINAL) se corrige con la
+      velocidad del sonido para la temperatura/presión filtradas
     """
-    def __init__(self):
+    def __init__(self, filtro_nivel='promedio:5', filtro_temperatura='ninguno', filtro_presion='ninguno',
+                 v_nominal=V_SONIDO_NOMINAL):
         self.Peso_T = 0.6
         self.Peso_P = 0.4
-        self.Lecturas_Historicas = []
-        self.ventana_filtro = 5
-        
+        self.v_nominal = v_nominal
+        self.filtro_nivel = crear_filtro(filtro_nivel)
+        self.filtro_temperatura = crear_filtro(filtro_temperatura)
+        self.filtro_presion = crear_filtro(filtro_presion)
+        self.V_Sonido = v_nominal
+        self.Distancia_Corregida = 0
+
     def calcular_v_sonido_corregida(self, T, P):
         """
         Velocidad del sonido corregida por temperatura y presión
@@ -84,171 +145,481 @@ class FusionadorDatos:
     
     def ejecutar_fusion(self, d_cruda, T, P, H_tanque):
         """
-        Fusión de datos con filtrado de promedio móvil
+        Fusión de datos con filtrado por sensor (O(1) por muestra)
         """
-        v_corregida = self.calcular_v_sonido_corregida(T, P)
-        
-        # Calcular nivel
-        nivel = H_tanque - d_cruda
-        
-        # Filtro de promedio móvil
-        self.Lecturas_Historicas.append(nivel)
-        if len(self.Lecturas_Historicas) > self.ventana_filtro:
-            self.Lecturas_Historicas.pop(0)
-        
-        nivel_filtrado = np.mean(self.Lecturas_Historicas)
-        return nivel_filtrado
+        T = self.filtro_temperatura.actualizar(T)
+        P = self.filtro_presion.actualizar(P)
+        self.V_Sonido = self.calcular_v_sonido_corregida(T, P)
+
+        # Distancia con la velocidad real del sonido: d = ToF * v / 2
+        self.Distancia_Corregida = d_cruda * self.V_Sonido / self.v_nominal
+        nivel = H_tanque - self.Distancia_Corregida
+
+        return self.filtro_nivel.actualizar(nivel)
+
+    def fusionar_lote(self, d_crudas, T, P, H_tanque):
+        """
+        Versión por lotes de ejecutar_fusion (reprocesar datos guardados)
+        Continúa desde el estado actual de los filtros, igual que llamar a
+        ejecutar_fusion muestra a muestra. Retorna el array de niveles.
+        """
+        d_crudas = np.asarray(d_crudas, dtype=float)
+        T = self.filtro_temperatura.filtrar_lote(np.broadcast_to(np.asarray(T, dtype=float), d_crudas.shape))
+        P = self.filtro_presion.filtrar_lote(np.broadcast_to(np.asarray(P, dtype=float), d_crudas.shape))
+        v_sonido = self.calcular_v_sonido_corregida(T, P)
+
+        niveles = H_tanque - d_crudas * v_sonido / self.v_nominal
+        if len(niveles):
+            self.V_Sonido = float(v_sonido[-1])
+            self.Distancia_Corregida = float(H_tanque - niveles[-1])
+        return self.filtro_nivel.filtrar_lote(niveles)
 
 class ControladorNivel:
     """
     Controlador con lógica de alarmas e histéresis
     """
-    def __init__(self, H_max, umbral_bajo=20, umbral_alto=180):
+    def __init__(self, H_max, umbral_bajo=20, umbral_alto=180, anticipacion=0.0):
         self.Nivel_Actual = 0
+        self.Tasa = 0.0  # dh/dt (cm/s)
+        self.anticipacion = anticipacion  # s: umbrales sobre el nivel previsto h + dh/dt·anticipación
         self.H_Max = H_max
         self.Umbral_Bajo = umbral_bajo
         self.Umbral_Alto = umbral_alto
         self.Estado_Alarma = "NORMAL"
         self.histeresis = 5  # cm
+        self._estado_reportado = "NORMAL"
         
-    def procesar_lectura(self, nivel_fusionado):
-        """Actualiza nivel actual"""
+    def procesar_lectura(self, nivel_fusionado, tasa=0.0):
+        """Actualiza nivel actual y su velocidad de cambio (si se conoce)"""
         self.Nivel_Actual = nivel_fusionado
+        self.Tasa = tasa
         
     def ejecutar_logica_control(self):
         """
         Lógica de control con histéresis
+        Con anticipación > 0 los umbrales se evalúan sobre el nivel previsto,
+        así la alarma se activa antes cuando el nivel sube/baja rápido
         """
-        if self.Nivel_Actual <= self.Umbral_Bajo:
+        nivel = self.Nivel_Actual + self.Tasa * self.anticipacion
+        if nivel <= self.Umbral_Bajo:
             self.Estado_Alarma = "ALERTA_BAJA"
             return "ACTIVAR_ENTRADA"
-        elif self.Nivel_Actual >= self.Umbral_Alto:
+        elif nivel >= self.Umbral_Alto:
             self.Estado_Alarma = "ALERTA_ALTA"
             return "ACTIVAR_SALIDA"
         else:
             # Zona de histéresis
-            if self.Estado_Alarma == "ALERTA_BAJA" and self.Nivel_Actual < self.Umbral_Bajo + self.histeresis:
+            if self.Estado_Alarma == "ALERTA_BAJA" and nivel < self.Umbral_Bajo + self.histeresis:
                 return "ACTIVAR_ENTRADA"
-            elif self.Estado_Alarma == "ALERTA_ALTA" and self.Nivel_Actual > self.Umbral_Alto - self.histeresis:
+            elif self.Estado_Alarma == "ALERTA_ALTA" and nivel > self.Umbral_Alto - self.histeresis:
                 return "ACTIVAR_SALIDA"
             else:
                 self.Estado_Alarma = "NORMAL"
                 return "MANTENER"
     
     def activar_alarma(self):
-        """Muestra alarma si hay problema"""
-        if self.Estado_Alarma != "NORMAL":
-            print(f"⚠️  ALARMA: {self.Estado_Alarma} - Nivel: {self.Nivel_Actual:.2f} cm")
+        """Reporta la alarma cuando cambia el estado (evita repetir el mismo aviso)"""
+        if self.Estado_Alarma != self._estado_reportado:
+            if self.Estado_Alarma != "NORMAL":
+                logger.warning(f"⚠️  ALARMA: {self.Estado_Alarma} - Nivel: {self.Nivel_Actual:.2f} cm")
+            else:
+                logger.info(f"✅ Alarma despejada - Nivel: {self.Nivel_Actual:.2f} cm")
+            self._estado_reportado = self.Estado_Alarma
 
 # ==================== BASE DE DATOS ====================
 class AlmacenamientoLocal:
-    """Almacenamiento en SQLite"""
-    def __init__(self, db_file=None):
+    """
+    Almacenamiento en SQLite con escritura por lotes
+    - Las filas se acumulan en memoria y se insertan con executemany
+    - Se vacía el buffer al llegar a 'tam_lote' filas o tras 'intervalo_flush' s
+      (plazo que se revisa al escribir: ver _flush_si_corresponde)
+    - Modo WAL + synchronous=NORMAL: un fsync por lote y lecturas concurrentes
+      (dashboard) sin bloquear al escritor
+    - En el mismo commit se actualizan los resúmenes de 1 min, 1 h y 1 día
+    - tanque_id identifica al tanque en una base compartida (0 = gemelo individual)
+    """
+    def __init__(self, db_file=None, tam_lote=500, intervalo_flush=1.0, tanque_id=0):
         if db_file is None:
             # Usar ruta absoluta basada en el directorio raíz del proyecto
             base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
             db_file = os.path.join(base_dir, "datos", "datos_sce.db")
-        self.conn = sqlite3.connect(db_file)
+        # check_same_thread=False: en el modo asíncrono escribe el hilo de E/S
+        # (un único hilo, nunca en paralelo con el principal)
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
         self.crear_tabla()
+
+        self.tanque_id = tanque_id
+        self.tam_lote = tam_lote
+        self.intervalo_flush = intervalo_flush  # s reales
+        self._buffer = []
+        self._ultimo_flush = time.monotonic()
+
+        # Estadísticas de escritura
+        self.filas_escritas = 0
+        self.n_flushes = 0
+        self.t_flush_total = 0.0
+        self.t_flush_max = 0.0
     
     def crear_tabla(self):
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS mediciones (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT,
-                nivel REAL,
-                temperatura REAL,
-                presion REAL,
-                estado TEXT
-            )
-        """)
-        self.conn.commit()
+        """Crea el esquema o migra una base antigua (ver sce/esquema_bd.py)"""
+        migrar_esquema(self.conn)
+        self._estados = cargar_estados(self.conn)
+
+    def _id_estado(self, estado):
+        """Id entero del estado; registra estados nuevos en la tabla estados"""
+        id_estado = self._estados.get(estado)
+        if id_estado is None:
+            cursor = self.conn.execute("INSERT INTO estados (nombre) VALUES (?)", (estado,))
+            self.conn.commit()
+            id_estado = self._estados[estado] = cursor.lastrowid
+        return id_estado
     
-    def guardar(self, nivel, temp, presion, estado):
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            INSERT INTO mediciones (timestamp, nivel, temperatura, presion, estado)
-            VALUES (?, ?, ?, ?, ?)
-        """, (datetime.now().isoformat(), nivel, temp, presion, estado))
+    def guardar(self, nivel, temp, presion, estado, timestamp=None):
+        """Encola una medición; se escribe en el próximo flush"""
+        if timestamp is None:
+            timestamp = datetime.now()
+        self._buffer.append((fecha_a_ms(timestamp), nivel, temp, presion, self._id_estado(estado),
+                             self.tanque_id))
+        self._flush_si_corresponde()
+
+    def guardar_lote(self, niveles, temperaturas, presiones, estados, tanque_ids, timestamp=None):
+        """
+        Encola una medición por tanque con el mismo timestamp
+        estados: ids enteros (ver ESTADOS en sce/esquema_bd.py); temperatura
+        y presión pueden ser un valor común o uno por tanque
+        """
+        if timestamp is None:
+            timestamp = datetime.now()
+        # tolist() convierte a int/float de Python (sqlite3 no acepta tipos de NumPy)
+        tanque_ids = np.asarray(tanque_ids, dtype=np.int64)
+        n = len(tanque_ids)
+        valores = [np.broadcast_to(np.asarray(v, dtype=float), n).tolist()
+                   for v in (niveles, temperaturas, presiones)]
+        estados = np.broadcast_to(np.asarray(estados, dtype=np.int64), n).tolist()
+        self._buffer.extend(zip([fecha_a_ms(timestamp)] * n, *valores, estados, tanque_ids.tolist()))
+        self._flush_si_corresponde()
+
+    def _flush_si_corresponde(self):
+        """
+        Solo se llama desde guardar/guardar_lote: sin un temporizador propio, una
+        fila puede quedar en memoria hasta intervalo_flush más el tiempo entre
+        dos escrituras. En el SCE escribe T3 en cada activación (y el
+        coordinador de la flota en cada sincronización), así que la demora
+        queda acotada por su período; quien deje de escribir debe llamar a
+        flush() o cerrar()
+        """
+        if (len(self._buffer) >= self.tam_lote
+                or time.monotonic() - self._ultimo_flush >= self.intervalo_flush):
+            self.flush()
+
+    def flush(self):
+        """Escribe todas las filas pendientes en una sola transacción"""
+        self._ultimo_flush = time.monotonic()
+        if not self._buffer:
+            return
+        t0 = time.perf_counter()
+        self.conn.executemany("""
+            INSERT INTO mediciones (timestamp, nivel, temperatura, presion, estado, tanque_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, self._buffer)
+        actualizar_resumenes(self.conn.cursor(), self._buffer)
         self.conn.commit()
+        dt = time.perf_counter() - t0
+
+        self.filas_escritas += len(self._buffer)
+        self.n_flushes += 1
+        self.t_flush_total += dt
+        self.t_flush_max = max(self.t_flush_max, dt)
+        self._buffer.clear()
+
+    def estadisticas(self):
+        """Filas/s (tiempo dentro de flush) y latencia de flush en ms"""
+        return {
+            'filas': self.filas_escritas,
+            'flushes': self.n_flushes,
+            'filas_por_s': self.filas_escritas / self.t_flush_total if self.t_flush_total > 0 else 0.0,
+            'flush_medio_ms': 1000 * self.t_flush_total / self.n_flushes if self.n_flushes else 0.0,
+            'flush_max_ms': 1000 * self.t_flush_max,
+        }
     
     def cerrar(self):
+        """Vacía el buffer pendiente y cierra la conexión"""
+        self.flush()
         self.conn.close()
 
 # ==================== PLANIFICADOR EJECUTIVO CÍCLICO ====================
+# Tabla declarativa de tareas:
+# - accion: nombre de un método del sistema (se vincula al ejecutar) o una
+#   función que recibe el sistema
+# - periodo y desfase en frames menores: corre en los frames f con
+#   f % periodo == desfase (el desfase reparte tareas pesadas entre frames)
+# - wcet: presupuesto de tiempo de ejecución en segundos (tiempo real nominal)
+# - prioridad: orden dentro del frame (menor número = antes)
+Tarea = namedtuple('Tarea', ['id', 'nombre', 'accion', 'periodo', 'desfase', 'wcet', 'prioridad'])
+
+TAREAS_SCE = (
+    Tarea('T1', 'Adquisición/Fusión', 'tarea_adquisicion_fusion', periodo=1, desfase=0, wcet=0.005, prioridad=1),
+    Tarea('T2', 'Control', 'tarea_control', periodo=2, desfase=0, wcet=0.001, prioridad=2),
+    Tarea('T3', 'Almacenamiento', 'tarea_almacenamiento', periodo=10, desfase=0, wcet=0.020, prioridad=3),
+    Tarea('T4', 'Comunicación', 'tarea_comunicacion', periodo=20, desfase=0, wcet=0.005, prioridad=4),
+)
+
+def mcm(valores):
+    """Mínimo común múltiplo (math.lcm recién existe desde Python 3.9)"""
+    return functools.reduce(lambda a, b: a * b // math.gcd(a, b), valores, 1)
+
+def balancear_desfases(tareas, T_menor=0.1):
+    """
+    Asigna desfases para repartir la carga: de la tarea más pesada a la más
+    liviana, cada una toma el desfase que deja menor la carga del frame más
+    cargado del ciclo mayor. Retorna una nueva tabla con los desfases.
+    """
+    frames_ciclo = mcm(tarea.periodo for tarea in tareas)
+    carga = np.zeros(frames_ciclo)
+    desfases = {}
+    for tarea in sorted(tareas, key=lambda t: (-t.wcet / t.periodo, t.prioridad)):
+        mejor = min(range(tarea.periodo), key=lambda d: (carga[d::tarea.periodo].max(), d))
+        carga[mejor::tarea.periodo] += tarea.wcet
+        desfases[tarea.id] = mejor
+    return tuple(tarea._replace(desfase=desfases[tarea.id]) for tarea in tareas)
+
 class PlanificadorCiclico:
     """
-    Planificador Ejecutivo Cíclico
+    Planificador Ejecutivo Cíclico dirigido por tabla
     T_menor = 100ms
-    T_mayor = 2000ms (MCM de todos los períodos)
+    T_mayor = MCM de los períodos (2000ms con TAREAS_SCE)
+    La tabla de frames del ciclo mayor se calcula una sola vez y se verifica
+    fuera de línea (utilización y carga de cada frame contra T_menor);
+    ejecutar_frame solo recorre la lista precalculada del frame.
+    factor_tiempo: aceleración del modo de ejecución; cada frame dispone de
+    T_menor / factor_tiempo segundos reales (presupuesto_s), que es contra lo
+    que verificar_planificabilidad compara los WCET declarados.
     """
-    def __init__(self):
-        self.T_menor = 0.1  # 100ms
+    def __init__(self, tareas=None, T_menor=0.1, perfilador=None, factor_tiempo=1.0):
+        if not factor_tiempo > 0:
+            raise ValueError(f"❌ Factor de tiempo inválido: {factor_tiempo}")
+        self.T_menor = T_menor
+        # Sin esperas (as-fast-as-possible) no hay plazo real: se usa el nominal
+        self.presupuesto_s = T_menor / (1.0 if factor_tiempo == float('inf') else factor_tiempo)
         self.frame_actual = 0
-        self.tareas = {
-            'T1': {'periodo': 1, 'ultima_ejecucion': 0, 'nombre': 'Adquisición/Fusión'},
-            'T2': {'periodo': 2, 'ultima_ejecucion': 0, 'nombre': 'Control'},
-            'T3': {'periodo': 10, 'ultima_ejecucion': 0, 'nombre': 'Almacenamiento'},
-            'T4': {'periodo': 20, 'ultima_ejecucion': 0, 'nombre': 'Comunicación'},
+        self.tareas = {}
+        for tarea in TAREAS_SCE if tareas is None else tareas:
+            if tarea.id in self.tareas:
+                raise ValueError(f"❌ Tarea duplicada: {tarea.id}")
+            self.tareas[tarea.id] = tarea
+        # PerfiladorPlanificador opcional: sin él no se toman tiempos
+        self.perfilador = perfilador
+        self._construir()
+
+    # ==================== TABLA DE FRAMES ====================
+    def _construir(self):
+        """Valida la tabla, precalcula los frames del ciclo mayor y verifica la carga"""
+        if not self.tareas:
+            raise ValueError("❌ El planificador necesita al menos una tarea")
+        for tarea in self.tareas.values():
+            if not isinstance(tarea.periodo, int) or tarea.periodo < 1:
+                raise ValueError(f"❌ Período inválido en {tarea.id}: {tarea.periodo} (entero >= 1)")
+            if not 0 <= tarea.desfase < tarea.periodo:
+                raise ValueError(f"❌ Desfase inválido en {tarea.id}: {tarea.desfase} "
+                                 f"(debe estar en [0, {tarea.periodo}))")
+            if tarea.wcet < 0:
+                raise ValueError(f"❌ WCET inválido en {tarea.id}: {tarea.wcet}")
+            if not (isinstance(tarea.accion, str) or callable(tarea.accion)):
+                raise ValueError(f"❌ Acción inválida en {tarea.id}: {tarea.accion!r}")
+
+        # Frames por ciclo mayor (MCM de los períodos)
+        self.frames_ciclo = mcm(tarea.periodo for tarea in self.tareas.values())
+        ordenadas = sorted(self.tareas.values(), key=lambda t: (t.prioridad, t.id))
+        self.tabla_frames = [tuple(tarea for tarea in ordenadas if f % tarea.periodo == tarea.desfase)
+                             for f in range(self.frames_ciclo)]
+        self._sistema = None
+        self._despacho = None
+
+        # La tabla debe caber al menos en su frame nominal; con un modo acelerado
+        # el presupuesto real puede no alcanzar (overruns), lo avisa el sistema
+        verificacion = self.verificar_planificabilidad(self.T_menor)
+        if not verificacion['planificable']:
+            peores = ', '.join(f"frame {f}: {carga * 1000:.1f} ms"
+                               for f, carga in verificacion['frames_sobrecargados'][:5])
+            raise ValueError(f"❌ Tabla no planificable: utilización {verificacion['utilizacion']:.1%}, "
+                             f"frames con WCET > T_menor ({self.T_menor * 1000:.0f} ms): {peores}")
+
+    def verificar_planificabilidad(self, presupuesto_s=None):
+        """
+        Análisis fuera de línea con los WCET declarados contra el tiempo real
+        de cada frame (por defecto presupuesto_s = T_menor / factor_tiempo):
+        - utilización U = suma(wcet / (periodo * presupuesto)) <= 1
+        - cada frame del ciclo mayor cabe en el presupuesto (suma de sus WCET)
+        """
+        presupuesto = self.presupuesto_s if presupuesto_s is None else presupuesto_s
+        cargas = [sum(tarea.wcet for tarea in frame) for frame in self.tabla_frames]
+        utilizacion = sum(tarea.wcet / (tarea.periodo * presupuesto) for tarea in self.tareas.values())
+        sobrecargados = [(f, carga) for f, carga in enumerate(cargas) if carga > presupuesto]
+        return {
+            'presupuesto_s': presupuesto,
+            'utilizacion': utilizacion,
+            'carga_max_s': max(cargas),
+            'frame_max': cargas.index(max(cargas)),
+            'holgura_min_s': presupuesto - max(cargas),
+            'cargas_s': cargas,
+            'frames_sobrecargados': sobrecargados,
+            'planificable': utilizacion <= 1.0 and not sobrecargados,
         }
-    
-    def ejecutar_frame(self, sistema):
-        """Ejecuta tareas según plan cíclico"""
-        tareas_ejecutadas = []
-        
-        # T1: Adquisición y Fusión (cada frame)
-        if self.frame_actual % self.tareas['T1']['periodo'] == 0:
-            sistema.tarea_adquisicion_fusion()
-            tareas_ejecutadas.append('T1')
-        
-        # T2: Control
-        if self.frame_actual % self.tareas['T2']['periodo'] == 0:
-            sistema.tarea_control()
-            tareas_ejecutadas.append('T2')
-        
-        # T3: Almacenamiento
-        if self.frame_actual % self.tareas['T3']['periodo'] == 0:
-            sistema.tarea_almacenamiento()
-            tareas_ejecutadas.append('T3')
-        
-        # T4: Comunicación
-        if self.frame_actual % self.tareas['T4']['periodo'] == 0:
-            sistema.tarea_comunicacion()
-            tareas_ejecutadas.append('T4')
-        
+
+    def agregar_tarea(self, tarea):
+        """Agrega una tarea a la tabla y recalcula el plan (falla si no es planificable)"""
+        if tarea.id in self.tareas:
+            raise ValueError(f"❌ Tarea duplicada: {tarea.id}")
+        self._modificar_tabla({**self.tareas, tarea.id: tarea})
+
+    def configurar_tarea(self, id_tarea, **cambios):
+        """Cambia campos de una tarea (p. ej. periodo, desfase, wcet) y recalcula el plan"""
+        if id_tarea not in self.tareas:
+            raise ValueError(f"❌ Tarea desconocida: {id_tarea} (opciones: {', '.join(self.tareas)})")
+        self._modificar_tabla({**self.tareas, id_tarea: self.tareas[id_tarea]._replace(**cambios)})
+
+    def _modificar_tabla(self, tareas):
+        anteriores = self.tareas
+        self.tareas = tareas
+        try:
+            self._construir()
+        except ValueError:
+            self.tareas = anteriores
+            self._construir()
+            raise
+
+    def _vincular(self, sistema):
+        """Resuelve las acciones de la tabla contra el sistema (una vez por sistema)"""
+        def resolver(tarea):
+            if isinstance(tarea.accion, str):
+                return getattr(sistema, tarea.accion)
+            return lambda: tarea.accion(sistema)
+        acciones = {id_tarea: resolver(tarea) for id_tarea, tarea in self.tareas.items()}
+        self._despacho = [tuple((tarea.id, acciones[tarea.id]) for tarea in frame)
+                          for frame in self.tabla_frames]
+        self._sistema = sistema
+
+    def describir(self):
+        """Tabla de tareas, plan del ciclo mayor y resultado de la verificación"""
+        verificacion = self.verificar_planificabilidad()
+        lineas = [f"📋 Plan cíclico | T_menor {self.T_menor * 1000:.0f} ms "
+                  f"(presupuesto real {self.presupuesto_s * 1000:.1f} ms/frame) | "
+                  f"ciclo mayor {self.frames_ciclo} frames ({self.frames_ciclo * self.T_menor:.1f} s)",
+                  f"   {'id':4} | {'tarea':20} | {'periodo':>7} | {'desfase':>7} | {'wcet ms':>7} | prioridad"]
+        for tarea in sorted(self.tareas.values(), key=lambda t: (t.prioridad, t.id)):
+            lineas.append(f"   {tarea.id:4} | {tarea.nombre:20} | {tarea.periodo:7d} | {tarea.desfase:7d} | "
+                          f"{tarea.wcet * 1000:7.1f} | {tarea.prioridad}")
+        for f, frame in enumerate(self.tabla_frames):
+            lineas.append(f"   frame {f:3d}: {' '.join(t.id for t in frame):16} "
+                          f"{verificacion['cargas_s'][f] * 1000:6.1f} ms")
+        lineas.append(f"{'✅' if verificacion['planificable'] else '❌'} Utilización "
+                      f"{verificacion['utilizacion']:.1%} | frame más cargado {verificacion['frame_max']} "
+                      f"({verificacion['carga_max_s'] * 1000:.1f} ms) | holgura mínima "
+                      f"{verificacion['holgura_min_s'] * 1000:.1f} ms")
+        return "\n".join(lineas)
+
+    def ejecutar_frame(self, sistema, inicio_programado_ns=None):
+        """
+        Ejecuta las tareas del frame según la tabla precalculada
+        inicio_programado_ns: instante (time.perf_counter_ns) en que el frame
+        debía comenzar, para medir el jitter de liberación con el perfilador
+        """
+        if sistema is not self._sistema:
+            self._vincular(sistema)
+        despacho = self._despacho[self.frame_actual % self.frames_ciclo]
+        perfilador = self.perfilador
+        if perfilador is None:
+            for _, accion in despacho:
+                accion()
+        else:
+            t_frame = time.perf_counter_ns()
+            for id_tarea, accion in despacho:
+                t0 = time.perf_counter_ns()
+                accion()
+                perfilador.registrar_tarea(id_tarea, time.perf_counter_ns() - t0)
+            jitter = None if inicio_programado_ns is None else t_frame - inicio_programado_ns
+            perfilador.registrar_frame(self.frame_actual, time.perf_counter_ns() - t_frame, jitter)
         self.frame_actual += 1
-        return tareas_ejecutadas
+        return [id_tarea for id_tarea, _ in despacho]
+
+def avisar_presupuesto(scheduler, modo):
+    """Avisa (sin fallar) si los WCET declarados no caben en el tiempo real de un frame"""
+    verificacion = scheduler.verificar_planificabilidad()
+    if not verificacion['planificable']:
+        print(f"⚠️  Con el modo {modo} cada frame dispone de {verificacion['presupuesto_s'] * 1000:.1f} ms "
+              f"y el frame {verificacion['frame_max']} declara {verificacion['carga_max_s'] * 1000:.1f} ms "
+              f"de WCET: se esperan overruns")
+    return verificacion
 
 # ==================== SISTEMA INTEGRADO ====================
 class SistemaGemeloDigital:
     """Sistema completo: Gemelo Digital del SCE"""
-    def __init__(self):
+    def __init__(self, modo='scaled:10', db_file=None, filtros=None, usar_estimador=True, perfilar=False,
+                 politica_overrun='recuperar', spin_s=0.001, pipeline_es=None, latencia_red_s=0.0):
         print("🔧 Inicializando Gemelo Digital...")
-        
+
+        # Modo de ejecución (valida antes de crear nada)
+        self.modo = modo
+        self.factor_tiempo = parsear_modo_ejecucion(modo)
+
         # Simuladores físicos
         self.tanque = TanqueSimulado(altura_max=200, diametro=100)
-        self.sensor_us_sim = SensorUltrasonico(altura_instalacion=200)
+        # Fuera de tiempo real la latencia del sensor se contabiliza en el reloj virtual
+        modo_latencia = 'real' if self.factor_tiempo == 1.0 else 'virtual'
+        # El sensor reporta la distancia con la velocidad nominal; el fusionador la corrige
+        self.sensor_us_sim = SensorUltrasonico(altura_instalacion=200, modo_latencia=modo_latencia,
+                                               velocidad_nominal=V_SONIDO_NOMINAL)
         self.sensor_amb_sim = SensorAmbiental()
         
         # SCE (POO)
         self.sensor_us = SensorUltrasonicoSCE("US-01", self.sensor_us_sim)
         self.sensor_amb = SensorAmbientalSCE("AMB-01", self.sensor_amb_sim)
-        self.fusionador = FusionadorDatos()
-        self.controlador = ControladorNivel(H_max=200, umbral_bajo=30, umbral_alto=170)
+        # filtros: {'filtro_nivel': ..., 'filtro_temperatura': ..., 'filtro_presion': ...}
+        self.fusionador = FusionadorDatos(**(filtros or {}))
+        # Estimador de nivel y dh/dt con el modelo del tanque (entrada: válvulas comandadas)
+        self.estimador = EstimadorNivel(
+            self.tanque.area, self.tanque.Q_in, self.tanque.Q_out, dt=0.1, altura_max=200
+        ) if usar_estimador else None
+        self.controlador = ControladorNivel(H_max=200, umbral_bajo=30, umbral_alto=170,
+                                            anticipacion=0.5 if usar_estimador else 0.0)
         
         # Almacenamiento
-        self.db = AlmacenamientoLocal()
+        self.db = AlmacenamientoLocal(db_file)
         
-        # Planificador
-        self.scheduler = PlanificadorCiclico()
+        # Planificador (perfilar: medir WCET, overruns, jitter y holgura de cada frame)
+        self.scheduler = PlanificadorCiclico(factor_tiempo=self.factor_tiempo)
+        # Reloj de plazos absolutos (sin reloj en as-fast-as-possible)
+        self.reloj = (None if self.factor_tiempo == float('inf') else
+                      RelojCiclico(self.scheduler.presupuesto_s, politica=politica_overrun, spin_s=spin_s))
+        if perfilar:
+            self.scheduler.perfilador = PerfiladorPlanificador(self.scheduler.presupuesto_s,
+                                                               self.scheduler.frames_ciclo)
+            self.scheduler.perfilador.reloj = self.reloj
+        # Modo asíncrono (PipelineES): T3/T4 encolan y se atienden fuera del frame
+        self.pipeline_es = pipeline_es
+        if pipeline_es is not None:
+            pipeline_es.instalar(self)
+        avisar_presupuesto(self.scheduler, modo)
+        self.latencia_red_s = latencia_red_s  # publicación simulada
         
         # Variables de estado
         self.temp_actual = 25
         self.presion_actual = 1013
         self.nivel_fusionado = 50
-        
+        self.nivel_estimado = 50  # nivel que usan control y almacenamiento
+        self.tasa_estimada = 0.0  # cm/s
+
+        # Reloj virtual: segundos simulados desde el inicio
+        self.tiempo_sim = 0.0
+        self.t_inicio = datetime.now()
+
         print("✅ Sistema inicializado")
+
+    def timestamp_sim(self):
+        """Fecha/hora correspondiente al reloj virtual"""
+        return self.t_inicio + timedelta(seconds=self.tiempo_sim)
         
     def tarea_adquisicion_fusion(self):
         """T1: Adquirir datos de sensores y fusionar"""
@@ -270,10 +641,19 @@ class SistemaGemeloDigital:
         self.nivel_fusionado = self.fusionador.ejecutar_fusion(
             d_cruda, self.temp_actual, self.presion_actual, 200
         )
+
+        # Estimación de estado sobre la medición corregida (sin el retardo del filtro)
+        if self.estimador is not None:
+            self.nivel_estimado, self.tasa_estimada = self.estimador.paso(
+                200 - self.fusionador.Distancia_Corregida,
+                self.tanque.valvula_entrada, self.tanque.bomba_salida
+            )
+        else:
+            self.nivel_estimado, self.tasa_estimada = self.nivel_fusionado, 0.0
     
     def tarea_control(self):
         """T2: Lógica de control"""
-        self.controlador.procesar_lectura(self.nivel_fusionado)
+        self.controlador.procesar_lectura(self.nivel_estimado, self.tasa_estimada)
         accion = self.controlador.ejecutar_logica_control()
         
         # Actuar sobre válvulas simuladas
@@ -291,50 +671,172 @@ class SistemaGemeloDigital:
     
     def tarea_almacenamiento(self):
         """T3: Guardar datos en BD"""
-        self.db.guardar(
-            self.nivel_fusionado,
-            self.temp_actual,
-            self.presion_actual,
-            self.controlador.Estado_Alarma
-        )
+        self.escribir_almacenamiento([self.muestra_almacenamiento()])
+
+    def muestra_almacenamiento(self):
+        """Copia del estado a guardar (argumentos de AlmacenamientoLocal.guardar)"""
+        return (self.nivel_estimado, self.temp_actual, self.presion_actual,
+                self.controlador.Estado_Alarma, self.timestamp_sim())
+
+    def escribir_almacenamiento(self, muestras):
+        for nivel, temp, presion, estado, timestamp in muestras:
+            self.db.guardar(nivel, temp, presion, estado, timestamp=timestamp)
     
     def tarea_comunicacion(self):
         """T4: Enviar datos por red (simulado)"""
-        print(f"📡 [MQTT] Publicando datos: nivel={self.nivel_fusionado:.2f} cm")
+        if self.latencia_red_s > 0:
+            time.sleep(self.latencia_red_s)
+        self.publicar(self.mensaje_comunicacion())
+
+    def mensaje_comunicacion(self):
+        return {'nivel': self.nivel_estimado, 'tasa': self.tasa_estimada,
+                'estado': self.controlador.Estado_Alarma, 't': self.tiempo_sim}
+
+    def publicar(self, mensaje):
+        logger.debug(f"📡 [MQTT] Publicando datos: nivel={mensaje['nivel']:.2f} cm "
+                     f"(dh/dt={mensaje['tasa']:+.3f} cm/s) | t={mensaje['t']:.1f}s")
     
-    def ejecutar(self, duracion_segundos=60):
-        """Ejecutar simulación"""
-        print(f"\n🚀 Iniciando simulación por {duracion_segundos} segundos...")
+    def ejecutar(self, duracion_segundos=60, intervalo_log=1.0, archivo_perfil=None):
+        """
+        Ejecutar simulación según el modo configurado
+        intervalo_log: segundos simulados entre líneas de estado (en tiempo
+        real); fuera de tiempo real se limita a una línea por segundo real
+        archivo_perfil: ruta .json o .csv para exportar el perfil del planificador
+        """
+        print(f"\n🚀 Iniciando simulación por {duracion_segundos} segundos (modo: {self.modo})...")
         print("=" * 70)
-        
-        frames_totales = int(duracion_segundos / 0.1)
-        
-        for i in range(frames_totales):
-            tareas = self.scheduler.ejecutar_frame(self)
-            
-            # Log cada segundo
-            if i % 10 == 0:
-                print(f"⏱️  t={i*0.1:6.1f}s | "
-                      f"Nivel Real: {self.tanque.nivel_actual:6.2f} | "
-                      f"Fusionado: {self.nivel_fusionado:6.2f} | "
-                      f"Estado: {self.controlador.Estado_Alarma:12s} | "
-                      f"Tareas: {','.join(tareas)}")
-            
-            time.sleep(0.01)  # 10ms real = 100ms simulado (acelerar 10x)
-        
+
+        T_menor = self.scheduler.T_menor
+        frames_totales = int(duracion_segundos / T_menor)
+        frames_log = max(1, int(round(intervalo_log / T_menor)))
+        limitador = LimitadorLog(intervalo=1.0)
+        reloj = self.reloj
+        perfilar = self.scheduler.perfilador is not None and reloj is not None
+
+        def paso_frame(i):
+            # Plazo de liberación del frame (solo para medir jitter)
+            inicio_programado = reloj.programado_ns if perfilar else None
+            tareas = self.scheduler.ejecutar_frame(self, inicio_programado)
+            self.tiempo_sim += T_menor
+
+            if self.factor_tiempo == 1.0:
+                mostrar = i % frames_log == 0
+            else:
+                mostrar = limitador.permitir()
+            if mostrar:
+                logger.info(f"⏱️  t={i*T_menor:6.1f}s | "
+                            f"Nivel Real: {self.tanque.nivel_actual:6.2f} | "
+                            f"Fusionado: {self.nivel_fusionado:6.2f} | "
+                            f"Estimado: {self.nivel_estimado:6.2f} | "
+                            f"Estado: {self.controlador.Estado_Alarma:12s} | "
+                            f"Tareas: {','.join(tareas)}")
+
+        t_real_inicio = time.monotonic()
+        if self.pipeline_es is not None:
+            asyncio.run(self.pipeline_es.ejecutar(frames_totales, paso_frame, reloj))
+        else:
+            if reloj is not None:
+                reloj.iniciar()
+            for i in range(frames_totales):
+                paso_frame(i)
+                # Esperar el plazo absoluto del próximo frame (escalado)
+                if reloj is not None:
+                    reloj.esperar()
+
+        t_real = time.monotonic() - t_real_inicio
         print("=" * 70)
         self.db.cerrar()
+        stats = self.db.estadisticas()
         print("✅ Simulación completada")
+        print(f"💾 {stats['filas']} filas en {stats['flushes']} lotes | "
+              f"{stats['filas_por_s']:.0f} filas/s | "
+              f"flush medio {stats['flush_medio_ms']:.2f} ms (máx {stats['flush_max_ms']:.2f} ms)")
+        print(f"⏱️  {self.tiempo_sim:.1f} s simulados en {t_real:.2f} s reales "
+              f"(x{self.tiempo_sim / max(t_real, 1e-9):.1f})")
+        if self.estimador is not None:
+            diag = self.estimador.diagnostico()
+            print(f"🎯 Estimador: innovación normalizada media {diag['media_innovacion']:+.2f} "
+                  f"(σ {diag['std_innovacion']:.2f}) | lecturas descartadas {diag['rechazadas']}/{diag['pasos']}")
         print(f"📊 Datos guardados en: datos/datos_sce.db")
+        if reloj is not None:
+            reloj.imprimir()
+        if self.pipeline_es is not None:
+            self.pipeline_es.imprimir()
+        if self.scheduler.perfilador is not None:
+            self.scheduler.perfilador.imprimir()
+            if archivo_perfil:
+                self.scheduler.perfilador.exportar(archivo_perfil)
+                print(f"📁 Perfil exportado a: {archivo_perfil}")
 
 # ==================== EJECUCIÓN ====================
 if __name__ == "__main__":
     import argparse
     
     parser = argparse.ArgumentParser(description='Gemelo Digital SCE')
-    parser.add_argument('-t', '--tiempo', type=int, default=60, 
+    parser.add_argument('-t', '--tiempo', type=int, default=60,
                         help='Duración de la simulación en segundos (default: 60)')
+    parser.add_argument('-m', '--modo', default='scaled:10',
+                        help="Modo de ejecución: realtime, scaled:<factor> o "
+                             "as-fast-as-possible (default: scaled:10)")
+    parser.add_argument('--intervalo-log', type=float, default=1.0,
+                        help='Segundos simulados entre líneas de estado en tiempo real (default: 1.0)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Mostrar también los mensajes de depuración (publicaciones MQTT)')
+    parser.add_argument('--filtro-nivel', default='promedio:5',
+                        help="Filtro del nivel: ninguno, promedio:N, exponencial:ALFA, mediana:N, "
+                             "kalman:Q:R o una cadena con '+' (default: promedio:5)")
+    parser.add_argument('--sin-estimador', action='store_true',
+                        help='Controlar y guardar el nivel filtrado en lugar del estimado (Kalman)')
+    parser.add_argument('--perfil', nargs='?', const=ARCHIVO_PERFIL, default=None,
+                        metavar='ARCHIVO',
+                        help='Medir tiempos del planificador y exportarlos a ARCHIVO .json o .csv '
+                             '(default: datos/perfil_planificador.json, lo lee el dashboard)')
+    parser.add_argument('--plan', action='store_true',
+                        help='Muestra la tabla de frames y la verificación de planificabilidad y sale')
+    parser.add_argument('--overrun', choices=POLITICAS_OVERRUN, default='recuperar',
+                        help='Ante un frame atrasado: recuperar (liberar los atrasados seguidos) '
+                             'o saltar (esperar el próximo plazo) (default: recuperar)')
+    parser.add_argument('--spin', type=float, default=1.0,
+                        help='Margen de espera activa antes de cada plazo, en ms (default: 1.0)')
+    parser.add_argument('--async', dest='asincrono', action='store_true',
+                        help='Modo asyncio: almacenamiento y comunicación fuera del frame, con colas acotadas')
+    parser.add_argument('--cola-almacenamiento', type=int, default=1000,
+                        help='Capacidad de la cola de almacenamiento en modo --async (default: 1000)')
+    parser.add_argument('--politica-almacenamiento', choices=POLITICAS_COLA, default='bloquear',
+                        help='Política con la cola de almacenamiento llena (default: bloquear)')
+    parser.add_argument('--politica-comunicacion', choices=POLITICAS_COLA, default='fusionar',
+                        help='Política con la cola de comunicación llena (default: fusionar)')
+    parser.add_argument('--latencia-red', type=float, default=0.0,
+                        help='Latencia simulada de cada publicación, en ms (default: 0)')
+    parser.add_argument('--filtro-temperatura', default='ninguno',
+                        help='Filtro de la temperatura (default: ninguno)')
+    parser.add_argument('--filtro-presion', default='ninguno',
+                        help='Filtro de la presión (default: ninguno)')
     args = parser.parse_args()
-    
-    sistema = SistemaGemeloDigital()
-    sistema.ejecutar(duracion_segundos=args.tiempo)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(message)s')
+
+    if args.plan:
+        try:
+            print(PlanificadorCiclico(factor_tiempo=parsear_modo_ejecucion(args.modo)).describir())
+        except ValueError as e:
+            parser.error(str(e))
+        sys.exit(0)
+    # Antes de construir el sistema: la construcción ya abre y migra la base
+    if args.perfil and os.path.splitext(args.perfil)[1].lower() not in ('.json', '.csv'):
+        parser.error(f"❌ Formato de exportación no soportado: {args.perfil} (use .json o .csv)")
+
+    try:
+        sistema = SistemaGemeloDigital(modo=args.modo, filtros={
+            'filtro_nivel': args.filtro_nivel,
+            'filtro_temperatura': args.filtro_temperatura,
+            'filtro_presion': args.filtro_presion,
+        }, usar_estimador=not args.sin_estimador, perfilar=args.perfil is not None,
+            politica_overrun=args.overrun, spin_s=args.spin / 1000, latencia_red_s=args.latencia_red / 1000,
+            pipeline_es=PipelineES(args.cola_almacenamiento, args.politica_almacenamiento,
+                                   politica_comunicacion=args.politica_comunicacion) if args.asincrono else None)
+    except ValueError as e:
+        parser.error(str(e))
+    sistema.ejecutar(duracion_segundos=args.tiempo, intervalo_log=args.intervalo_log,
+                     archivo_perfil=args.perfil)
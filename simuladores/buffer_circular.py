@@ -0,0 +1,86 @@
+"""
+Buffer Circular sobre NumPy
+Historias de tamaño fijo con inserción O(1) y vistas ordenadas sin copia.
+
+Cada valor se escribe dos veces (en i y en i + capacidad) sobre un array
+de 2*capacidad filas, así los últimos n valores siempre forman un tramo
+contiguo y se pueden devolver como una vista, sin np.roll ni concatenar.
+"""
+import numpy as np
+
+class BufferCircular:
+    """
+    Buffer circular preasignado
+    - Sin 'campos': un valor escalar por entrada
+    - Con 'campos': una fila por entrada y una columna por campo
+      (vista('nivel') devuelve solo esa columna)
+    """
+    def __init__(self, capacidad, campos=None, dtype=np.float64):
+        if capacidad < 1:
+            raise ValueError(f"❌ Capacidad inválida: {capacidad}")
+        self.capacidad = capacidad
+        self.campos = tuple(campos) if campos else None
+        forma = (2 * capacidad, len(self.campos)) if self.campos else (2 * capacidad,)
+        self._datos = np.zeros(forma, dtype=dtype)
+        self._indice = {campo: j for j, campo in enumerate(self.campos or ())}
+        self.limpiar()
+
+    def limpiar(self):
+        """Vacía el buffer (sin liberar memoria)"""
+        self._pos = 0  # próxima posición de escritura, en [0, capacidad)
+        self._n = 0  # entradas válidas
+        self.total = 0  # entradas agregadas desde el último limpiar()
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def lleno(self):
+        return self._n == self.capacidad
+
+    def agregar(self, valor):
+        """Agrega una entrada (escalar, o una fila con un valor por campo)"""
+        self._datos[self._pos] = valor
+        self._datos[self._pos + self.capacidad] = valor
+        self._pos = (self._pos + 1) % self.capacidad
+        self._n = min(self._n + 1, self.capacidad)
+        self.total += 1
+
+    def extender(self, valores):
+        """Agrega varias entradas de una vez (solo se conservan las últimas 'capacidad')"""
+        valores = np.asarray(valores, dtype=self._datos.dtype)
+        if len(valores) == 0:
+            return
+        self.total += len(valores)
+        if len(valores) > self.capacidad:
+            valores = valores[-self.capacidad:]
+        n = len(valores)
+        posiciones = (self._pos + np.arange(n)) % self.capacidad
+        self._datos[posiciones] = valores
+        self._datos[posiciones + self.capacidad] = valores
+        self._pos = (self._pos + n) % self.capacidad
+        self._n = min(self._n + n, self.capacidad)
+
+    def vista(self, campo=None):
+        """
+        Contenido en orden cronológico como vista de solo lectura (sin copia)
+        La vista refleja escrituras posteriores: copiarla si debe conservarse.
+        """
+        inicio = (self._pos - self._n) % self.capacidad
+        datos = self._datos[inicio:inicio + self._n]
+        if campo is not None:
+            datos = datos[:, self._indice[campo]]
+        datos = datos.view()
+        datos.flags.writeable = False
+        return datos
+
+    def ultimo(self, campo=None):
+        """Entrada más reciente"""
+        if self._n == 0:
+            raise IndexError("❌ Buffer vacío")
+        fila = self._datos[(self._pos - 1) % self.capacidad]
+        return fila if campo is None else fila[self._indice[campo]]
+
+    def indices(self):
+        """Número de muestra (desde el último limpiar()) de cada entrada de vista()"""
+        return np.arange(self.total - self._n, self.total)
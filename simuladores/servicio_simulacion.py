@@ -0,0 +1,169 @@
+"""
+Servicio de Simulación Compartido
+Un único gemelo (tanque + sensores) por proceso que avanza en un hilo de
+fondo con su propio reloj y publica instantáneas en un buffer circular.
+Las sesiones del dashboard solo leen: el costo de CPU no depende de
+cuántos usuarios estén mirando y todos ven el mismo estado.
+"""
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from simuladores.simulador_tanque import TanqueSimulado, SensorUltrasonico, SensorAmbiental
+from simuladores.buffer_circular import BufferCircular
+
+# Estado publicado en cada paso (inmutable, se puede leer sin bloqueo)
+Instantanea = namedtuple('Instantanea', [
+    'paso', 't', 'nivel', 'nivel_medido', 'temperatura', 'presion',
+    'caudal_entrada', 'caudal_salida', 'valvula_entrada', 'bomba_salida',
+])
+# Campos numéricos que se guardan en la historia
+CAMPOS_HISTORIA = ('paso', 't', 'nivel', 'nivel_medido', 'temperatura', 'presion')
+
+class ServicioSimulacion:
+    """
+    Simulación física compartida
+    - Un hilo daemon avanza dt segundos simulados cada dt/escala segundos reales
+    - Cada paso publica una Instantanea en un buffer de 'capacidad' entradas
+    - Los cambios de parámetros (caudales, válvulas, geometría) se aplican
+      entre pasos, con el mismo lock que protege al buffer
+    """
+    def __init__(self, altura_max=200, diametro=100, dt=0.5, escala=1.0, capacidad=100):
+        self.dt = dt  # s simulados por paso
+        self.escala = escala  # s simulados por s real
+        self.capacidad = capacidad
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+
+        self.tanque = TanqueSimulado(altura_max=altura_max, diametro=diametro)
+        # Latencia virtual: el paso corre con el lock tomado y no debe dormir
+        # (bloquearía a todas las sesiones que leen instantáneas)
+        self.sensor_us = SensorUltrasonico(altura_instalacion=altura_max, modo_latencia='virtual')
+        self.sensor_amb = SensorAmbiental()
+        self.activa = False
+        self._historia = BufferCircular(capacidad, campos=CAMPOS_HISTORIA)
+        self._reiniciar_historia()
+
+        self._hilo = threading.Thread(target=self._bucle, name="servicio-simulacion", daemon=True)
+        self._hilo.start()
+
+    def _reiniciar_historia(self):
+        self.contador = 0
+        self._historia.limpiar()
+        self._ultima = self._instantanea(self.tanque.nivel_actual,
+                                         self.sensor_amb.temp_base, self.sensor_amb.presion_base)
+
+    def _instantanea(self, nivel_medido, temperatura, presion):
+        return Instantanea(
+            paso=self.contador,
+            t=self.contador * self.dt,
+            nivel=float(self.tanque.nivel_actual),
+            nivel_medido=float(nivel_medido),
+            temperatura=float(temperatura),
+            presion=float(presion),
+            caudal_entrada=self.tanque.Q_in,
+            caudal_salida=self.tanque.Q_out,
+            valvula_entrada=self.tanque.valvula_entrada,
+            bomba_salida=self.tanque.bomba_salida,
+        )
+
+    def _bucle(self):
+        """Reloj propio: plazos absolutos para no acumular deriva"""
+        siguiente = time.monotonic()
+        while not self._detener.is_set():
+            siguiente += self.dt / self.escala
+            if self.activa:
+                self.paso()
+            self._detener.wait(max(0.0, siguiente - time.monotonic()))
+
+    def paso(self):
+        """Avanza un paso de simulación y publica la instantánea"""
+        with self._lock:
+            self.tanque.actualizar(dt=self.dt)
+            temp, presion = self.sensor_amb.leer()
+            distancia = self.sensor_us.medir_distancia(self.tanque.nivel_actual, temp, presion)
+            self.contador += 1
+            self._ultima = self._instantanea(self.tanque.H_max - distancia, temp, presion)
+            self._historia.agregar([getattr(self._ultima, campo) for campo in CAMPOS_HISTORIA])
+            return self._ultima
+
+    # ==================== CONTROL ====================
+    def configurar(self, altura_max=None, diametro=None, caudal_entrada=None, caudal_salida=None,
+                   valvula_entrada=None, bomba_salida=None):
+        """Actualiza los parámetros indicados (None = sin cambios)"""
+        with self._lock:
+            if altura_max is not None:
+                self.tanque.H_max = altura_max
+                self.sensor_us.H = altura_max
+            if diametro is not None:
+                self.tanque.diametro = diametro
+                self.tanque.area = np.pi * (diametro/2)**2
+            if caudal_entrada is not None:
+                self.tanque.Q_in = caudal_entrada
+            if caudal_salida is not None:
+                self.tanque.Q_out = caudal_salida
+            if valvula_entrada is not None:
+                self.tanque.set_valvula_entrada(valvula_entrada)
+            if bomba_salida is not None:
+                self.tanque.set_bomba_salida(bomba_salida)
+
+    def configuracion(self):
+        """Parámetros actuales (con los nombres de configurar)"""
+        with self._lock:
+            return {
+                'altura_max': self.tanque.H_max,
+                'diametro': self.tanque.diametro,
+                'caudal_entrada': self.tanque.Q_in,
+                'caudal_salida': self.tanque.Q_out,
+                'valvula_entrada': self.tanque.valvula_entrada,
+                'bomba_salida': self.tanque.bomba_salida,
+            }
+
+    def iniciar(self):
+        self.activa = True
+
+    def pausar(self):
+        self.activa = False
+
+    def reiniciar(self, nivel_inicial=50):
+        """Detiene la simulación, vuelve al nivel inicial y vacía la historia"""
+        with self._lock:
+            self.activa = False
+            self.tanque.nivel_actual = nivel_inicial
+            self._reiniciar_historia()
+
+    def detener(self):
+        """Termina el hilo de fondo"""
+        self._detener.set()
+        self._hilo.join()
+
+    # ==================== LECTURA ====================
+    def ultima(self):
+        """Instantánea más reciente"""
+        return self._ultima
+
+    def historia(self):
+        """
+        Copia de la historia como arrays por campo (orden cronológico)
+        Se copia bajo el lock porque el hilo de fondo sigue escribiendo.
+        """
+        with self._lock:
+            return {campo: self._historia.vista(campo).copy() for campo in CAMPOS_HISTORIA}
+
+# ==================== PRUEBA RÁPIDA ====================
+if __name__ == "__main__":
+    print("🧪 Prueba del servicio de simulación (escala x20)...")
+    servicio = ServicioSimulacion(dt=0.5, escala=20)
+    servicio.configurar(caudal_entrada=60, valvula_entrada=True)
+    servicio.iniciar()
+    time.sleep(1.0)
+    servicio.pausar()
+    ultima = servicio.ultima()
+    print(f"Pasos: {ultima.paso} | t simulado: {ultima.t:.1f} s | Nivel: {ultima.nivel:.2f} cm")
+    servicio.detener()
+    print("✅ Prueba completada")
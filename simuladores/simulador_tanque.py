@@ -47,14 +47,128 @@ class TanqueSimulado:
         """Encender/apagar bomba de salida"""
         self.bomba_salida = estado
 
+class FlotaTanques:
+    """
+    Simula N tanques a la vez con arrays de NumPy (una fila por tanque)
+    Misma ecuación que TanqueSimulado: dh/dt = (Q_in - Q_out) / Area
+    """
+    def __init__(self, n_tanques, altura_max=200, diametro=100, caudal_entrada=5, caudal_salida=3,
+                 nivel_inicial=50):
+        forma = (n_tanques,)
+        self.n_tanques = n_tanques
+        self.H_max = np.broadcast_to(np.asarray(altura_max, dtype=float), forma).copy()  # cm
+        self.diametro = np.broadcast_to(np.asarray(diametro, dtype=float), forma).copy()  # cm
+        self.area = np.pi * (self.diametro/2)**2  # cm²
+        self.nivel_actual = np.broadcast_to(np.asarray(nivel_inicial, dtype=float), forma).copy()  # cm
+        self.Q_in = np.broadcast_to(np.asarray(caudal_entrada, dtype=float), forma).copy()  # L/min
+        self.Q_out = np.broadcast_to(np.asarray(caudal_salida, dtype=float), forma).copy()  # L/min
+        self.valvula_entrada = np.ones(n_tanques, dtype=bool)
+        self.bomba_salida = np.zeros(n_tanques, dtype=bool)
+
+    @classmethod
+    def desde_tanques(cls, tanques):
+        """Construye la flota copiando el estado de una lista de TanqueSimulado"""
+        flota = cls(
+            len(tanques),
+            altura_max=[t.H_max for t in tanques],
+            diametro=[t.diametro for t in tanques],
+            caudal_entrada=[t.Q_in for t in tanques],
+            caudal_salida=[t.Q_out for t in tanques],
+            nivel_inicial=[t.nivel_actual for t in tanques],
+        )
+        # Respetar el área del tanque aunque se haya modificado a mano
+        flota.area = np.array([t.area for t in tanques], dtype=float)
+        flota.valvula_entrada = np.array([t.valvula_entrada for t in tanques], dtype=bool)
+        flota.bomba_salida = np.array([t.bomba_salida for t in tanques], dtype=bool)
+        return flota
+
+    def _caudales_cm3s(self):
+        """Caudales efectivos (cm³/s) de cada tanque según válvulas y bombas"""
+        q_in = np.where(self.valvula_entrada, self.Q_in * 1000 / 60, 0)  # cm³/s
+        q_out = np.where(self.bomba_salida, self.Q_out * 1000 / 60, 0)  # cm³/s
+        return q_in, q_out
+
+    def actualizar(self, dt=1.0):
+        """
+        Avanza un paso todos los tanques
+        dt en segundos
+        """
+        q_in, q_out = self._caudales_cm3s()
+        dh = ((q_in - q_out) / self.area) * dt
+        self.nivel_actual = np.clip(self.nivel_actual + dh, 0, self.H_max)
+        return self.nivel_actual
+
+    def simular(self, pasos, dt=1.0):
+        """
+        Avanza K pasos con válvulas/bombas fijas
+        Retorna la trayectoria de niveles con forma (N, K)
+        """
+        q_in, q_out = self._caudales_cm3s()
+        dh = ((q_in - q_out) / self.area) * dt
+
+        trayectoria = np.empty((self.n_tanques, pasos))
+        nivel = self.nivel_actual.copy()
+        for k in range(pasos):
+            # El recorte es no lineal: hay que integrar paso a paso en el tiempo,
+            # pero cada paso opera sobre los N tanques a la vez
+            nivel += dh
+            np.clip(nivel, 0, self.H_max, out=nivel)
+            trayectoria[:, k] = nivel
+
+        self.nivel_actual = nivel
+        return trayectoria
+
+    def set_valvula_entrada(self, estado, indices=None):
+        """Abrir/cerrar válvulas de entrada (todas o solo las indicadas)"""
+        if indices is None:
+            self.valvula_entrada[:] = estado
+        else:
+            self.valvula_entrada[indices] = estado
+
+    def set_bomba_salida(self, estado, indices=None):
+        """Encender/apagar bombas de salida (todas o solo las indicadas)"""
+        if indices is None:
+            self.bomba_salida[:] = estado
+        else:
+            self.bomba_salida[indices] = estado
+
 class SensorUltrasonico:
     """
     Simula sensor JSN-SR04T con ruido y errores
+
+    Modos de latencia:
+    - 'real': bloquea con time.sleep (comportamiento original)
+    - 'virtual': no bloquea; la latencia se acumula en tiempo_virtual
+    - 'ninguna': sin latencia
+
+    Con 'velocidad_nominal' (m/s) la distancia se reporta como lo hace el
+    módulo real: ToF * v_nominal / 2, sin compensar la temperatura. El
+    fusionador debe corregirla con la velocidad real del sonido.
     """
-    def __init__(self, altura_instalacion=200):
+    MODOS_LATENCIA = ('real', 'virtual', 'ninguna')
+
+    def __init__(self, altura_instalacion=200, modo_latencia='real', latencia=0.001, semilla=None,
+                 velocidad_nominal=None):
+        if modo_latencia not in self.MODOS_LATENCIA:
+            raise ValueError(f"❌ Modo de latencia inválido: {modo_latencia} "
+                             f"(opciones: {', '.join(self.MODOS_LATENCIA)})")
         self.H = altura_instalacion  # Altura donde está instalado (cm)
         self.error_std = 0.5  # Desviación estándar del ruido (cm)
-        
+        self.prob_erratica = 0.05  # Probabilidad de lectura errática
+        self.amplitud_erratica = 10  # Desvío máximo de una lectura errática (cm)
+        self.modo_latencia = modo_latencia
+        self.latencia = latencia  # s por medición
+        self.tiempo_virtual = 0.0  # s acumulados en modo 'virtual'
+        self.rng = np.random.default_rng(semilla)
+        self.velocidad_nominal = velocidad_nominal  # m/s (None = distancia ya compensada)
+
+    def _esperar_latencia(self):
+        """Aplica la latencia del sensor según el modo configurado"""
+        if self.modo_latencia == 'real':
+            time.sleep(self.latencia)
+        elif self.modo_latencia == 'virtual':
+            self.tiempo_virtual += self.latencia
+
     def medir_distancia(self, nivel_real, temperatura=20, presion=1013):
         """
         Simula medición con ToF (Time of Flight)
@@ -69,18 +183,45 @@ class SensorUltrasonico:
         tof_teorico = (2 * distancia_real / 100) / v_sonido  # segundos
         
         # Agregar ruido gaussiano
-        ruido = np.random.normal(0, self.error_std)
+        ruido = self.rng.normal(0, self.error_std)
         distancia_medida = distancia_real + ruido
-        
+
         # Lecturas erráticas ocasionales (5% probabilidad)
-        if np.random.random() < 0.05:
-            distancia_medida += np.random.uniform(-10, 10)
-        
+        if self.rng.random() < self.prob_erratica:
+            distancia_medida += self.rng.uniform(-self.amplitud_erratica, self.amplitud_erratica)
+
+        # Distancia calculada por el módulo con la velocidad nominal
+        if self.velocidad_nominal is not None:
+            distancia_medida *= self.velocidad_nominal / v_sonido
+
         # Simular delay del sensor (40 kHz, ~25ms típico)
-        time.sleep(0.001)  # 1ms
-            
+        self._esperar_latencia()
+
         return max(0, min(distancia_medida, self.H))
 
+    def medir_distancias(self, niveles, temperaturas=20, presiones=1013):
+        """
+        Versión por lotes de medir_distancia: una medición por nivel
+        Todo el ruido (gaussiano y erráticas) se genera en una sola pasada
+        vectorizada. Las mediciones se consideran simultáneas, por lo que
+        la latencia se aplica una sola vez por lote.
+        """
+        niveles = np.asarray(niveles, dtype=float)
+        distancia_real = self.H - niveles
+
+        ruido = self.rng.normal(0, self.error_std, size=niveles.shape)
+        erraticas = self.rng.random(niveles.shape) < self.prob_erratica
+        desvio = self.rng.uniform(-self.amplitud_erratica, self.amplitud_erratica, size=niveles.shape)
+        distancia_medida = distancia_real + ruido + np.where(erraticas, desvio, 0)
+
+        if self.velocidad_nominal is not None:
+            v_sonido = 331.3 + 0.606 * np.asarray(temperaturas, dtype=float)  # m/s
+            distancia_medida = distancia_medida * (self.velocidad_nominal / v_sonido)
+
+        self._esperar_latencia()
+
+        return np.clip(distancia_medida, 0, self.H)
+
 class SensorAmbiental:
     """
     Simula sensor BME280 (temperatura y presión)